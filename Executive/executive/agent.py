@@ -66,6 +66,8 @@ import numpy
 import pandas
 from SunDialResource import SundialSystemResource, SundialResource, SundialResourceProfile, build_SundialResource_to_SiteManager_lookup_table
 from SSA_Optimization import SimulatedAnnealer
+from DP_Optimization import DPOptimizer
+from OptimizerWorker import OptimizerWorker, run_optimizer_pass
 import GeneratePriceMap
 import pandas as pd
 from pprint import pformat
@@ -218,6 +220,11 @@ class ExecutiveAgent(Agent):
 
         self.last_forecast_start   = datetime(1900, 1, 1, tzinfo=pytz.UTC)
 
+        self.price_map_cache = GeneratePriceMap.PriceMapCache()  # reuses price maps across generate_cost_map calls
+
+        # optimizer worker process (see start_optimizer_worker) - None when no optimization pass is in progress
+        self.optimizer_worker      = None
+        self.optimizer_search_load_shift = False
 
         self.init_tariffs()
 
@@ -337,7 +344,10 @@ class ExecutiveAgent(Agent):
                                                                                         use_volttron=1)
         for entries in self.sdr_to_sm_lookup_table:
             _log.info("Setup: SundialResource Init: "+entries.sundial_resource.resource_id + ":" + str(entries.device_list))
-        self.optimizer = SimulatedAnnealer()
+        if OPTIMIZER == "DP":
+            self.optimizer = DPOptimizer()
+        else:
+            self.optimizer = SimulatedAnnealer()
 
         ### This section retrieves direct references to specific resource types (avoids the need to traverse tree)
         # There is an implicit assumption that there is only one SundialResource node per resource type.  (i.e. we are
@@ -510,11 +520,33 @@ class ExecutiveAgent(Agent):
     def update_sundial_resources(self, sdr_to_sm_lookup_table, update_forecasts = False):
         """
         This method updates the sundial resource data structure with the most recvent data from SiteManager
-        agents.
+        agents.  State vars for all devices are retrieved with one get_all_device_state_vars call per SiteManager
+        agent.
         :param sdr_to_sm_lookup_table: maps DERDevice instances to SundialResource instances.  This is an object of
         type SundialResource_to_SiteManager_lookup_table
         :return: None
         """
+        # first, gather the devices and keys needed from each SiteManager agent
+        requests = {}
+        for entries in sdr_to_sm_lookup_table:
+            if update_forecasts == False:
+                update_list = entries.sundial_resource.end_pt_update_list
+            else:
+                update_list = entries.sundial_resource.forecast_update_list
+            for devices in entries.device_list:
+                if devices["isAvailable"] == 1:
+                    device_ids, keys = requests.setdefault(str(devices["AgentID"]), ([], []))
+                    if devices["DeviceID"] not in device_ids:
+                        device_ids.append(devices["DeviceID"])
+                    keys.extend([k for k in update_list if k not in keys])
+
+        dev_state_vars = {}
+        for agent_id, (device_ids, keys) in requests.items():
+            dev_state_vars[agent_id] = self.vip.rpc.call(agent_id,
+                                                         "get_all_device_state_vars",
+                                                         device_ids,
+                                                         keys).get(timeout=5)
+
         for entries in sdr_to_sm_lookup_table:
             # for each SundialResource that maps to an end point device (i.e., terminal nodes in the
             # the resource tree)
@@ -530,9 +562,7 @@ class ExecutiveAgent(Agent):
                     _log.debug("UpdateSDR: "+entries.sundial_resource.resource_id+": SM Device ="+devices["DeviceID"]+"; k="+str(k)+"; agent="+str(devices["AgentID"]))
                     if devices["isAvailable"] == 1:
                         try:
-                            dev_state_var = self.vip.rpc.call(str(devices["AgentID"]),
-                                                              "get_device_state_vars",
-                                                              devices["DeviceID"]).get(timeout=5)
+                            dev_state_var = dev_state_vars[str(devices["AgentID"])][devices["DeviceID"]]
                             _log.info(devices["AgentID"]+"-"+devices["DeviceID"]+" - "+str(k) + ": " + str(dev_state_var[k]))
                             entries.sundial_resource.state_vars[k] = dev_state_var[k]
 
@@ -541,6 +571,9 @@ class ExecutiveAgent(Agent):
         if update_forecasts == False:
             self.sundial_resources.update_sundial_resource()  # propagates new data to non-terminal nodes
             self.update_tariffs()
+        else:
+            for entries in sdr_to_sm_lookup_table:
+                entries.sundial_resource.update_forecast_epochs()  # parses new forecast timestamps once
 
 
 
@@ -571,6 +604,8 @@ class ExecutiveAgent(Agent):
         Then, for each time step and demand step within the search space, it calculates marignal cost of electricity
         within that bin
         Once the matrix is generated, demand tiers are culled to identify tiers where change in demand occurs.
+        The map is cached (see GeneratePriceMap.PriceMapCache) - only time steps whose forecasts have changed
+        since the last call are recomputed.
         :param n_time_steps: number of time steps in the search space
         :param search_resolution: size of the demand tiers for initial search, in kW
         :return: tiers - list of lists of dictionary - each entry is defines price as a function of demand LB/UB and time
@@ -585,14 +620,13 @@ class ExecutiveAgent(Agent):
             schedule_timestamps = self.generate_schedule_timestamps()
 
         self.sundial_resources.interpolate_forecast(schedule_timestamps)
-        self.sundial_resources.cfg_cost(schedule_timestamps,
-                                        system_tariff=self.tariffs)
 
-
-        return GeneratePriceMap.generate_cost_map(self.sundial_resources,
-                                                  self.pv_resources,
-                                                  n_time_steps,
-                                                  search_resolution)
+        return self.price_map_cache.get_cost_map(self.sundial_resources,
+                                                 self.pv_resources,
+                                                 schedule_timestamps,
+                                                 self.tariffs,
+                                                 n_time_steps,
+                                                 search_resolution)
 
     ##############################################################################
     def find_current_timestamp_index(self):
@@ -836,9 +870,15 @@ class ExecutiveAgent(Agent):
         runs optimizer on specified schedule
         assumes that self.sundial_resources has up to date information from end point
         devices.
+        If OPTIMIZER_WORKER is True and a pass is still running in the worker process, this pass is skipped, before
+        any optimizer state (e.g., last_forecast_start, persist_lowest_cost) is updated.
         :return: None
         """
 
+        if (OPTIMIZER_WORKER == True) and (self.optimizer_worker is not None):
+            _log.info("Optimizer: previous optimization pass still running - skipping this pass")
+            return
+
         if self.OptimizerEnable == ENABLED:
             # check to make sure that resources have been updated
             # if they have not - ... - request an update and go into a waiting state.
@@ -882,33 +922,102 @@ class ExecutiveAgent(Agent):
 
                 self.last_forecast_start = forecast_start
 
-                ## queue up time-differentiated cost data
-                _log.info("THESE ARE THE TARIFFS: {}".format(self.tariffs))
-                self.sundial_resources.cfg_cost(schedule_timestamps,
-                                                tariffs = self.tariffs)
-                                                # system_tariff = self.tariffs)
-
                 ## generate a cost map - for testing
                 #tiers = self.generate_cost_map()
                 #_log.info(json.dumps(tiers))
 
-                if SEARCH_LOADSHIFT_OPTIONS == True:
-                    if self.loadshift_resources.state_vars["OptionsPending"] == 1:
-                        _log.info("*** New Optimization Pass: New load options pending - Search Multiple!! ****")
-                        self.optimizer.search_load_shift_options(self.sundial_resources,
-                                                                 self.loadshift_resources,
-                                                                 schedule_timestamps) # SSA optimization - search load shift space
-                        self.send_loadshift_commands()
-                    else:
-                        _log.info("*** New Optimization Pass: No New load options pending! ****")
-                        self.optimizer.search_single_option(self.sundial_resources,
-                                                            schedule_timestamps)  # SSA optimization - single pass
+                # make sure that the optimizer finishes within its GS_SCHEDULE slot
+                self.optimizer.deadline = datetime.utcnow() + timedelta(seconds=SSA_TIME_BUDGET)
+
+                search_load_shift = ((SEARCH_LOADSHIFT_OPTIONS == True) and
+                                     (self.loadshift_resources.state_vars["OptionsPending"] == 1))
+
+                if OPTIMIZER_WORKER == True:
+                    self.start_optimizer_worker(schedule_timestamps, search_load_shift)
                 else:
-                    _log.info("*** New Optimization Pass: Load Shift disabled! ****")
-                    self.optimizer.search_single_option(self.sundial_resources,
-                                                        schedule_timestamps)  # SSA optimization - single pass
-                self.publish_schedules()
-                self.send_ess_commands()
+                    run_optimizer_pass(self.optimizer,
+                                       self.sundial_resources,
+                                       self.tariffs,
+                                       schedule_timestamps,
+                                       search_load_shift)
+                    self.dispatch_schedules(search_load_shift)
+
+    ##############################################################################
+    def start_optimizer_worker(self, schedule_timestamps, search_load_shift):
+        """
+        Launches an optimization pass in a worker process, so that the executive loop (ESS regulation, site status
+        polling, heartbeats) keeps running while the optimizer runs.  The worker is a new python interpreter (see
+        OptimizerWorker) - it does not inherit the agent's gevent hub or ZMQ sockets.  It receives a snapshot of
+        the optimizer, the tariffs, and each resource's state_vars, schedule_vars and objective function parameters,
+        and rebuilds the sundial resource tree from self.sundial_resource_cfg_list, so changes made here while it runs
+        do not affect the pass.  Results are collected by check_optimizer_worker.  Must not be called while a pass is in progress (see run_optimizer).
+        :param schedule_timestamps: list of timestamps (length = SSA_PTS_PER_SCHEDULE)
+        :param search_load_shift: True = search all load shift options; False = search a single option
+        :return: None
+        """
+        try:
+            self.optimizer_worker = OptimizerWorker(self.sundial_resource_cfg_list,
+                                                    self.get_gs_start_time(),
+                                                    self.sundial_resources,
+                                                    self.optimizer,
+                                                    self.tariffs,
+                                                    schedule_timestamps,
+                                                    search_load_shift)
+        except (IOError, OSError) as e:
+            _log.error("Optimizer: unable to start worker process - "+str(e))
+            self.optimizer_worker = None
+            return
+        self.optimizer_search_load_shift = search_load_shift
+        _log.info("Optimizer: started optimization pass in worker process "+str(self.optimizer_worker.pid))
+
+    ##############################################################################
+    def check_optimizer_worker(self):
+        """
+        Polls the optimizer worker process (see start_optimizer_worker) without blocking.  When a pass has finished,
+        installs the new schedules into the sundial resource tree and dispatches them (see dispatch_schedules).
+        Schedules are replaced without yielding to other greenlets, so the rest of the executive never sees a
+        partially installed schedule.
+        :return: None
+        """
+        if (self.optimizer_worker is None) or (self.optimizer_worker.poll() == False):
+            return  # no pass in progress, or still running
+
+        result = self.optimizer_worker.get_result()
+        _log.info("Optimizer: worker process "+str(self.optimizer_worker.pid)+" finished")
+        self.optimizer_worker = None
+
+        if result is None:
+            _log.error("Optimizer: optimization pass failed - keeping previous schedule")
+        elif self.OptimizerEnable != ENABLED:
+            _log.info("Optimizer: optimizer disabled - discarding schedule")
+        else:
+            (schedules, self.optimizer.stop_reason, self.optimizer.n_iterations_used) = result
+            for resource_id, schedule_vars in schedules.items():
+                self.sundial_resources.find_resource(resource_id).schedule_vars = schedule_vars
+            _log.info("Optimizer: installed new schedule; stop reason = "+str(self.optimizer.stop_reason))
+            self.dispatch_schedules(self.optimizer_search_load_shift)
+
+    ##############################################################################
+    def stop_optimizer_worker(self):
+        """
+        Terminates the optimizer worker process, if one is running, and discards its results
+        :return: None
+        """
+        if self.optimizer_worker is not None:
+            self.optimizer_worker.terminate()
+            self.optimizer_worker = None
+
+    ##############################################################################
+    def dispatch_schedules(self, search_load_shift):
+        """
+        sends the results of an optimization pass to the rest of the system
+        :param search_load_shift: True if the pass searched load shift options
+        :return: None
+        """
+        if search_load_shift == True:
+            self.send_loadshift_commands()
+        self.publish_schedules()
+        self.send_ess_commands()
 
     ##############################################################################
     def publish_schedules(self):
@@ -1087,6 +1196,9 @@ class ExecutiveAgent(Agent):
         # Wait until initialization has completed before checking on sites
         if self.OperatingMode != EXEC_STARTING:
 
+            # install results from the optimizer worker process, if a pass has finished
+            self.check_optimizer_worker()
+
             if self.data_log_cnt == DATA_LOG_SCHEDULE:
                 self.data_log_cnt = 1
                 self.check_site_statuses()
@@ -1131,6 +1243,7 @@ class ExecutiveAgent(Agent):
                 # change sites to AUTO mode
                 self.disable_site_interactive_mode()
                 self.OptimizerEnable = DISABLED # shut down optimizer
+                self.stop_optimizer_worker()
                 self.UICtrlEnable = DISABLED # placeholder
             elif self.OperatingMode == APPLICATION_CONTROL:
                 # change sites to interactive mode
@@ -1168,6 +1281,7 @@ class ExecutiveAgent(Agent):
         :param kwargs:
         :return:
         """
+        self.stop_optimizer_worker()
         for site in self.sitemgr_list:
             self.vip.rpc.call(CONTROL, "remove_agent", site["uuid"]).get(timeout=5)
 
@@ -4,6 +4,7 @@ import sys
 sys.path.insert(0, '../../GS_Optimizer/')
 # from SundialResource import ESSResource
 from SunDialResource import ESSResource
+from SOEProjection import project_soe
 # from GS_Optimizer.SundialResource import ESSResource
 
 _log = logging.getLogger(__name__)
@@ -57,38 +58,34 @@ class BatterySim(ESSResource):
             _log.info("DISCHARGING")
             # convert percent to kW
             kw_request = self.MaxDischargePwr_kW * power_request
-            _log.info("Request of %s is %s kW",
-                      str(power_request*100) + "%",
-                      kw_request)
-            soe_preliminary_request = self.SOE_kWh + kw_request / self.DischgEff
-            # need to adjust kw_request to a level that won't exceed SOE constraint
-            soe_request = max(soe_preliminary_request, self.MinSOE_kWh)
-            if soe_request == self.MinSOE_kWh:
-                _log.info("Insufficient capacity for discharge of: %s//%s",
-                          power_request,
-                          kw_request)
-                soe_request = (self.MinSOE_kWh - soe_request) * self.DischgEff
         elif (0 <= power_request) & (power_request <= 1):
             _log.info("CHARGING")
             kw_request = self.MaxChargePwr_kW * power_request
-            _log.info("Request of %s is %s kW",
-                      str(power_request*100) + "%",
-                      kw_request)
-            soe_preliminary_request = self.SOE_kWh + kw_request * self.ChgEff
-            # don't exceed max SOE
-            soe_request = min(soe_preliminary_request, self.MaxSOE_kWh)
-            # need to adjust pwr to a level that won't exceed SOE contraint
-            if soe_request == self.MaxSOE_kWh:
-                _log.info("Insufficient capacity for charge of: %s/%s kW",
-                          str(power_request*100) + "%",
-                          kw_request)
-                soe_request = (self.MaxSOE_kWh - soe_request) / self.ChgEff
         else:
             _log.warn("Battery has been asked to (dis)charge with a higher power than is possible.")
-            pwr = self.Pwr_kW
+            return None
+        _log.info("Request of %s is %s kW",
+                  str(power_request*100) + "%",
+                  kw_request)
+
+        # adjust kw_request to a level that won't exceed the SOE constraints, over a one hour time step
+        pwr_cmd, energy, delta_energy = project_soe([kw_request],
+                                                    self.SOE_kWh,
+                                                    self.MaxSOE_kWh,
+                                                    self.MinSOE_kWh,
+                                                    self.MaxChargePwr_kW,
+                                                    self.MaxDischargePwr_kW,
+                                                    self.ChgEff,
+                                                    self.DischgEff,
+                                                    1.0)
+        if pwr_cmd[0] != kw_request:
+            _log.info("Insufficient capacity for request of: %s/%s kW",
+                      str(power_request*100) + "%",
+                      kw_request)
 
-        _log.info("Power level changed from %s to %s", self.Pwr_kW, soe_request)
-        self.Pwr_kW = soe_request
+        _log.info("Power level changed from %s to %s", self.Pwr_kW, pwr_cmd[0])
+        self.Pwr_kW  = pwr_cmd[0]
+        self.SOE_kWh = energy[0]
 
         return None
 
@@ -0,0 +1,395 @@
+# Copyright (c) 2018, The Fraunhofer Center for Sustainable Energy
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in
+#    the documentation and/or other materials provided with the
+#    distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This material was prepared as an account of work sponsored by an agency
+# of the United States Government.  Neither the United States Government
+# nor any agency thereof, nor Fraunhofer, nor any of their employees,
+# makes any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness of any
+# information, apparatus, product, or process disclosed, or represents
+# that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or service
+# by trade name, trademark, manufacturer, or otherwise does not necessarily
+# constitute or imply its endorsement, recommendation, or favoring by the
+# United States Government or any agency thereof, or Fraunhofer.  The
+# views and opinions of authors expressed herein do not necessarily state
+# or reflect those of the United States Government or any agency thereof.
+
+import sys
+import time
+import logging
+from random import seed
+from datetime import datetime
+import numpy
+from SunDialResource import SundialResourceProfile
+from SSA_Optimization import SimulatedAnnealer
+from ObjectiveFunctions import EnergyCostObjectiveFunction, ISONECostObjectiveFunction, \
+    StoredEnergyValueObjectiveFunction, dkWObjectiveFunction, DemandChargeObjectiveFunction, \
+    LoadShapeObjectiveFunction
+from gs_identities import *
+
+_log = logging.getLogger("DP")
+
+
+############################
+class DPOptimizer(SimulatedAnnealer):
+    """
+    Dynamic programming alternative to SimulatedAnnealer, for systems in which a single ESS is the only controllable
+    resource (the same assumption made by the fast path of run_ssa_optimization).
+
+    The ESS state of energy is discretized onto a grid of self.n_soe_pts points that includes StartingSOE_kWh, so
+    every transition between grid points is a power command that update_soe would execute unchanged.  The state at
+    each time step is the pair (previous SOE, current SOE); unless self.exact_dkW is set, the dkW cost is left out of
+    the DP, so the previous SOE drops out and each step costs O(N^2) rather than O(N^3).  The demand charge depends
+    on the peak over the whole horizon, so it is handled by solving the DP subject to a set of peak demand caps (all
+    caps are solved in a single vectorized pass) and refining the cap grid around the best one.
+
+    The result is optimal on the SOE grid (excluding dkW cost unless self.exact_dkW is set), to within the resolution
+    of the final cap grid.  Solutions are always costed with the full set of objective functions, and returned as a
+    SundialResourceProfile in the same way as SimulatedAnnealer.run_optimization - so search_single_option,
+    search_load_shift_options and export_schedule are inherited unchanged.  If the ESS path has an objective function
+    that the DP does not model, the pass falls back to SimulatedAnnealer.run_optimization.
+    """
+    def __init__(self):
+        SimulatedAnnealer.__init__(self)
+
+        # DP configuration parameters:
+        self.n_soe_pts    = 101   # number of points in the SOE grid between the ESS reserve limits
+        self.n_caps       = 16    # number of peak demand caps solved per refinement pass
+        self.n_cap_passes = 3     # number of cap grid refinement passes
+        self.exact_dkW    = False # True = state is (previous SOE, current SOE) so dkW cost is modeled exactly - O(N^3)
+                                  # per step, use with a coarse grid; False = dkW cost is left out of the DP - O(N^2)
+
+    ############################
+    def get_soe_grid(self, ess):
+        """
+        :param ess: ESSResource instance
+        :return: numpy array of SOE grid points, in kWh - a uniform grid between the ESS reserve limits that is
+        aligned to StartingSOE_kWh
+        """
+        max_soe = ess.state_vars["MaxSOE_kWh"]*ESS_RESERVE_HIGH
+        min_soe = ess.state_vars["MinSOE_kWh"]*ESS_RESERVE_LOW
+        soe0    = ess.state_vars["StartingSOE_kWh"]
+        step    = (max_soe - min_soe) / float(self.n_soe_pts - 1)
+
+        k_min = int(numpy.ceil((min_soe - soe0) / step - EPSILON))
+        k_max = int(numpy.floor((max_soe - soe0) / step + EPSILON))
+        grid = soe0 + step * numpy.arange(k_min, k_max + 1)
+        if len(grid) == 0:
+            # starting SOE lies outside of the reserve limits - use an unaligned grid
+            grid = numpy.linspace(min_soe, max_soe, self.n_soe_pts)
+        return grid
+
+    ############################
+    def get_transitions(self, ess, soe_from, soe_to):
+        """
+        :param ess: ESSResource instance
+        :param soe_from: numpy array of starting SOE values, in kWh
+        :param soe_to: numpy array of ending SOE values, in kWh
+        :return: pwr, delta_energy, feasible - (len(soe_from) x len(soe_to)) arrays of the power command needed
+        for each transition (inverse of update_soe), the change in stored energy, and whether the power command is
+        within the ESS power limits
+        """
+        tResolution_hr = float(SSA_SCHEDULE_RESOLUTION)/60.0
+        delta_energy = soe_to[None, :] - soe_from[:, None]
+        pwr = numpy.where(delta_energy > 0,
+                          delta_energy / (tResolution_hr * ess.state_vars["ChgEff"]),
+                          delta_energy * ess.state_vars["DischgEff"] / tResolution_hr)
+        feasible = (pwr <= ess.state_vars["MaxChargePwr_kW"] + EPSILON) & \
+                   (pwr >= -1 * ess.state_vars["MaxDischargePwr_kW"] - EPSILON)
+        return pwr, delta_energy, feasible
+
+    ############################
+    def get_cost_model(self, ess_path, baselines):
+        """
+        sorts the objective functions of the nodes on the ESS path into the terms modeled by the DP
+        :param ess_path: list of SundialResourceProfile nodes whose profile changes with the ESS profile
+        :param baselines: list of numpy arrays - demand of each node in ess_path, excluding the ESS
+        :return: dictionary of cost terms, or None if an objective function cannot be modeled
+        """
+        model = {"separable": [],     # (baseline, obj_fcn) - cost is a sum of per-point terms
+                 "dkW": [],           # (baseline, cost_per_dkW)
+                 "stored_energy": [], # value_per_kWh
+                 "demand_charge": []} # (baseline, obj_fcn)
+
+        for node, baseline in zip(ess_path, baselines):
+            for obj_fcn in node.sundial_resources.obj_fcns:
+                if isinstance(obj_fcn, ISONECostObjectiveFunction):
+                    pass # cost does not depend on the profile
+                elif isinstance(obj_fcn, (EnergyCostObjectiveFunction, LoadShapeObjectiveFunction)):
+                    model["separable"].append((baseline, obj_fcn))
+                elif isinstance(obj_fcn, dkWObjectiveFunction):
+                    model["dkW"].append((baseline, obj_fcn.init_params["cost_per_dkW"]))
+                elif isinstance(obj_fcn, StoredEnergyValueObjectiveFunction):
+                    model["stored_energy"].append(obj_fcn.init_params["value_per_kWh"])
+                elif isinstance(obj_fcn, DemandChargeObjectiveFunction):
+                    model["demand_charge"].append((baseline, obj_fcn))
+                else:
+                    _log.info("DP: "+obj_fcn.__class__.__name__+" on "+node.sundial_resources.resource_id+
+                              " is not supported")
+                    return None
+
+        if len(model["demand_charge"]) > 1:
+            _log.info("DP: only a single demand charge on the ESS path is supported")
+            return None
+        return model
+
+    ############################
+    def get_stage_cost(self, obj_fcn, demand):
+        """
+        :param obj_fcn: separable objective function (EnergyCostObjectiveFunction or LoadShapeObjectiveFunction)
+        :param demand: (T x ...) array of node demand, in kW
+        :return: array of the same shape as demand - cost of each point
+        """
+        shape = (-1,) + (1,) * (demand.ndim - 1)
+        if isinstance(obj_fcn, LoadShapeObjectiveFunction):
+            target = numpy.array(obj_fcn.init_params["cur_cost"][0], dtype=float).reshape(shape)
+            if obj_fcn.init_params["vble_price"] == False:
+                price = 10.0
+            else:
+                price = numpy.array(obj_fcn.init_params["cur_cost"][1], dtype=float).reshape(shape)
+            return price * (demand - target) ** 2
+        else:
+            return numpy.array(obj_fcn.init_params["cur_cost"][0], dtype=float).reshape(shape) * demand
+
+    ############################
+    def solve_dp(self, caps, stage0, stage, dkW0, dkW, demand0, demand, terminal):
+        """
+        Solves the DP for each peak demand cap in a single vectorized pass.
+        States are (previous SOE index, current SOE index); the first step starts from StartingSOE_kWh.
+        :param caps: numpy array of C peak demand caps, in kW
+        :param stage0: (N) cost of moving from the starting SOE to each grid point (infinite if infeasible)
+        :param stage: (T x N x N) cost of each grid transition at each time step (infinite if infeasible)
+        :param dkW0: (N x N) dkW cost between step 0 and step 1
+        :param dkW: function of t returning the (N x N x N) dkW cost between step t-1 and step t, or None if no dkW
+        cost applies
+        :param demand0: (N) demand of the demand charge node at step 0, or None if no demand charge applies
+        :param demand: (T x N x N) demand of the demand charge node at each step, or None
+        :param terminal: (N) cost assigned to the final SOE
+        :return: (cost, soe_ind) - length C array of the least cost (excluding demand charge) under each cap, and a
+        (C x T) array of the corresponding SOE grid indices
+        """
+        n_caps = len(caps)
+        n_pts  = len(terminal)
+        n_steps = stage.shape[0]
+
+        value = numpy.tile(stage0, (n_caps, 1))
+        if demand0 is not None:
+            value[demand0[None, :] > caps[:, None]] = numpy.inf
+
+        # step 1 - the previous SOE is the starting state of step 0
+        value = value[:, :, None] + stage[1][None] + dkW0[None]
+        if demand is not None:
+            value[demand[1][None] > caps[:, None, None]] = numpy.inf
+
+        back_ptr = numpy.zeros((n_steps, n_caps, n_pts, n_pts), dtype=numpy.int16)
+        for t in range(2, n_steps):
+            if dkW is None:
+                back_ptr[t] = numpy.argmin(value, axis=1)[:, :, None]
+                value = numpy.min(value, axis=1)[:, :, None] + stage[t][None]
+            else:
+                candidates = value[:, :, :, None] + dkW(t)[None]
+                back_ptr[t] = numpy.argmin(candidates, axis=1)
+                value = numpy.min(candidates, axis=1) + stage[t][None]
+            if demand is not None:
+                value[demand[t][None] > caps[:, None, None]] = numpy.inf
+
+        value = value + terminal[None, None, :]
+        cost = numpy.empty(n_caps)
+        soe_ind = numpy.zeros((n_caps, n_steps), dtype=int)
+        for c in range(n_caps):
+            (prev_ind, cur_ind) = numpy.unravel_index(numpy.argmin(value[c]), value[c].shape)
+            cost[c] = value[c, prev_ind, cur_ind]
+            soe_ind[c, n_steps-1] = cur_ind
+            soe_ind[c, n_steps-2] = prev_ind
+            for t in range(n_steps-1, 1, -1):
+                soe_ind[c, t-2] = back_ptr[t, c, soe_ind[c, t-1], soe_ind[c, t]]
+        return cost, soe_ind
+
+    ############################
+    def run_dp_optimization(self, sundial_resources, timestamps):
+        """
+        Finds the least cost ESS profile by dynamic programming.
+        :param sundial_resources: A SundialResource instance - referencing to the top of the SundialResource tree for
+        the system in question.
+        :param timestamps: list of timestamps, length of SSA_PTS_PER_SCHEDULE, that correpond to the time at which
+        schedule_var data points are valid
+        :return: least_cost_soln - SundialResourceProfile instance corresponding to the least cost solution, or None
+        if the system cannot be solved by DP
+        """
+        t0 = datetime.now()
+        init_soln       = SundialResourceProfile(sundial_resources, timestamps)
+        least_cost_soln = SundialResourceProfile(sundial_resources, timestamps)
+
+        ess_profiles = self.get_resource(least_cost_soln, "ESSCtrlNode")
+        if (len(ess_profiles) != 1) or (len(timestamps) < 2):
+            _log.info("DP: requires a single ESS and at least two schedule points")
+            return None
+        ess_profile = ess_profiles[0]
+        ess         = ess_profile.sundial_resources
+
+        ess_path     = self.get_resource_path(least_cost_soln, ess_profile)
+        ess_baseline = numpy.array(ess_profile.state_vars["DemandForecast_kW"], dtype=float)
+        baselines    = [numpy.array(node.state_vars["DemandForecast_kW"], dtype=float) - ess_baseline
+                        for node in ess_path]
+        model = self.get_cost_model(ess_path, baselines)
+        if model is None:
+            return None
+
+        # SOE grid and transitions
+        grid = self.get_soe_grid(ess)
+        soe0 = numpy.array([ess.state_vars["StartingSOE_kWh"]], dtype=float)
+        pwr0, delta_energy0, feasible0 = self.get_transitions(ess, soe0, grid)
+        pwr0, delta_energy0, feasible0 = pwr0[0], delta_energy0[0], feasible0[0]
+        pwr, delta_energy, feasible    = self.get_transitions(ess, grid, grid)
+
+        # per-transition cost at each time step - step 0 is indexed by the ending SOE only
+        n_steps = len(timestamps)
+        pwr_t = numpy.tile(pwr, (n_steps, 1, 1))
+        pwr_t[0] = pwr0[None, :]
+        stage = numpy.zeros((n_steps, len(grid), len(grid)))
+        for (baseline, obj_fcn) in model["separable"]:
+            stage += self.get_stage_cost(obj_fcn, baseline[:, None, None] + pwr_t)
+        stage0 = numpy.where(feasible0, stage[0, 0], numpy.inf)
+        stage[:, ~feasible] = numpy.inf
+        terminal = sum([value_per_kWh * grid for value_per_kWh in model["stored_energy"]], numpy.zeros(len(grid)))
+
+        # dkW cost depends on the transitions into and out of the middle SOE
+        dkW0 = numpy.zeros((len(grid), len(grid)))
+        dkW  = None
+        if (self.exact_dkW == True) and (len(model["dkW"]) > 0):
+            for (baseline, cost_per_dkW) in model["dkW"]:
+                dkW0 += cost_per_dkW * abs(baseline[1] - baseline[0] + pwr - pwr0[:, None])
+
+            def dkW(t):
+                cost = numpy.zeros((len(grid), len(grid), len(grid)))
+                for (baseline, cost_per_dkW) in model["dkW"]:
+                    cost += cost_per_dkW * abs(baseline[t] - baseline[t-1] + pwr[None, :, :] - pwr[:, :, None])
+                return cost
+
+        # demand charge - solve under a series of peak demand caps, refining the caps around the best one
+        if len(model["demand_charge"]) == 1:
+            (dc_baseline, dc_obj_fcn) = model["demand_charge"][0]
+            demand0 = dc_baseline[0] + pwr0
+            demand  = dc_baseline[:, None, None] + pwr_t
+            lb = max([dc_baseline[0] + pwr0[feasible0].min()] +
+                     [dc_baseline[t] + pwr[feasible].min() for t in range(1, n_steps)])
+            ub = max([dc_baseline[0] + pwr0[feasible0].max()] +
+                     [dc_baseline[t] + pwr[feasible].max() for t in range(1, n_steps)])
+            caps = numpy.linspace(lb, ub, self.n_caps)
+            n_passes = self.n_cap_passes
+        else:
+            dc_obj_fcn = None
+            demand0    = None
+            demand     = None
+            caps       = numpy.array([numpy.inf])
+            n_passes   = 1
+
+        best_cost = numpy.inf
+        best_ind  = None
+        for ii in range(n_passes):
+            cost, soe_ind = self.solve_dp(caps, stage0, stage, dkW0, dkW, demand0, demand, terminal)
+            for c in range(len(caps)):
+                if numpy.isinf(cost[c]):
+                    continue
+                if dc_obj_fcn is not None:
+                    peak = max([demand0[soe_ind[c, 0]]] +
+                               [demand[t, soe_ind[c, t-1], soe_ind[c, t]] for t in range(1, n_steps)])
+                    cost[c] += dc_obj_fcn.get_demand_charge(peak)
+                if cost[c] < best_cost:
+                    best_cost = cost[c]
+                    best_ind  = soe_ind[c]
+                    best_cap  = c
+            if (best_ind is not None) and (ii < n_passes - 1):
+                caps = numpy.linspace(caps[max(best_cap-1, 0)], caps[min(best_cap+1, len(caps)-1)], self.n_caps)
+
+        if best_ind is None:
+            _log.info("DP: no feasible solution found")
+            return None
+
+        # copy the least cost SOE trajectory back into a SundialResourceProfile tree
+        ess_pwr = numpy.array([pwr0[best_ind[0]]] + [pwr[best_ind[t-1], best_ind[t]] for t in range(1, n_steps)])
+        ess_delta_energy = numpy.array([delta_energy0[best_ind[0]]] +
+                                       [delta_energy[best_ind[t-1], best_ind[t]] for t in range(1, n_steps)])
+        ess_energy = grid[best_ind]
+        for node, baseline in zip(ess_path, baselines):
+            if node is ess_profile:
+                node.state_vars["DemandForecast_kW"]  = ess_pwr
+                node.state_vars["DeltaEnergy_kWh"]    = ess_delta_energy
+            else:
+                node.state_vars["DemandForecast_kW"]  = baseline + ess_pwr
+            node.state_vars["EnergyAvailableForecast_kWh"] = ess_energy.copy()
+        least_cost_soln.calc_cost()
+
+        self.stop_reason       = "dp"
+        self.n_iterations_used = n_passes
+        _log.info("DP: least cost soln is "+str(least_cost_soln.total_cost)+" ("+str(len(grid))+" SOE points)")
+        _log.info("DP: total time: "+str((datetime.now() - t0).total_seconds()))
+
+        if self.save_results == True:
+            self.write_results(init_soln, least_cost_soln, timestamps)
+
+        return least_cost_soln
+
+    ############################
+    def run_optimization(self, sundial_resources, timestamps):
+        """
+        runs a DP pass, falling back to the SSA engine selected by self.engine for systems the DP does not support
+        :return: least_cost_soln - SundialResourceProfile instance
+        """
+        least_cost_soln = self.run_dp_optimization(sundial_resources, timestamps)
+        if least_cost_soln is None:
+            _log.info("DP: falling back to SSA")
+            least_cost_soln = SimulatedAnnealer.run_optimization(self, sundial_resources, timestamps)
+        return least_cost_soln
+
+
+if __name__ == '__main__':
+    # compares the DP solution against an SSA pass on the example system from ssa_benchmark.py
+    from ssa_benchmark import build_example_system
+    gs_start_time = datetime(2018, 7, 1, 0, 0, 0)
+    if len(sys.argv) > 1:
+        gs_start_time = datetime.strptime(sys.argv[1], TIME_FORMAT)
+
+    logging.getLogger("SSA").setLevel(logging.WARNING)
+    sundial_resources, schedule_timestamps = build_example_system(gs_start_time)
+
+    results = []
+    for (label, optimizer) in [("ssa", SimulatedAnnealer()), ("dp", DPOptimizer())]:
+        seed(1)
+        optimizer.save_results = False
+        t0 = time.time()
+        least_cost_soln = optimizer.run_optimization(sundial_resources, schedule_timestamps)
+        results.append((label, time.time() - t0, least_cost_soln.total_cost))
+
+    print("")
+    print("{:<8}{:>12}{:>14}".format("engine", "time (s)", "total cost"))
+    for (label, run_time, total_cost) in results:
+        print("{:<8}{:>12.3f}{:>14.2f}".format(label, run_time, total_cost))
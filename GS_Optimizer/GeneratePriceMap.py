@@ -1,5 +1,6 @@
 from math import floor, exp
 import copy
+import hashlib
 import json
 import csv
 import sys
@@ -20,7 +21,7 @@ import pandas as pd
 
 
 ##############################################################################
-def generate_cost_map(sundial_resources, pv_resources, n_time_steps = 24, search_resolution = 25):
+def generate_cost_map(sundial_resources, pv_resources, n_time_steps = 24, search_resolution = 25, rows = None):
     """
     generates marginal cost of electricity per kWh as a function of time and demand.
     It generates a matrix of cost as a function of time (on one axis) and demand on the other axis
@@ -31,16 +32,65 @@ def generate_cost_map(sundial_resources, pv_resources, n_time_steps = 24, search
     Once the matrix is generated, demand tiers are culled to identify tiers where change in demand occurs.
     :param n_time_steps: number of time steps in the search space
     :param search_resolution: size of the demand tiers for initial search, in kW
+    :param rows: list of time steps for which to generate tiers.  If None, generates tiers for all time steps
     :return: tiers - list of lists of dictionary - each entry is defines price as a function of demand LB/UB and time
+    (one entry per time step in rows)
     """
-    total_cost = 0
     epsilon    = 0.1 # minimum price difference required to differentiate a new price tier
 
     # TODO - only deals with system level costs
     # TODO - adjust for solar forecast
 
-    # pprint(self.sundial_resources.state_vars["DemandForecast_kW"])
+    if rows is None:
+        rows = range(0, n_time_steps)
+    lb, ub = get_demand_bounds(sundial_resources, search_resolution)
 
+    n_demand_steps = int((ub - lb) / search_resolution + 1)
+    demand_steps   = numpy.array([lb + jj * search_resolution for jj in range(0, n_demand_steps)], dtype=float)
+
+    # test profiles - one per (time step, demand step).  Each profile is zero, except at its time step, where it is
+    # set to the demand step.  All profiles are costed in one batch.
+    test_profiles = numpy.zeros((len(rows), n_demand_steps, n_time_steps))
+    test_profiles[numpy.arange(len(rows)), :, rows] = demand_steps
+    cost_map = sundial_resources.calc_cost_batch({"DemandForecast_kW": test_profiles.reshape(-1, n_time_steps)},
+                                                 linear_approx=True).reshape(len(rows), n_demand_steps)
+
+    # v[nn, kk-1] = change in cost between demand steps kk-1 and kk.  A new price tier starts at demand step kk
+    # wherever this changes by more than epsilon relative to the previous step.  The search runs from demand step
+    # kk_start (i.e., max(0, lb + 2 x search_resolution)) to the last demand step, kk_end (i.e., ub)
+    v = numpy.diff(cost_map, axis=1)
+    _log.debug(v)
+    kk_start = int(round((max(0.0, lb + 2 * search_resolution) - lb) / search_resolution))
+    kk_end   = n_demand_steps - 1
+    new_tier = (v[:, kk_start-1:kk_end-1] > v[:, kk_start-2:kk_end-2] + epsilon) | \
+               (v[:, kk_start-1:kk_end-1] < v[:, kk_start-2:kk_end-2] - epsilon)
+
+    tiers = []
+    for nn, ii in enumerate(rows):
+        cur_generation = -1*pv_resources.state_vars["DemandForecast_kW"][ii]
+        _log.info(cur_generation)
+        tiers.append([{"LB": 0.0,
+                       "price": round(v[nn][kk_start-2] / search_resolution, 3)}])
+        for kk in numpy.flatnonzero(new_tier[nn]) + kk_start:
+            # tier boundary is at the demand step below the change in price
+            boundary = demand_steps[kk-1] + cur_generation
+            if boundary != tiers[nn][-1]["LB"]:
+                tiers[nn][-1].update({"UB": boundary})
+                tiers[nn].append({"LB": boundary})
+            tiers[nn][-1].update({"price": round(v[nn][kk-1] / search_resolution, 3)})
+        if kk_start <= kk_end:
+            tiers[nn][-1].update({"UB": ub + cur_generation})
+    return tiers
+
+
+##############################################################################
+def get_demand_bounds(sundial_resources, search_resolution):
+    """
+    calculates the range of demand searched by generate_cost_map, from the forecast at the top of the resource tree
+    :param sundial_resources: top node in sundial resource tree
+    :param search_resolution: size of the demand tiers for initial search, in kW
+    :return: lb, ub - lower and upper bounds of the demand search space, in kW
+    """
     lb = min(sundial_resources.state_vars["DemandForecast_kW"])
     ub = max(sundial_resources.state_vars["DemandForecast_kW"])
 
@@ -63,48 +113,113 @@ def generate_cost_map(sundial_resources, pv_resources, n_time_steps = 24, search
     else:  # set ub and lb to the nearest search resolution
         lb = int(lb - (lb % search_resolution))
         ub = int(ub - (ub % search_resolution) + search_resolution)
+    return lb, ub
 
-    n_demand_steps = int((ub - lb) / search_resolution + 1)
 
-    cost_map = pandas.DataFrame([[0.0] * n_demand_steps] * n_time_steps)
-    test_profile = numpy.array([[0.0] * n_time_steps] * n_time_steps)
-    for ii in range(0, n_time_steps):
-        for jj in range(0, n_demand_steps):
-            test_profile[ii][ii] = lb + jj * search_resolution
-            # print(test_profile)
-            sv = {}
-            sv.update({"DemandForecast_kW": test_profile[ii]})
-            #print(test_profile[ii])
-            cost_map.iloc[ii][jj] = sundial_resources.calc_cost(sv, linear_approx=True)
-
-    v = cost_map.diff(axis=1)
-    v.columns = range(lb, ub + search_resolution, search_resolution)
-    _log.debug(v)
-    tiers = []
-    for ii in range(0, n_time_steps):
-        jj=max(0.0, lb+2*search_resolution)
-        cnt = 0
-        cur_generation = -1*pv_resources.state_vars["DemandForecast_kW"][ii]
-        _log.info(cur_generation)
-        tiers.append([{"LB": 0.0}])
-
-        tiers[ii][cnt].update({"price": round(v.iloc[ii][jj - search_resolution] / search_resolution, 3)})
-        while jj <= ub:
-            same_tier = True
-            while same_tier == True:
-                if jj == ub:
-                    same_tier = False
-                    tiers[ii][cnt].update({"UB": jj+cur_generation})
-                elif ((v.iloc[ii][jj] > v.iloc[ii][jj - search_resolution] + epsilon) or
-                      (v.iloc[ii][jj] < v.iloc[ii][jj - search_resolution] - epsilon)):
-                    if (jj - search_resolution+cur_generation) != tiers[ii][cnt]["LB"]:
-                        tiers[ii][cnt].update({"UB": jj - search_resolution+cur_generation})
-                        cnt += 1
-                        tiers[ii].append({"LB": jj - search_resolution+cur_generation})
-                    tiers[ii][cnt].update({"price": round(v.iloc[ii][jj] / search_resolution, 3)})
-                    same_tier = False
-                jj += search_resolution
-    return tiers
+##############################################################################
+def get_fingerprint(*args):
+    """
+    hashes a set of values - used to detect changes to the inputs of generate_cost_map.  Handles nested dictionaries,
+    lists, and numpy arrays of numbers, datetimes, strings, or None
+    :return: sha1 hex digest
+    """
+    h = hashlib.sha1()
+    for v in args:
+        _update_fingerprint(h, v)
+    return h.hexdigest()
+
+##############################################################################
+def _update_fingerprint(h, v):
+    if isinstance(v, dict):
+        h.update("{")
+        for k in sorted(v.keys()):
+            h.update(repr(k)+":")
+            _update_fingerprint(h, v[k])
+        h.update("}")
+    elif isinstance(v, numpy.ndarray) and v.dtype != object:
+        h.update(str(v.dtype)+str(v.shape))
+        h.update(numpy.ascontiguousarray(v).tobytes())
+    elif isinstance(v, (list, tuple, numpy.ndarray)):
+        h.update("[")
+        for x in v:
+            _update_fingerprint(h, x)
+        h.update("]")
+    else:
+        h.update(repr(v)+",")
+
+
+##############################################################################
+class PriceMapCache():
+    """
+    Caches the tiers returned by generate_cost_map.  The map is keyed by a fingerprint of the schedule timestamps,
+    the system demand forecast, the PV forecast and the system tariffs:
+     - if none of these have changed since the last call, the cached map is returned without reconfiguring costs
+     - if the tariffs and the demand search space (see get_demand_bounds) are unchanged, only the time steps whose
+       timestamp, demand forecast, or PV forecast changed are recomputed
+     - otherwise, the full map is regenerated
+    Each row of the map is the marginal cost at a single time step, so it depends only on that time step's values
+    and on the tariffs and search space.
+    """
+
+    ##############################################################################
+    def __init__(self):
+        self.key        = None  # fingerprint of all inputs to the cached map
+        self.search_key = None  # fingerprint of the inputs shared by all rows
+        self.row_keys   = []    # fingerprint of the inputs to each row
+        self.tiers      = []
+
+    ##############################################################################
+    def get_cost_map(self, sundial_resources, pv_resources, schedule_timestamps, tariffs,
+                     n_time_steps = 24, search_resolution = 25):
+        """
+        returns the price tiers for the schedule starting at schedule_timestamps[0] (see generate_cost_map),
+        regenerating only the parts of the map whose inputs have changed.  Forecasts must already be interpolated
+        to schedule_timestamps (see SundialResource.interpolate_forecast)
+        :param sundial_resources: top node in sundial resource tree
+        :param pv_resources: PV node in sundial resource tree
+        :param schedule_timestamps: list of timestamps (length = SSA_PTS_PER_SCHEDULE)
+        :param tariffs: system tariffs, passed to SundialResource.cfg_cost as system_tariff
+        :param n_time_steps: number of time steps in the search space
+        :param search_resolution: size of the demand tiers for initial search, in kW
+        :return: tiers - see generate_cost_map.  The cached map is returned - callers must not modify it
+        """
+        demand = sundial_resources.state_vars["DemandForecast_kW"]
+        pv     = pv_resources.state_vars["DemandForecast_kW"]
+
+        key = get_fingerprint(schedule_timestamps, demand, pv, tariffs, n_time_steps, search_resolution)
+        if key == self.key:
+            _log.info("Price map unchanged - using cached map")
+            return self.tiers
+
+        sundial_resources.cfg_cost(schedule_timestamps, system_tariff=tariffs)
+
+        search_key = get_fingerprint(tariffs,
+                                     get_demand_bounds(sundial_resources, search_resolution),
+                                     n_time_steps,
+                                     search_resolution)
+        row_keys = [get_fingerprint(schedule_timestamps[ii], demand[ii], pv[ii]) for ii in range(0, n_time_steps)]
+
+        if search_key == self.search_key:
+            rows = [ii for ii in range(0, n_time_steps) if row_keys[ii] != self.row_keys[ii]]
+            tiers = list(self.tiers)
+        else:
+            rows = range(0, n_time_steps)
+            tiers = [None] * n_time_steps
+        _log.info("Price map - recomputing "+str(len(rows))+" of "+str(n_time_steps)+" time steps")
+
+        if len(rows) > 0:
+            for ii, row_tiers in zip(rows, generate_cost_map(sundial_resources,
+                                                             pv_resources,
+                                                             n_time_steps,
+                                                             search_resolution,
+                                                             rows=rows)):
+                tiers[ii] = row_tiers
+
+        self.key        = key
+        self.search_key = search_key
+        self.row_keys   = row_keys
+        self.tiers      = tiers
+        return self.tiers
 
 
 
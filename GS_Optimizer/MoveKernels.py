@@ -0,0 +1,173 @@
+# Copyright (c) 2018, The Fraunhofer Center for Sustainable Energy
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in
+#    the documentation and/or other materials provided with the
+#    distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This material was prepared as an account of work sponsored by an agency
+# of the United States Government.  Neither the United States Government
+# nor any agency thereof, nor Fraunhofer, nor any of their employees,
+# makes any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness of any
+# information, apparatus, product, or process disclosed, or represents
+# that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or service
+# by trade name, trademark, manufacturer, or otherwise does not necessarily
+# constitute or imply its endorsement, recommendation, or favoring by the
+# United States Government or any agency thereof, or Fraunhofer.  The
+# views and opinions of authors expressed herein do not necessarily state
+# or reflect those of the United States Government or any agency thereof.
+
+"""
+Move kernels for SimulatedAnnealer.run_ssa_optimization.
+
+A move kernel perturbs the profile of one type of controllable SundialResourceProfile node and applies that resource
+type's constraints to the result.  Kernels are registered in MOVE_KERNELS, keyed by resource_type.  Each iteration,
+the annealer picks a controllable node at random, weighted by SimulatedAnnealer.move_weights[resource_type], and calls
+the kernel registered for its resource_type.
+"""
+from math import floor
+from random import random
+import numpy
+
+
+##############################################################################
+class MoveKernel():
+    """
+    Base class for move kernels.  Subclasses implement perturb(profile, jump), which perturbs profile.state_vars
+    in place, then applies constraints (see check_constraints):
+    :param profile: SundialResourceProfile node to perturb
+    :param jump: maximum jump size, as a fraction of the resource's range
+    :return: (ind, old_val) - ind is the index from which profile.state_vars may have changed.  If only
+    DemandForecast_kW[ind] changed (a single point move), old_val is its previous value; otherwise, None.
+    """
+
+    ##############################################################################
+    def check_constraints(self, profile, ind):
+        """
+        Modifies profile so that it does not violate the resource's constraints.
+        :param profile: SundialResourceProfile.state_vars
+        :param ind: index that was perturbed
+        :return: profile
+        """
+        return profile
+
+    ##############################################################################
+    def get_jump(self, x, jump, lb, ub):
+        """
+        perturbs x by a random amount between +/- jump, subject to bounds lb and ub (see SimulatedAnnealer.calc_jump)
+        """
+        return max(min(x + (random() - .5) * 2.0 * jump, ub), lb)
+
+
+##############################################################################
+class ESSMoveKernel(MoveKernel):
+    """
+    Changes the ESS charge / discharge command at a single point.  SOE constraints are applied with
+    ESSResource.check_constraints2, which updates the energy profile incrementally once it has been synced with the
+    delta energy profile (profile.energy_synced, which is carried through SundialResourceProfile.copy_profile).
+    Syncing changes the energy profile at every point, so a perturbation of an unsynced profile is not reported as a
+    single point move.
+    """
+
+    ##############################################################################
+    def perturb(self, profile, jump):
+        ess = profile.sundial_resources
+        synced = profile.energy_synced
+        ind = int(floor(random()*len(profile.state_vars["DemandForecast_kW"])))
+        old_val = profile.state_vars["DemandForecast_kW"][ind]
+        profile.state_vars["DemandForecast_kW"][ind] = self.get_jump(old_val,
+                                                                     jump*(ess.state_vars["MaxDischargePwr_kW"]+ess.state_vars["MaxChargePwr_kW"])/2,
+                                                                     -1*ess.state_vars["MaxDischargePwr_kW"],
+                                                                     ess.state_vars["MaxChargePwr_kW"])
+        self.check_constraints(profile, ind)
+        if synced == False:
+            return 0, None
+        return ind, old_val
+
+    ##############################################################################
+    def check_constraints(self, profile, ind):
+        if profile.energy_synced == False:
+            profile.sundial_resources.sync_energy(profile.state_vars)
+            profile.energy_synced = True
+        profile.sundial_resources.check_constraints2(profile.state_vars, ind, incremental=True)
+        return profile
+
+
+##############################################################################
+class PVCurtailmentMoveKernel(MoveKernel):
+    """
+    Curtails PV output at a single point.  PV demand (negative = generation) at each point is bounded by the
+    baseline forecast at that point and zero, and the jump is scaled by the baseline forecast at that point.
+    """
+
+    ##############################################################################
+    def perturb(self, profile, jump):
+        forecast = profile.sundial_resources.state_vars["DemandForecast_kW"]
+        ind = int(floor(random()*len(profile.state_vars["DemandForecast_kW"])))
+        old_val = profile.state_vars["DemandForecast_kW"][ind]
+        lb = min(forecast[ind], 0.0)
+        profile.state_vars["DemandForecast_kW"][ind] = self.get_jump(old_val, -1*jump*lb, lb, 0.0)
+        return ind, old_val
+
+    ##############################################################################
+    def check_constraints(self, profile, ind):
+        lb = min(profile.sundial_resources.state_vars["DemandForecast_kW"][ind], 0.0)
+        profile.state_vars["DemandForecast_kW"][ind] = max(min(profile.state_vars["DemandForecast_kW"][ind], 0.0), lb)
+        return profile
+
+
+##############################################################################
+class LoadShiftMoveKernel(MoveKernel):
+    """
+    Switches a load shift node to a randomly selected option from LoadShiftOptions_kW.  Each option is feasible by
+    definition, so no constraints apply.
+    """
+
+    ##############################################################################
+    def perturb(self, profile, jump):
+        options = profile.sundial_resources.state_vars["LoadShiftOptions_kW"]
+        ii = int(floor(random()*len(options)))
+        numpy.copyto(profile.state_vars["DemandForecast_kW"], options[ii])
+        return 0, None
+
+    ##############################################################################
+    def get_selected_option(self, profile):
+        """
+        :param profile: SundialResourceProfile node for a load shift resource
+        :return: index of the load shift option that matches profile, or None
+        """
+        match = numpy.flatnonzero(numpy.all(profile.sundial_resources.state_vars["LoadShiftOptions_kW"] ==
+                                            profile.state_vars["DemandForecast_kW"], axis=1))
+        if len(match) == 0:
+            return None
+        return int(match[0])
+
+
+MOVE_KERNELS = {"ESSCtrlNode": ESSMoveKernel(),
+                "PVCtrlNode": PVCurtailmentMoveKernel(),
+                "LoadShiftCtrlNode": LoadShiftMoveKernel()}
@@ -6,10 +6,96 @@ from datetime import datetime, timedelta
 import isodate
 import copy
 import csv
+import calendar
+import hashlib
+import logging
+import zipfile
+from bisect import bisect_right
+from collections import OrderedDict
 from gs_identities import *
 from gs_utilities import get_gs_path
 
+_log = logging.getLogger("ObjectiveFunctions")
+
 USE_LOCAL_TIME = True
+DATA_CACHE_SUFFIX = ".cache.npz"  # processed data files are cached at <data file name><DATA_CACHE_SUFFIX>
+LOOKUP_CACHE_SIZE = 8             # number of time windows memoized by ObjectiveFunction.lookup_data
+
+
+##############################################################################
+def datetime_to_ns(t):
+    """
+    :param t: datetime.  Naive datetimes are assumed to be in UTC
+    :return: ns since the epoch, as an integer
+    """
+    return (calendar.timegm(t.utctimetuple())*1000000 + t.microsecond)*1000
+
+
+##############################################################################
+def timedelta_to_ns(dt):
+    """
+    :param dt: timedelta
+    :return: duration in ns, as an integer
+    """
+    return ((dt.days*86400 + dt.seconds)*1000000 + dt.microseconds)*1000
+
+
+##############################################################################
+def get_data_file_key(fname):
+    """
+    :param fname: full path to a data file
+    :return: key that identifies the contents of the file and the settings used to process it (see
+    ObjectiveFunction.load_data_file).  Cached data is valid only if it was generated with the same key.
+    """
+    with open(fname, "rb") as f:
+        file_hash = hashlib.sha1(f.read()).hexdigest()
+    return file_hash+"|"+str(SSA_SCHEDULE_RESOLUTION)+"|"+str(USE_LOCAL_TIME)
+
+
+##############################################################################
+def load_data_cache(cache_fname, key):
+    """
+    loads a dataframe previously saved by save_data_cache
+    :param cache_fname: cache file name
+    :param key: see get_data_file_key
+    :return: dataframe, or None if the cache does not exist, can't be read, or was generated with a different key
+    """
+    try:
+        with numpy.load(cache_fname) as cache:
+            if str(cache["key"]) != key:
+                _log.debug("Data cache "+cache_fname+" rejected: generated with a different key")
+                return None
+            index   = pandas.to_datetime(cache["index"], utc=True)
+            columns = [unicode(c) for c in cache["columns"]]
+            return pandas.DataFrame(dict([(c, cache["values_"+str(ii)]) for (ii, c) in enumerate(columns)]),
+                                    index=index,
+                                    columns=columns)
+    except (IOError, OSError, KeyError, ValueError, zipfile.BadZipfile) as e:
+        _log.debug("Data cache "+cache_fname+" rejected: "+str(e))
+        return None
+
+
+##############################################################################
+def save_data_cache(cache_fname, key, df):
+    """
+    saves a dataframe with a UTC DatetimeIndex as epoch times (ns) and one array per column.  The file is written
+    to a temporary file, then renamed, so that a partially written cache is never loaded
+    :param cache_fname: cache file name
+    :param key: see get_data_file_key
+    :param df: dataframe to save
+    :return: None
+    """
+    arrays = {"key": numpy.array(key),
+              "index": df.index.asi8,
+              "columns": numpy.array([unicode(c) for c in df.columns])}
+    for (ii, c) in enumerate(df.columns):
+        arrays["values_"+str(ii)] = df[c].values
+    try:
+        with open(cache_fname+".tmp", "wb") as f:
+            numpy.savez(f, **arrays)
+        os.rename(cache_fname+".tmp", cache_fname)
+    except (IOError, OSError) as e:
+        _log.warning("Unable to write data cache "+cache_fname+": "+str(e))
 
 ##############################################################################
 class ObjectiveFunction():
@@ -27,6 +113,8 @@ class ObjectiveFunction():
         print(desc)
         self.desc   = desc
         self.init_params = {'tariff_key': None}
+        self.data_arrays  = None          # see get_data_arrays
+        self.lookup_cache = OrderedDict() # see lookup_data
 
         for k, v in init_params.iteritems():
             try:
@@ -40,6 +128,18 @@ class ObjectiveFunction():
     def obj_fcn_cfg(self, **kwargs):
         pass
 
+    ##############################################################################
+    def get_tariffs(self, kwargs):
+        """
+        :param kwargs: keyword arguments to obj_fcn_cfg
+        :return: the tariff dictionary identified by tariff_key - kwargs[tariff_key] if it was passed directly,
+        otherwise kwargs["tariffs"] (SundialResource.cfg_cost looks up tariff_key and passes the result as tariffs).
+        None if there is no tariff dictionary
+        """
+        if (self.init_params["tariff_key"] is not None) and (self.init_params["tariff_key"] in kwargs):
+            return kwargs[self.init_params["tariff_key"]]
+        return kwargs.get("tariffs")
+
     ##############################################################################
     def load_data_file(self, fname):
         """
@@ -47,12 +147,29 @@ class ObjectiveFunction():
         column 1 = datetime
         column 2-n = cost information
         row 1 = column headers
+        The processed data is cached next to the excel file (see DATA_CACHE_SUFFIX), and is reloaded from the cache
+        unless the contents of the excel file have changed (see get_data_file_key)
         :param fname: filename
         :return: self.obj_fcn_data --> dataframe of time series cost data
         """
         # fname_fullpath = get_gs_path("", fname)
         fname_fullpath = get_gs_path("GS_Optimizer/", fname)
 
+        key    = get_data_file_key(fname_fullpath)
+        new_df = load_data_cache(fname_fullpath+DATA_CACHE_SUFFIX, key)
+        if new_df is None:
+            _log.info("Generating data cache for "+fname_fullpath)
+            new_df = self.read_data_file(fname_fullpath)
+            save_data_cache(fname_fullpath+DATA_CACHE_SUFFIX, key, new_df)
+        return new_df
+
+    ##############################################################################
+    def read_data_file(self, fname_fullpath):
+        """
+        reads and processes time-series cost data from an excel file (see load_data_file)
+        :param fname_fullpath: full path to the excel file
+        :return: dataframe of time series cost data, resampled to SSA_SCHEDULE_RESOLUTION, indexed by UTC datetime
+        """
         df = pandas.read_excel(fname_fullpath, header=0, index_col=0)
         #tst = numpy.array([pandas.Timestamp(t).replace(tzinfo=pytz.UTC).to_pydatetime() for t in df.index])
         new_df = df.resample(str(SSA_SCHEDULE_RESOLUTION) + 'T').bfill()
@@ -67,55 +184,151 @@ class ObjectiveFunction():
     ##############################################################################
     def lookup_data(self, schedule_timestamps, sim_offset=timedelta(0)):
         """
-        looks up cost data from a time-series dataframe for a time window defined by schedule_timestamps
-        :param schedule_timestamps:
-        :param sim_offset:
-        :return:
+        looks up cost data from a time-series dataframe for a time window defined by schedule_timestamps.
+        The window starts at the data point closest to schedule_timestamps[0] + sim_offset (or the point before it,
+        if that point is after schedule_timestamps[0]), and is SSA_PTS_PER_SCHEDULE points long.
+        The data is searched as a sorted array of epoch times (see get_data_arrays).  Results are memoized by
+        (schedule_timestamps[0], sim_offset) - the most recent LOOKUP_CACHE_SIZE windows are kept.
+        :param schedule_timestamps: list of tz-aware datetimes
+        :param sim_offset: timedelta
+        :return: numpy array of cost data, one row per data column, one column per time step.  The returned array is
+        shared with the cache and must not be modified
         """
-        print("sim_offset = "+str(sim_offset))
+        (epochs, values) = self.get_data_arrays()
+
+        key = (schedule_timestamps[0], sim_offset)
+        try:
+            cur_data = self.lookup_cache.pop(key)
+            self.lookup_cache[key] = cur_data  # move to most recently used
+            return cur_data
+        except KeyError:
+            pass
+
+        # find the data point closest to the start of the schedule (first point on a tie)
+        t0        = datetime_to_ns(schedule_timestamps[0])
+        target    = t0 + timedelta_to_ns(sim_offset)
+        start_ind = int(numpy.searchsorted(epochs, target))
+        if start_ind == len(epochs):
+            start_ind -= 1
+        elif (start_ind > 0) and (target - epochs[start_ind-1] <= epochs[start_ind] - target):
+            start_ind -= 1
+        if epochs[start_ind] > t0:
+            start_ind -= 1
+
+        cur_data = values[:, start_ind:start_ind + SSA_PTS_PER_SCHEDULE].copy()
+        cur_data.setflags(write=False)
+        _log.debug("lookup_data: "+self.desc+" sim_offset = "+str(sim_offset)+"; start index = "+str(start_ind))
 
-        #### Find the time window corresponding to the current set of timestamps:
-        # slow!~ could be optimized.
+        self.lookup_cache[key] = cur_data
+        if len(self.lookup_cache) > LOOKUP_CACHE_SIZE:
+            self.lookup_cache.popitem(last=False)
+        return cur_data
 
-        # FOR each element of the database
-        # for each timestamp value
-        # find the difference between all db elements and the timestamp
-        # assign the closest one to that timestamp
-        # this is very inefficient
-        # instead...
-        # 1. I get a timestamp
-        # 2. I round down to the nearest time step
+    ##############################################################################
+    def get_data_arrays(self):
+        """
+        :return: (epochs, values) - self.obj_fcn_data as a sorted numpy array of epoch times, in ns, and a numpy
+        array of data (one row per data column).  Rebuilt, and the lookup_data cache cleared, whenever
+        self.obj_fcn_data is replaced
+        """
+        if (self.data_arrays is None) or (self.data_arrays[0] is not self.obj_fcn_data):
+            self.data_arrays  = (self.obj_fcn_data,
+                                 self.obj_fcn_data.index.asi8,
+                                 numpy.array(self.obj_fcn_data.transpose()))
+            self.lookup_cache = OrderedDict()
+        return self.data_arrays[1], self.data_arrays[2]
 
 
-        ### what am I having problems with?
-        # options -
-        start_ind = numpy.argmin(numpy.abs(self.obj_fcn_data.index - (schedule_timestamps[0] + sim_offset)))
-        if self.obj_fcn_data.index[start_ind] > schedule_timestamps[0]:
-            start_ind -= 1
+    ##############################################################################
+    def obj_fcn_cost(self, profile):
+        return 0.0
 
+    ##############################################################################
+    def obj_fcn_cost_batch(self, profiles):
+        """
+        calculates cost for a batch of candidate profiles.
+        Default implementation calls obj_fcn_cost once per candidate.  Subclasses override with a vectorized version.
+        :param profiles: state_vars-style dictionary.  Time-series entries are (N x SSA_PTS_PER_SCHEDULE) numpy
+        arrays - one row per candidate profile
+        :return: numpy array of N costs
+        """
+        n_profiles = len(profiles["DemandForecast_kW"])
+        return numpy.array([self.obj_fcn_cost({k: v[ii] for k, v in profiles.items()})
+                            for ii in range(n_profiles)])
 
-        cur_data = self.obj_fcn_data.iloc[start_ind:start_ind + SSA_PTS_PER_SCHEDULE]
-        cur_data.index = schedule_timestamps
+    ##############################################################################
+    has_delta_cost = False  # set to True by subclasses that implement delta_cost
+
+    ##############################################################################
+    def init_delta_cost(self, profile):
+        """
+        initializes any running statistics used by delta_cost (e.g., running max).  Called with the reference
+        profile before a sequence of calls to delta_cost.
+        :param profile: state_vars-style dictionary of the reference profile
+        :return: None
+        """
+        pass
 
-        #indices = [numpy.argmin(
-        #    numpy.abs(
-        #        numpy.array([pandas.Timestamp(t).replace(tzinfo=pytz.UTC).to_pydatetime() for t in self.obj_fcn_data.index]) -
-        #        (ts.replace(minute=0, second=0, microsecond=0) + sim_offset))) for ts in schedule_timestamps]
-        pandas.options.display.float_format = '{:,.2f}'.format
-        print(cur_data)
+    ##############################################################################
+    def delta_cost(self, profile, ind, old_val, new_val):
+        """
+        calculates the change in cost when a single point of the reference profile's DemandForecast_kW changes
+        from old_val to new_val.  Subclasses that implement this set has_delta_cost = True.
+        :param profile: state_vars-style dictionary of the reference profile, prior to the change
+        :param ind: index of the point that changed
+        :param old_val: value of DemandForecast_kW[ind] in the reference profile
+        :param new_val: proposed value of DemandForecast_kW[ind]
+        :return: change in cost, in $
+        """
+        return 0.0
 
-        return numpy.array(cur_data.transpose())
-        #numpy.array(self.obj_fcn_data.iloc[indices].transpose())  #obj_fcn_data.loc[offset_ts].interpolate(method='linear')
+    ##############################################################################
+    def update_delta_cost(self, profile, ind, old_val, new_val):
+        """
+        updates running statistics when a change evaluated by delta_cost is accepted.  Called before the
+        reference profile is overwritten.  Arguments are the same as delta_cost.
+        :return: None
+        """
+        pass
 
+    ##############################################################################
+    def compile_cost(self, n_pts):
+        """
+        Prepares a fast version of obj_fcn_cost for the current configuration, for use by
+        SundialResource.calc_cost.  Called after obj_fcn_cfg; anything precomputed here remains valid until
+        obj_fcn_cfg is called again.  The compiled cost of a profile is
+            dot(price, DemandForecast_kW) + compiled_cost(DemandForecast_kW, EnergyAvailableForecast_kWh)
+        :param n_pts: number of points in the profiles to be costed
+        :return: (price, nonlinear) - price is a numpy array of length n_pts, or None if the cost has no
+        component that is linear in demand.  nonlinear is True if compiled_cost must be called.  Returns None if
+        the objective function can't be compiled, in which case obj_fcn_cost is used.
+        """
+        return None
 
     ##############################################################################
-    def obj_fcn_cost(self, profile):
+    def compiled_cost(self, demand, energy):
+        """
+        cost of a profile, excluding the linear component returned by compile_cost.  Uses only values precomputed
+        by compile_cost.
+        :param demand: DemandForecast_kW - numpy array of length n_pts
+        :param energy: EnergyAvailableForecast_kWh - numpy array of length n_pts
+        :return: cost, in $
+        """
         return 0.0
 
     ##############################################################################
     def get_linear_approximation(self, profile):
         return self.obj_fcn_cost(profile)
 
+    ##############################################################################
+    def get_linear_approximation_batch(self, profiles):
+        """
+        batch version of get_linear_approximation (see obj_fcn_cost_batch)
+        :param profiles: state_vars-style dictionary of (N x SSA_PTS_PER_SCHEDULE) numpy arrays
+        :return: numpy array of N values
+        """
+        return self.obj_fcn_cost_batch(profiles)
+
     ##############################################################################
     def get_obj_fcn_data(self):
         return self.init_params["cur_cost"]
@@ -147,6 +360,24 @@ class EnergyCostObjectiveFunction(ObjectiveFunction):
         cost = sum(self.init_params["cur_cost"][0] * profile["DemandForecast_kW"])
         return cost
 
+    ##############################################################################
+    def obj_fcn_cost_batch(self, profiles):
+        return numpy.dot(profiles["DemandForecast_kW"], self.init_params["cur_cost"][0])
+
+    ##############################################################################
+    def compile_cost(self, n_pts):
+        price = numpy.array(self.init_params["cur_cost"][0], dtype=float)
+        if price.shape != (n_pts,):
+            return None
+        return price, False
+
+    ##############################################################################
+    has_delta_cost = True
+
+    ##############################################################################
+    def delta_cost(self, profile, ind, old_val, new_val):
+        return self.init_params["cur_cost"][0][ind] * (new_val - old_val)
+
     ##############################################################################
     def get_obj_fcn_data(self):
         return self.init_params["cur_cost"][0].tolist()
@@ -171,6 +402,24 @@ class ISONECostObjectiveFunction(EnergyCostObjectiveFunction):
 
         return cost
 
+    ##############################################################################
+    def obj_fcn_cost_batch(self, profiles):
+        return numpy.zeros(len(profiles["DemandForecast_kW"])) + self.init_params["cur_cost"][-1]
+
+    ##############################################################################
+    def compile_cost(self, n_pts):
+        self.kernel_cost = self.init_params["cur_cost"][-1]
+        return None, True
+
+    ##############################################################################
+    def compiled_cost(self, demand, energy):
+        return self.kernel_cost
+
+    ##############################################################################
+    def delta_cost(self, profile, ind, old_val, new_val):
+        # cost does not depend on the profile
+        return 0.0
+
 ##############################################################################
 class StoredEnergyValueObjectiveFunction(ObjectiveFunction):
     """
@@ -179,6 +428,8 @@ class StoredEnergyValueObjectiveFunction(ObjectiveFunction):
     def __init__(self, desc="", init_params=None, **kwargs):
         ObjectiveFunction.__init__(self, desc=desc, init_params={}, **kwargs)
         self.init_params["value_per_kWh"] = -0.15
+        self.init_params["ChgEff"]        = 1.0
+        self.init_params["DischgEff"]     = 1.0
 
     def obj_fcn_cost(self, profile):
         end_ind = len(profile["EnergyAvailableForecast_kWh"])-1
@@ -188,6 +439,37 @@ class StoredEnergyValueObjectiveFunction(ObjectiveFunction):
         cost = self.init_params["value_per_kWh"] * profile["EnergyAvailableForecast_kWh"][end_ind]
         return cost
 
+    def obj_fcn_cost_batch(self, profiles):
+        return self.init_params["value_per_kWh"] * profiles["EnergyAvailableForecast_kWh"][:, -1]
+
+    def compile_cost(self, n_pts):
+        self.kernel_value_per_kWh = self.init_params["value_per_kWh"]
+        return None, True
+
+    def compiled_cost(self, demand, energy):
+        return self.kernel_value_per_kWh * energy[-1]
+
+    def obj_fcn_cfg(self, **kwargs):
+        # charge / discharge efficiencies are needed to convert a change in power to a change in stored energy
+        try:
+            self.init_params["ChgEff"]    = kwargs["forecast"]["ChgEff"]
+            self.init_params["DischgEff"] = kwargs["forecast"]["DischgEff"]
+        except:
+            pass
+
+    has_delta_cost = True
+
+    def delta_cost(self, profile, ind, old_val, new_val):
+        """
+        changing power at a single point changes the final stored energy by the change in DeltaEnergy_kWh at
+        that point (see ESSResource.check_constraints2)
+        """
+        if new_val >= 0:
+            new_delta_energy = new_val * self.init_params["ChgEff"]
+        else:
+            new_delta_energy = new_val / self.init_params["DischgEff"]
+        return self.init_params["value_per_kWh"] * (new_delta_energy - profile["DeltaEnergy_kWh"][ind])
+
     def get_obj_fcn_data(self):
         return self.init_params["value_per_kWh"]
 
@@ -203,6 +485,31 @@ class dkWObjectiveFunction(ObjectiveFunction):
     def obj_fcn_cost(self, profile):
         return sum(abs(numpy.ediff1d(profile["DemandForecast_kW"])))*self.init_params["cost_per_dkW"]
 
+    def obj_fcn_cost_batch(self, profiles):
+        return numpy.abs(numpy.diff(profiles["DemandForecast_kW"], axis=1)).sum(axis=1)*self.init_params["cost_per_dkW"]
+
+    def compile_cost(self, n_pts):
+        self.kernel_cost_per_dkW = self.init_params["cost_per_dkW"]
+        self.kernel_scratch      = numpy.zeros(max(n_pts-1, 0))
+        return None, True
+
+    def compiled_cost(self, demand, energy):
+        numpy.subtract(demand[1:], demand[:-1], out=self.kernel_scratch)
+        numpy.absolute(self.kernel_scratch, out=self.kernel_scratch)
+        return self.kernel_scratch.sum()*self.kernel_cost_per_dkW
+
+    has_delta_cost = True
+
+    def delta_cost(self, profile, ind, old_val, new_val):
+        # only the steps to the two neighbors of ind change
+        demand = profile["DemandForecast_kW"]
+        delta = 0.0
+        if ind > 0:
+            delta += abs(new_val - demand[ind-1]) - abs(old_val - demand[ind-1])
+        if ind < len(demand)-1:
+            delta += abs(new_val - demand[ind+1]) - abs(old_val - demand[ind+1])
+        return delta * self.init_params["cost_per_dkW"]
+
     def get_obj_fcn_data(self):
         return self.init_params["cost_per_dkW"]
 
@@ -250,12 +557,91 @@ class DemandChargeObjectiveFunction(ObjectiveFunction):
         #demand = numpy.array(profile)
 
         max_demand = max(profile["DemandForecast_kW"])
+        return self.get_demand_charge(max_demand)
+
+    ##############################################################################
+    def get_demand_charge(self, max_demand):
+        """
+        :param max_demand: peak demand over the schedule, in kW
+        :return: demand charge for the given peak, in $
+        """
         if max_demand > self.init_params["threshold"]*(1-self.init_params["safety_buffer"]): #self.threshold:
             cost = self.init_params["cost_per_kW"] * (max_demand - self.init_params["threshold"])
         else:
             cost = 0.0
         return cost
 
+    ##############################################################################
+    def compile_cost(self, n_pts):
+        self.kernel_limit       = self.init_params["threshold"]*(1-self.init_params["safety_buffer"])
+        self.kernel_threshold   = self.init_params["threshold"]
+        self.kernel_cost_per_kW = self.init_params["cost_per_kW"]
+        return None, True
+
+    ##############################################################################
+    def compiled_cost(self, demand, energy):
+        max_demand = demand.max()
+        if max_demand > self.kernel_limit:
+            return self.kernel_cost_per_kW * (max_demand - self.kernel_threshold)
+        return 0.0
+
+    ##############################################################################
+    def obj_fcn_cost_batch(self, profiles):
+        max_demand = profiles["DemandForecast_kW"].max(axis=1)
+        return numpy.where(max_demand > self.init_params["threshold"]*(1-self.init_params["safety_buffer"]),
+                           self.init_params["cost_per_kW"] * (max_demand - self.init_params["threshold"]),
+                           0.0)
+
+    ##############################################################################
+    has_delta_cost = True
+
+    ##############################################################################
+    def init_delta_cost(self, profile):
+        """
+        keeps a running max (and its index) and second max of the reference profile, so that the peak after a
+        single-point change can be found without scanning the profile
+        """
+        demand = numpy.asarray(profile["DemandForecast_kW"])
+        max_ind = int(numpy.argmax(demand))
+        if len(demand) > 1:
+            second_max = max(numpy.max(demand[:max_ind]) if max_ind > 0 else -numpy.inf,
+                             numpy.max(demand[max_ind+1:]) if max_ind < len(demand)-1 else -numpy.inf)
+        else:
+            second_max = -numpy.inf
+        self.running_max = [demand[max_ind], max_ind, second_max]
+
+    ##############################################################################
+    def delta_cost(self, profile, ind, old_val, new_val):
+        max_demand, max_ind, second_max = self.running_max
+        if new_val >= max_demand:
+            new_max_demand = new_val
+        elif ind == max_ind:
+            new_max_demand = max(second_max, new_val)
+        else:
+            return 0.0
+        return self.get_demand_charge(new_max_demand) - self.get_demand_charge(max_demand)
+
+    ##############################################################################
+    def update_delta_cost(self, profile, ind, old_val, new_val):
+        max_demand, max_ind, second_max = self.running_max
+        if ind == max_ind:
+            if new_val >= second_max:
+                self.running_max[0] = new_val
+                return
+        elif new_val > max_demand:
+            self.running_max = [new_val, ind, max_demand]
+            return
+        elif new_val > second_max:
+            self.running_max[2] = new_val
+            return
+        elif old_val < second_max:
+            return
+
+        # peak or second highest point decreased - rescan
+        demand = numpy.array(profile["DemandForecast_kW"])
+        demand[ind] = new_val
+        self.init_delta_cost({"DemandForecast_kW": demand})
+
     ##############################################################################
     def get_linear_approximation(self, profile):
         """
@@ -275,48 +661,165 @@ class DemandChargeObjectiveFunction(ObjectiveFunction):
 
         return imputed_cost_per_kWh
 
+    ##############################################################################
+    def get_linear_approximation_batch(self, profiles):
+        energy_above_threshold = numpy.maximum(profiles["DemandForecast_kW"]-self.init_params["threshold"], 0.0).sum(axis=1)
+        cost = self.obj_fcn_cost_batch(profiles)
+        return numpy.where(cost == 0, 0.0, energy_above_threshold / numpy.where(cost == 0, 1.0, cost))
+
 
     ##############################################################################
     def get_obj_fcn_data(self):
         return self.init_params["threshold"]
 
 ##############################################################################
-class TieredEnergyObjectiveFunction():
+def check_tiers(params, keys):
     """
-    placeholder for a function that calculates a demand charge for a given net demand profile
-    :return: cost of executing the profile, in $
+    checks that the tier lists in params (e.g., thresholds and rates) are the same length
+    :param params: dictionary of tier lists
+    :param keys: keys of the tier lists in params
+    :return: None.  Raises ValueError if the lengths differ
     """
+    lengths = [len(params[k]) for k in keys]
+    if len(set(lengths)) > 1:
+        raise ValueError(", ".join([k+" has "+str(n)+" tiers" for (k, n) in zip(keys, lengths)]))
+
+
+##############################################################################
+def update_tariff(obj_fcn, keys, tariffs):
+    """
+    overrides the tier lists of a tiered objective function (e.g., TieredEnergyObjectiveFunction) with any that are
+    given in tariffs, then rebuilds its tariff with init_tariff.  If the resulting tier lists are not the same length,
+    the override is rejected and the current tariff is kept.
+    :param obj_fcn: objective function instance, with tier lists in obj_fcn.init_params
+    :param keys: keys of the tier lists
+    :param tariffs: tariff dictionary, or None
+    :return: None
+    """
+    params = {k: obj_fcn.init_params[k] for k in keys}
+    for k in keys:
+        try:
+            params[k] = tariffs[k]
+        except (KeyError, TypeError):
+            pass
+    try:
+        check_tiers(params, keys)
+    except ValueError as e:
+        _log.warning(obj_fcn.desc+": ignoring tariff - "+str(e))
+        return
+    obj_fcn.init_params.update(params)
+    obj_fcn.init_tariff()
+
+
+##############################################################################
+class PiecewiseLinearFunction():
+    """
+    Piecewise-linear function of demand, used by tiered tariffs:
+        f(x) = offsets[k] + slopes[k] * x, where k = the number of breakpoints <= x
+    i.e., segment 0 lies below breakpoints[0], and segment k lies between breakpoints[k-1] and breakpoints[k].
+    Segments are not required to be continuous.
+    """
+
     ##############################################################################
-    def __init__(self, desc):
-        # fname, schedule_timestamps, sim_offset=timedelta(0)
-        pass
+    def __init__(self, breakpoints, slopes, offsets):
+        """
+        :param breakpoints: list of n breakpoints, in ascending order
+        :param slopes: list of n+1 slopes, one per segment
+        :param offsets: list of n+1 offsets, one per segment
+        """
+        self.breakpoints = numpy.array(breakpoints, dtype=float)
+        self.slopes      = numpy.array(slopes, dtype=float)
+        self.offsets     = numpy.array(offsets, dtype=float)
+
+        # python lists, for evaluating single points without numpy overhead
+        self.breakpoint_list = self.breakpoints.tolist()
+        self.slope_list      = self.slopes.tolist()
+        self.offset_list     = self.offsets.tolist()
+
+    ##############################################################################
+    def evaluate(self, x):
+        """
+        :param x: numpy array of any shape (e.g., a profile, or an N x T batch of profiles)
+        :return: f(x), element-wise, same shape as x
+        """
+        k = numpy.searchsorted(self.breakpoints, x, side='right')
+        return self.offsets[k] + self.slopes[k] * x
+
+    ##############################################################################
+    def evaluate_point(self, x):
+        """
+        :param x: scalar
+        :return: f(x)
+        """
+        k = bisect_right(self.breakpoint_list, x)
+        return self.offset_list[k] + self.slope_list[k] * x
+
+
+##############################################################################
+class TieredEnergyObjectiveFunction(ObjectiveFunction):
+    """
+    Tiered tariff on demand.  At each time step, each tier k adds rates[k] $/kW for demand in excess of
+    thresholds[k], i.e., cost = sum over time steps and tiers of rates[k] * max(demand - thresholds[k], 0).
+    The marginal price in a tier is therefore the sum of the rates of all tiers at or below it.
+    thresholds and rates are set through keyword arguments to the constructor, and may be overridden at each
+    optimization pass through the tariff dictionary identified by tariff_key (see obj_fcn_cfg).  The tariff is
+    evaluated as a piecewise-linear function over the whole profile (see PiecewiseLinearFunction).
+    """
+    ##############################################################################
+    def __init__(self, desc="", init_params=None, **kwargs):
+        defaults = {'thresholds': [0.0, 50.0, 100.0, 150.0, 200.0, 250.0, 400.0],
+                    'rates': [1.0, 3.0, 5.0, 10.0, 25.0, 50.0, 100.0],
+                    'tariff_key': 'tariffs'}
+        if init_params is not None:
+            defaults.update(init_params)
+        ObjectiveFunction.__init__(self, desc=desc, init_params=defaults, **kwargs)
+        self.init_tariff()
 
+    ##############################################################################
+    def obj_fcn_cfg(self, **kwargs):
+        update_tariff(self, ['thresholds', 'rates'], self.get_tariffs(kwargs))
+
+    ##############################################################################
+    def init_tariff(self):
+        """
+        converts tiers to a piecewise-linear function of demand.  Above threshold k, the slope is the sum of the
+        rates of tiers 0..k, and the offset is -sum(rates[0..k] * thresholds[0..k])
+        :return: None
+        """
+        check_tiers(self.init_params, ['thresholds', 'rates'])
+        tiers      = sorted(zip(self.init_params["thresholds"], self.init_params["rates"]))
+        thresholds = numpy.array([t[0] for t in tiers], dtype=float)
+        rates      = numpy.array([t[1] for t in tiers], dtype=float)
+        self.tariff = PiecewiseLinearFunction(thresholds,
+                                              numpy.concatenate(([0.0], numpy.cumsum(rates))),
+                                              numpy.concatenate(([0.0], -numpy.cumsum(rates * thresholds))))
 
     ##############################################################################
     def obj_fcn_cost(self, profile):
+        return self.tariff.evaluate(profile["DemandForecast_kW"]).sum()
 
-        max_bf = max(profile["DemandForecast_kW"])
+    ##############################################################################
+    def obj_fcn_cost_batch(self, profiles):
+        return self.tariff.evaluate(profiles["DemandForecast_kW"]).sum(axis=1)
 
-        # tier at 200, 100, 10
-        cost = 0.0
-        for p in profile["DemandForecast_kW"]:
-            cost += max(p - 400.0, 0) * 100.0
-            cost += max(p - 250.0, 0) * 50.0
-            cost += max(p - 200.0, 0) * 25.0
-            cost += max(p - 150.0, 0) * 10.0
-            cost += max(p - 100.0, 0) * 5.0
-            cost += max(p - 50.0, 0) * 3.0
-            cost += max(p, 0.0) * 1.0
+    ##############################################################################
+    def compile_cost(self, n_pts):
+        return None, True
 
-            #if p > 0:
-            #    cost += p*p
+    ##############################################################################
+    def compiled_cost(self, demand, energy):
+        return self.tariff.evaluate(demand).sum()
 
+    ##############################################################################
+    has_delta_cost = True
 
-        # if max_bf < 0: #self.demand_threshold:
-        #    cost = self.demand_cost_per_kW*(-1*max_bf)
-        # else:
-        #    cost = 0
-        return cost
+    ##############################################################################
+    def delta_cost(self, profile, ind, old_val, new_val):
+        return self.tariff.evaluate_point(new_val) - self.tariff.evaluate_point(old_val)
+
+    ##############################################################################
+    def get_obj_fcn_data(self):
+        return {"thresholds": self.init_params["thresholds"], "rates": self.init_params["rates"]}
 
 ##############################################################################
 class LoadShapeObjectiveFunction(ObjectiveFunction):
@@ -358,6 +861,46 @@ class LoadShapeObjectiveFunction(ObjectiveFunction):
 
         return self.cost
 
+    ##############################################################################
+    def obj_fcn_cost_batch(self, profiles):
+        err = (profiles["DemandForecast_kW"] - self.init_params["cur_cost"][0]) ** 2
+        if self.init_params["vble_price"] == False:
+            return err.sum(axis=1) * 10.0
+        else:
+            return (err * self.init_params["cur_cost"][1]).sum(axis=1)
+
+    ##############################################################################
+    def compile_cost(self, n_pts):
+        self.kernel_target  = numpy.array(self.init_params["cur_cost"][0], dtype=float)
+        self.kernel_scratch = numpy.zeros(n_pts)
+        if self.init_params["vble_price"] == False:
+            self.kernel_price = None
+        else:
+            self.kernel_price = numpy.array(self.init_params["cur_cost"][1], dtype=float)
+        if self.kernel_target.shape != (n_pts,):
+            return None
+        return None, True
+
+    ##############################################################################
+    def compiled_cost(self, demand, energy):
+        numpy.subtract(demand, self.kernel_target, out=self.kernel_scratch)
+        numpy.multiply(self.kernel_scratch, self.kernel_scratch, out=self.kernel_scratch)
+        if self.kernel_price is None:
+            return self.kernel_scratch.sum() * 10.0
+        return numpy.dot(self.kernel_scratch, self.kernel_price)
+
+    ##############################################################################
+    has_delta_cost = True
+
+    ##############################################################################
+    def delta_cost(self, profile, ind, old_val, new_val):
+        target = self.init_params["cur_cost"][0][ind]
+        if self.init_params["vble_price"] == False:
+            price = 10.0
+        else:
+            price = self.init_params["cur_cost"][1][ind]
+        return price * ((new_val - target) ** 2 - (old_val - target) ** 2)
+
     ##############################################################################
     def get_obj_fcn_data(self):
         return self.init_params["cur_cost"][0].tolist()
@@ -367,35 +910,63 @@ class BatteryLossModelObjectiveFunction(ObjectiveFunction):
     ## place holder that corrects for efficiency as a function of battery chg / discharge rate
     ## this might not make sense - it's more correct to address by actually calculating losses
     ## but might have a speed impact. Numbers are made up at this point.
+    """
+    Charges a loss, in $/kW, that depends on the charge rate.  At each time step with charge power p > 0,
+    cost = p * loss_rates[k], where k is the highest tier with thresholds[k] <= p.  Discharge is not charged.
+    thresholds and loss_rates are set through keyword arguments to the constructor, and may be overridden at each
+    optimization pass through the tariff dictionary identified by tariff_key.  Evaluated as a piecewise-linear
+    function over the whole profile (see PiecewiseLinearFunction).
+    """
 
     ##############################################################################
     def __init__(self, desc="", init_params=None, **kwargs):
-        ObjectiveFunction.__init__(self, desc=desc, init_params={}, **kwargs)
+        defaults = {'thresholds': [0.0, 20.0, 50.0, 100.0, 200.0, 300.0],
+                    'loss_rates': [0.1, 0.05, 0.025, 0.015, 0.01, 0.0],
+                    'tariff_key': 'tariffs'}
+        if init_params is not None:
+            defaults.update(init_params)
+        ObjectiveFunction.__init__(self, desc=desc, init_params=defaults, **kwargs)
+        self.init_tariff()
 
     ##############################################################################
     def obj_fcn_cfg(self, **kwargs):
-        pass
+        update_tariff(self, ['thresholds', 'loss_rates'], self.get_tariffs(kwargs))
+
+    ##############################################################################
+    def init_tariff(self):
+        """
+        converts loss tiers to a piecewise-linear function of charge power - each segment passes through the origin
+        :return: None
+        """
+        check_tiers(self.init_params, ['thresholds', 'loss_rates'])
+        tiers = sorted(zip(self.init_params["thresholds"], self.init_params["loss_rates"]))
+        self.tariff = PiecewiseLinearFunction([t[0] for t in tiers],
+                                              [0.0] + [t[1] for t in tiers],
+                                              [0.0] * (len(tiers) + 1))
 
     ##############################################################################
     def obj_fcn_cost(self, profile):
-        cost = 0.0
-
-        for ii in (0,len(profile["DemandForecast_kW"])-1):
-            if profile["DemandForecast_kW"][ii] > 0.0:
-                if profile["DemandForecast_kW"][ii] < 20.0:
-                    cost += profile["DemandForecast_kW"][ii] * 0.1
-                elif profile["DemandForecast_kW"][ii] < 50.0:
-                    cost += profile["DemandForecast_kW"][ii] * 0.05
-                elif profile["DemandForecast_kW"][ii] < 100.0:
-                    cost += profile["DemandForecast_kW"][ii] * 0.025
-                elif profile["DemandForecast_kW"][ii] < 200.0:
-                    cost += profile["DemandForecast_kW"][ii] * 0.015
-                elif profile["DemandForecast_kW"][ii] < 300.0:
-                    cost += profile["DemandForecast_kW"][ii] * 0.01
-                elif profile["DemandForecast_kW"][ii] >= 300.0:
-                    cost += profile["DemandForecast_kW"][ii] * 0.0
-        return cost
+        return self.tariff.evaluate(profile["DemandForecast_kW"]).sum()
+
+    ##############################################################################
+    def obj_fcn_cost_batch(self, profiles):
+        return self.tariff.evaluate(profiles["DemandForecast_kW"]).sum(axis=1)
+
+    ##############################################################################
+    def compile_cost(self, n_pts):
+        return None, True
+
+    ##############################################################################
+    def compiled_cost(self, demand, energy):
+        return self.tariff.evaluate(demand).sum()
+
+    ##############################################################################
+    has_delta_cost = True
+
+    ##############################################################################
+    def delta_cost(self, profile, ind, old_val, new_val):
+        return self.tariff.evaluate_point(new_val) - self.tariff.evaluate_point(old_val)
 
     ##############################################################################
     def get_obj_fcn_data(self):
-        pass
+        return {"thresholds": self.init_params["thresholds"], "loss_rates": self.init_params["loss_rates"]}
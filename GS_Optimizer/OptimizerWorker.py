@@ -0,0 +1,250 @@
+# Copyright (c) 2018, The Fraunhofer Center for Sustainable Energy
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in
+#    the documentation and/or other materials provided with the
+#    distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This material was prepared as an account of work sponsored by an agency
+# of the United States Government.  Neither the United States Government
+# nor any agency thereof, nor Fraunhofer, nor any of their employees,
+# makes any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness of any
+# information, apparatus, product, or process disclosed, or represents
+# that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or service
+# by trade name, trademark, manufacturer, or otherwise does not necessarily
+# constitute or imply its endorsement, recommendation, or favoring by the
+# United States Government or any agency thereof, or Fraunhofer.  The
+# views and opinions of authors expressed herein do not necessarily state
+# or reflect those of the United States Government or any agency thereof.
+
+"""
+Runs optimization passes for the Executive in a separate python interpreter, so that the Executive's event loop
+(ESS regulation, site status polling, heartbeats) keeps running while the optimizer runs.
+
+The worker is a new interpreter, started with subprocess - it is not forked from the Executive, so it does not
+inherit the Executive's gevent hub, ZMQ sockets, threads or locks.  It receives a small snapshot of the system rather
+than the SundialResource tree itself: the system configuration and GS start time, from which it rebuilds the tree
+(including objective functions), and each node's state_vars, schedule_vars and objective function parameters (see
+get_tree_state).  The snapshot, the optimizer and the tariffs are passed in a pickle file; the schedules it generates
+are returned the same way.
+
+Usage:
+    worker = OptimizerWorker(cfg_list, gs_start_time, sundial_resources, optimizer, tariffs, timestamps, search_load_shift)
+    ...
+    if worker.poll() == True:  # does not block
+        result = worker.get_result()
+"""
+import os
+import sys
+import shutil
+import subprocess
+import tempfile
+import traceback
+import cPickle
+import logging
+from SunDialResource import SundialSystemResource
+from gs_identities import *
+
+_log = logging.getLogger("OptimizerWorker")
+
+
+##############################################################################
+def run_optimizer_pass(optimizer, sundial_resources, tariffs, schedule_timestamps, search_load_shift):
+    """
+    Runs a single optimization pass and exports the resulting schedule to sundial_resources.schedule_vars.  Called by
+    ExecutiveAgent.run_optimizer, either in process or in a worker process (see OptimizerWorker)
+    :param optimizer: optimizer instance (SimulatedAnnealer or DPOptimizer)
+    :param sundial_resources: top node in sundial resource tree, with forecasts interpolated to schedule_timestamps
+    :param tariffs: tariff data passed to SundialResource.cfg_cost
+    :param schedule_timestamps: list of timestamps (length = SSA_PTS_PER_SCHEDULE)
+    :param search_load_shift: True = search all load shift options; False = search a single option
+    :return: None
+    """
+    ## queue up time-differentiated cost data
+    _log.info("THESE ARE THE TARIFFS: {}".format(tariffs))
+    sundial_resources.cfg_cost(schedule_timestamps,
+                               tariffs = tariffs)
+                               # system_tariff = tariffs)
+
+    if search_load_shift == True:
+        _log.info("*** New Optimization Pass: New load options pending - Search Multiple!! ****")
+        optimizer.search_load_shift_options(sundial_resources,
+                                            sundial_resources.find_resource_type("LoadShiftCtrlNode")[0],
+                                            schedule_timestamps) # SSA optimization - search load shift space
+    else:
+        if SEARCH_LOADSHIFT_OPTIONS == True:
+            _log.info("*** New Optimization Pass: No New load options pending! ****")
+        else:
+            _log.info("*** New Optimization Pass: Load Shift disabled! ****")
+        optimizer.search_single_option(sundial_resources,
+                                       schedule_timestamps)  # SSA optimization - single pass
+
+
+##############################################################################
+def get_tree_state(sundial_resources):
+    """
+    :param sundial_resources: top node in a sundial resource tree
+    :return: dictionary of (state_vars, schedule_vars, init_params), keyed by resource_id, for every node in the
+    tree.  init_params is a list of the init_params of the node's objective functions, in order - it carries tariff
+    settings that are not passed to every cfg_cost call
+    """
+    return {resource_id: (resource.state_vars,
+                          resource.schedule_vars,
+                          [obj_fcn.init_params for obj_fcn in resource.obj_fcns])
+            for resource_id, resource in sundial_resources.resource_index.items()}
+
+
+##############################################################################
+def set_tree_state(sundial_resources, state):
+    """
+    restores state previously returned by get_tree_state to a tree built from the same configuration
+    :param sundial_resources: top node in a sundial resource tree
+    :param state: see get_tree_state
+    :return: None
+    """
+    for resource_id, (state_vars, schedule_vars, init_params) in state.items():
+        resource = sundial_resources.find_resource(resource_id)
+        resource.state_vars.update(state_vars)
+        resource.schedule_vars.update(schedule_vars)
+        for obj_fcn, params in zip(resource.obj_fcns, init_params):
+            obj_fcn.init_params.update(params)
+
+
+##############################################################################
+class OptimizerWorker():
+    """
+    Handle for an optimization pass running in a worker process (see module docstring)
+    """
+
+    ##############################################################################
+    def __init__(self, sundial_resource_cfg_list, gs_start_time, sundial_resources, optimizer, tariffs,
+                 schedule_timestamps, search_load_shift):
+        """
+        Writes the snapshot and starts the worker.  The snapshot is taken here, so changes made to sundial_resources,
+        optimizer or tariffs while the worker runs do not affect the pass.
+        :param sundial_resource_cfg_list: system configuration that sundial_resources was built from
+        :param gs_start_time: GS start time that sundial_resources was built with (see SundialSystemResource)
+        :param sundial_resources: top node in sundial resource tree, with forecasts interpolated to schedule_timestamps
+        :param optimizer: optimizer instance (SimulatedAnnealer or DPOptimizer)
+        :param tariffs: tariff data passed to SundialResource.cfg_cost
+        :param schedule_timestamps: list of timestamps (length = SSA_PTS_PER_SCHEDULE)
+        :param search_load_shift: True = search all load shift options; False = search a single option
+        """
+        self.work_dir     = tempfile.mkdtemp(prefix="optimizer_worker_")
+        self.payload_file = os.path.join(self.work_dir, "payload.pkl")
+        self.result_file  = os.path.join(self.work_dir, "result.pkl")
+        with open(self.payload_file, "wb") as f:
+            cPickle.dump((sundial_resource_cfg_list,
+                          gs_start_time,
+                          get_tree_state(sundial_resources),
+                          optimizer,
+                          tariffs,
+                          schedule_timestamps,
+                          search_load_shift), f, cPickle.HIGHEST_PROTOCOL)
+
+        env = dict(os.environ)
+        env["PYTHONPATH"] = os.pathsep.join([path for path in sys.path if path != ""])
+        self.process = subprocess.Popen([sys.executable,
+                                         os.path.splitext(os.path.abspath(__file__))[0]+".py",
+                                         self.payload_file,
+                                         self.result_file],
+                                        close_fds=True,
+                                        env=env)
+        self.pid = self.process.pid
+
+    ##############################################################################
+    def poll(self):
+        """
+        :return: True if the worker has exited, False if it is still running.  Does not block
+        """
+        return self.process.poll() is not None
+
+    ##############################################################################
+    def get_result(self):
+        """
+        Reads the result of a finished pass and removes the worker's files.  Call once poll() returns True.
+        :return: (schedules, stop_reason, n_iterations_used) - schedules is a dictionary of schedule_vars keyed by
+        resource_id - or None if the pass failed
+        """
+        result = None
+        try:
+            if self.process.returncode == 0:
+                with open(self.result_file, "rb") as f:
+                    result = cPickle.load(f)
+            else:
+                _log.error("Optimizer worker "+str(self.pid)+" exited with code "+str(self.process.returncode))
+        except (IOError, OSError, EOFError, cPickle.UnpicklingError) as e:
+            _log.error("Unable to read optimizer worker result: "+str(e))
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+        return result
+
+    ##############################################################################
+    def terminate(self):
+        """
+        Stops the worker, if it is still running, and removes its files.  Its result is discarded
+        :return: None
+        """
+        if self.process.poll() is None:
+            self.process.terminate()
+            self.process.wait()
+        shutil.rmtree(self.work_dir, ignore_errors=True)
+
+
+##############################################################################
+def main(payload_file, result_file):
+    """
+    Worker entry point.  Rebuilds the sundial resource tree from the snapshot in payload_file, runs an optimization
+    pass, and writes (schedules, stop_reason, n_iterations_used) to result_file (see OptimizerWorker.get_result)
+    :return: exit code - 0 if the pass completed
+    """
+    try:
+        with open(payload_file, "rb") as f:
+            (sundial_resource_cfg_list, gs_start_time, state, optimizer, tariffs,
+             schedule_timestamps, search_load_shift) = cPickle.load(f)
+
+        sundial_resources = SundialSystemResource(sundial_resource_cfg_list, gs_start_time)
+        set_tree_state(sundial_resources, state)
+
+        run_optimizer_pass(optimizer, sundial_resources, tariffs, schedule_timestamps, search_load_shift)
+        schedules = {resource_id: resource.schedule_vars
+                     for resource_id, resource in sundial_resources.resource_index.items()}
+
+        # written to a temporary file, then renamed, so that a partially written result is never read
+        with open(result_file+".tmp", "wb") as f:
+            cPickle.dump((schedules, optimizer.stop_reason, optimizer.n_iterations_used), f,
+                         cPickle.HIGHEST_PROTOCOL)
+        os.rename(result_file+".tmp", result_file)
+    except Exception:
+        _log.error("Optimizer worker failed: "+traceback.format_exc())
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s %(name)s %(levelname)s: %(message)s")
+    sys.exit(main(sys.argv[1], sys.argv[2]))
@@ -0,0 +1,117 @@
+# Copyright (c) 2018, The Fraunhofer Center for Sustainable Energy
+# All rights reserved.
+#
+# Redistribution and use in source and binary forms, with or without
+# modification, are permitted provided that the following conditions
+# are met:
+#
+# 1. Redistributions of source code must retain the above copyright
+#    notice, this list of conditions and the following disclaimer.
+# 2. Redistributions in binary form must reproduce the above copyright
+#    notice, this list of conditions and the following disclaimer in
+#    the documentation and/or other materials provided with the
+#    distribution.
+# 3. Neither the name of the copyright holder nor the names of its
+#    contributors may be used to endorse or promote products derived
+#    from this software without specific prior written permission.
+#
+# THIS SOFTWARE IS PROVIDED BY THE COPYRIGHT HOLDERS AND CONTRIBUTORS
+# "AS IS" AND ANY EXPRESS OR IMPLIED WARRANTIES, INCLUDING, BUT NOT
+# LIMITED TO, THE IMPLIED WARRANTIES OF MERCHANTABILITY AND FITNESS FOR
+# A PARTICULAR PURPOSE ARE DISCLAIMED. IN NO EVENT SHALL THE COPYRIGHT
+# HOLDER OR CONTRIBUTORS BE LIABLE FOR ANY DIRECT, INDIRECT, INCIDENTAL,
+# SPECIAL, EXEMPLARY, OR CONSEQUENTIAL DAMAGES (INCLUDING, BUT NOT
+# LIMITED TO, PROCUREMENT OF SUBSTITUTE GOODS OR SERVICES; LOSS OF USE,
+# DATA, OR PROFITS; OR BUSINESS INTERRUPTION) HOWEVER CAUSED AND ON ANY
+# THEORY OF LIABILITY, WHETHER IN CONTRACT, STRICT LIABILITY, OR TORT
+# (INCLUDING NEGLIGENCE OR OTHERWISE) ARISING IN ANY WAY OUT OF THE USE
+# OF THIS SOFTWARE, EVEN IF ADVISED OF THE POSSIBILITY OF SUCH DAMAGE.
+#
+# This material was prepared as an account of work sponsored by an agency
+# of the United States Government.  Neither the United States Government
+# nor any agency thereof, nor Fraunhofer, nor any of their employees,
+# makes any warranty, express or implied, or assumes any legal liability
+# or responsibility for the accuracy, completeness, or usefulness of any
+# information, apparatus, product, or process disclosed, or represents
+# that its use would not infringe privately owned rights.
+#
+# Reference herein to any specific commercial product, process, or service
+# by trade name, trademark, manufacturer, or otherwise does not necessarily
+# constitute or imply its endorsement, recommendation, or favoring by the
+# United States Government or any agency thereof, or Fraunhofer.  The
+# views and opinions of authors expressed herein do not necessarily state
+# or reflect those of the United States Government or any agency thereof.
+
+
+"""
+Vectorized ESS state of energy (SOE) projection.
+
+project_soe applies an ESS's power and SOE limits to a whole power profile - or a batch of N profiles - at once.  It
+gives the same result as stepping through the profile in time order with ESSResource.update_soe: each charge command
+is limited so that the SOE does not exceed max_soe, and each discharge command so that it does not drop below
+min_soe.  A time step therefore maps the SOE at the start of the step, x, to clamp(x + d, lo, hi), where d is the
+(power-limited) requested change in energy and (lo, hi) = (-inf, max_soe) when charging, (min_soe, +inf) when
+discharging.  Clamp functions of this form are closed under composition, so the SOE at every time step is found with
+a log2(T)-step parallel prefix scan over the per-step (d, lo, hi) triples instead of a python loop over T.
+"""
+import numpy
+
+
+##############################################################################
+def project_soe(pwr_request, start_soe, max_soe, min_soe, max_chg_pwr, max_dischg_pwr, chg_eff, dischg_eff,
+                t_resolution_hr):
+    """
+    Returns the feasible power, energy and delta energy profiles for a requested ESS power profile.
+    :param pwr_request: requested power, in kW (> 0 = charge).  Array of length T, or an N x T array of profiles
+    :param start_soe: SOE at the start of the profile, in kWh.  Scalar, or length N for an N x T pwr_request
+    :param max_soe: upper SOE limit, in kWh
+    :param min_soe: lower SOE limit, in kWh
+    :param max_chg_pwr: maximum charge power, in kW
+    :param max_dischg_pwr: maximum discharge power, in kW (positive number)
+    :param chg_eff: charge efficiency
+    :param dischg_eff: discharge efficiency
+    :param t_resolution_hr: duration of each time step, in hours
+    :return: pwr_cmd - power- and energy-limited power command, in kW
+    :return: energy - SOE at the end of each time step, in kWh
+    :return: delta_energy - change in SOE over each time step, in kWh
+    """
+    pwr_request = numpy.asarray(pwr_request, dtype=float)
+    chg         = pwr_request > 0.0
+    pwr         = numpy.clip(pwr_request, -1.0*max_dischg_pwr, max_chg_pwr)
+
+    # per-step clamp functions x -> clamp(x + d, lo, hi)
+    d0 = numpy.where(chg, pwr * t_resolution_hr * chg_eff, pwr * t_resolution_hr / dischg_eff)
+    d  = d0.copy()
+    lo = numpy.where(chg, -numpy.inf, float(min_soe))
+    hi = numpy.where(chg, float(max_soe), numpy.inf)
+
+    # inclusive prefix scan (Hillis-Steele).  After the pass with offset k, step t holds the composition of steps
+    # max(0, t-2k+1)..t.  Composing f then g: clamp(clamp(x+a, l1, h1)+b, l2, h2) = clamp(x+a+b, l, h), where
+    # l = clamp(l1+b, l2, h2), h = clamp(h1+b, l2, h2)
+    n_pts = d.shape[-1]
+    k = 1
+    while k < n_pts:
+        b  = d[..., k:]
+        l2 = lo[..., k:]
+        h2 = hi[..., k:]
+        new_lo = numpy.minimum(numpy.maximum(lo[..., :-k] + b, l2), h2)
+        new_hi = numpy.minimum(numpy.maximum(hi[..., :-k] + b, l2), h2)
+        d[..., k:] = d[..., :-k] + b
+        lo[..., k:] = new_lo
+        hi[..., k:] = new_hi
+        k *= 2
+
+    start_soe = numpy.asarray(start_soe, dtype=float)
+    if start_soe.ndim > 0:
+        start_soe = start_soe[..., numpy.newaxis]
+    energy = numpy.minimum(numpy.maximum(start_soe + d, lo), hi)
+
+    delta_energy = numpy.diff(energy, axis=-1)
+    delta_energy = numpy.concatenate((energy[..., :1] - start_soe, delta_energy), axis=-1)
+    # steps that were not energy-limited keep the power-limited command exactly, without round off
+    pwr_cmd      = numpy.where(numpy.isclose(delta_energy, d0, rtol=1e-12, atol=1e-9),
+                               pwr,
+                               numpy.where(chg, delta_energy / (t_resolution_hr * chg_eff), delta_energy * dischg_eff / t_resolution_hr))
+
+    return pwr_cmd, energy, delta_energy
+
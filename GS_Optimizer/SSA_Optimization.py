@@ -42,16 +42,19 @@
 # views and opinions of authors expressed herein do not necessarily state
 # or reflect those of the United States Government or any agency thereof.
 
-from math import floor, exp
+from math import floor, ceil, exp
 import copy
 import json
 import csv
 import sys
+import cPickle
+import multiprocessing
 import pytz
 import numpy
 import pandas
 from random import *
-from SunDialResource import SundialSystemResource, SundialResource, SundialResourceProfile, export_schedule
+from SunDialResource import SundialSystemResource, SundialResource, SundialResourceProfile, FlatProfileTree, export_schedule
+from MoveKernels import MOVE_KERNELS
 from datetime import datetime, timedelta
 import logging
 from gs_identities import *
@@ -61,6 +64,77 @@ _log = logging.getLogger("SSA")
 
 MINUTES_PER_HR = 60
 
+############################
+class ConvergenceMonitor():
+    """
+    Decides when an SSA pass can stop before its iteration budget is used up.  The SSA loop reports the cost of its
+    solution and the number of accepted / tested moves at the end of each temperature step, and periodically asks
+    whether a deadline has passed.  A pass stops when:
+    - "converged" - the cost at the end of the last n_temp_steps temperature steps has stayed within rel_epsilon
+      (relative) of the cost at the start of that window - i.e., no significant improvement, and the chain is no
+      longer wandering
+    - "frozen" - the fraction of moves accepted during a temperature step is below min_accept_ratio
+    - "deadline" - datetime.utcnow() is later than deadline
+    stop_reason is "iterations" if the pass ran to completion.
+    """
+
+    ############################
+    def __init__(self, rel_epsilon, n_temp_steps, min_accept_ratio, deadline=None):
+        """
+        :param rel_epsilon: relative change in cost that counts as an improvement.  None = disable "converged"
+        :param n_temp_steps: number of temperature steps without improvement before stopping
+        :param min_accept_ratio: minimum fraction of moves accepted per temperature step.  None = disable "frozen"
+        :param deadline: naive UTC datetime by which the pass must finish.  None = no deadline
+        """
+        self.rel_epsilon      = rel_epsilon
+        self.n_temp_steps     = n_temp_steps
+        self.min_accept_ratio = min_accept_ratio
+        self.deadline         = deadline
+
+        self.step_costs   = []
+        self.stop_reason  = "iterations"
+        self.n_iterations = 0
+
+    ############################
+    def end_temp_step(self, n_iterations, cost, n_accepted, n_tested):
+        """
+        called at the end of each temperature step
+        :param n_iterations: number of iterations completed so far
+        :param cost: cost of the current solution
+        :param n_accepted: number of moves accepted during the temperature step
+        :param n_tested: number of moves tested during the temperature step
+        :return: True if the pass should stop
+        """
+        self.n_iterations = n_iterations
+
+        if (self.min_accept_ratio is not None) and (n_tested > 0):
+            if float(n_accepted)/float(n_tested) < self.min_accept_ratio:
+                self.stop_reason = "frozen"
+                return True
+
+        if self.rel_epsilon is not None:
+            self.step_costs.append(cost)
+            if len(self.step_costs) > self.n_temp_steps:
+                self.step_costs = self.step_costs[-(self.n_temp_steps+1):]
+                tolerance = self.rel_epsilon*abs(self.step_costs[0])
+                if (max(self.step_costs) - min(self.step_costs)) <= tolerance:
+                    self.stop_reason = "converged"
+                    return True
+        return False
+
+    ############################
+    def check_deadline(self, n_iterations):
+        """
+        :param n_iterations: number of iterations completed so far
+        :return: True if the deadline has passed
+        """
+        self.n_iterations = n_iterations
+        if (self.deadline is not None) and (datetime.utcnow() > self.deadline):
+            self.stop_reason = "deadline"
+            return True
+        return False
+
+
 ############################
 class SimulatedAnnealer():
 
@@ -84,6 +158,40 @@ class SimulatedAnnealer():
 
         self.persist_lowest_cost = 0 # flag to indicate whether to use keep previous solution if cost was lower.
 
+        self.engine = SSA_ENGINE # "serial" = single chain (run_ssa_optimization); "population" = run_population_ssa_optimization;
+                                 # "tempering" = run_tempering_ssa_optimization
+        self.use_delta_cost = True # use incremental (single-point) cost evaluation when all objective functions support it
+        self.move_weights   = dict(SSA_MOVE_WEIGHTS) # relative probability of perturbing each controllable resource
+                                                     # type (see MoveKernels.MOVE_KERNELS).  0 = not perturbed
+        self.save_results   = True # write init / least cost profiles to ssa_results.csv at the end of each pass
+
+        # warm start configuration parameters:
+        self.warm_start            = SSA_WARM_START # seed each pass from the previous schedule, shifted to the new horizon
+        self.warm_start_fract_T0   = 0.001 # initial temperature of a warm started pass, as a fraction of the cold start value
+        self.warm_start_iterations = 20000 # number of iterations for a warm started pass
+
+        # early termination configuration parameters (see ConvergenceMonitor):
+        self.conv_rel_epsilon      = 1e-4  # relative change in cost that counts as an improvement.  None = disabled
+        self.conv_n_temp_steps     = 5     # number of temperature steps without improvement before stopping
+        self.conv_min_accept_ratio = 0.002 # stop if fewer than this fraction of moves are accepted in a temperature step.  None = disabled
+        self.deadline              = None  # naive UTC datetime by which an optimization pass must finish.  None = no deadline
+        self.deadline_check_pd     = 100   # number of iterations between deadline checks
+        self.stop_reason           = None  # why the last pass stopped - "iterations", "converged", "frozen", or "deadline"
+        self.n_iterations_used     = 0     # number of iterations (population engine: steps) used by the last pass
+
+        # parallel load shift option search configuration parameters:
+        self.n_workers   = SSA_N_WORKERS # number of worker processes.  1 = search options serially, in process
+        self.worker_seed = 0             # load shift option ii is searched with random seed worker_seed + ii
+
+        # population-based SSA configuration parameters:
+        self.n_chains       = 128   # number of SSA chains evaluated in a single vectorized step
+        self.nPopIterations = 10000 # number of vectorized steps.  The cooling schedule is compressed to fit.
+
+        # parallel tempering configuration parameters (engine = "tempering"; also uses nPopIterations):
+        self.n_replicas = 16 # number of replicas in each temperature ladder
+        self.n_ladders  = 8  # number of independent ladders evaluated in the same vectorized step
+        self.swap_pd    = 10 # number of steps between replica exchange attempts
+
     ############################
     def scale_battery_weights(self, max_ess_energy, weight_disch, tResolution_hr):
         """
@@ -118,6 +226,23 @@ class SimulatedAnnealer():
         #y4 = z - y2
         return max(min(y3,ub), lb)   #, max(min(y4,ub), lb)
 
+    ############################
+    def get_cooling_schedule(self, ii, T0):
+        """
+        Returns the temperature and jump size in effect at iteration ii of run_ssa_optimization.  This is a closed
+        form of the incremental updates applied in the main SSA loop, so that other search engines can follow the
+        same cooling schedule.
+        :param ii: iteration number
+        :param T0: initial temperature
+        :return: T - temperature, jump - maximum jump size
+        """
+        n_temp_decrease = (ii+1) // self.temp_decrease_pd
+        n_jump_decrease = (ii+1) // self.jump_decrease_pd - \
+                          n_temp_decrease * floor(self.temp_decrease_pd/self.jump_decrease_pd)
+        T    = T0 * self.fract_T**n_temp_decrease
+        jump = self.init_jump * self.fract_jump**n_jump_decrease
+        return T, jump
+
     ############################
     def get_resource(self, sundial_profiles, resource_type):
         """
@@ -126,32 +251,166 @@ class SimulatedAnnealer():
         :param resource_type: resource type (e.g., ESSCtrlNode, PVCtrlNode, LoadShiftCtrlNode, Load, or System)
         :return: returns a list of SundialProfile class instances matching resource_type
         """
-        resources = [] #None
+        return [sundial_profiles.profile_index[resource]
+                for resource in sundial_profiles.sundial_resources.find_resource_type(resource_type)]
 
+    ############################
+    def get_resource_path(self, sundial_profiles, target):
+        """
+        returns the list of SundialProfile nodes from sundial_profiles down to target, inclusive
+        :param sundial_profiles: an instance of SundialProfile class - top of the tree to search
+        :param target: an instance of SundialProfile class
+        :return: list of SundialProfile class instances, starting at sundial_profiles.  Empty if target is not found
+        """
+        if sundial_profiles is target:
+            return [sundial_profiles]
         for virtual_plant in sundial_profiles.virtual_plants:
-            resources.extend(self.get_resource(virtual_plant, resource_type))
+            path = self.get_resource_path(virtual_plant, target)
+            if path != []:
+                return [sundial_profiles] + path
+        return []
 
-        if resource_type == sundial_profiles.sundial_resources.resource_type:
-            _log.info(sundial_profiles.sundial_resources.resource_id+" is a "+sundial_profiles.sundial_resources.resource_type)
-            resources.append(sundial_profiles)
+    ############################
+    def get_resource_list(self, sundial_profiles):
+        """
+        returns a flat list of all nodes in a SundialProfile tree
+        """
+        resources = [sundial_profiles]
+        for virtual_plant in sundial_profiles.virtual_plants:
+            resources.extend(self.get_resource_list(virtual_plant))
         return resources
 
 
+    ############################
+    def init_delta_cost(self, flat_soln):
+        """
+        (re)initializes the running statistics that objective functions use for incremental cost evaluation
+        :param flat_soln: FlatProfileTree - statistics are initialized for objective functions of its path nodes
+        :return: None
+        """
+        for node in flat_soln.path_nodes:
+            for obj_fcn in node.sundial_resources.obj_fcns:
+                obj_fcn.init_delta_cost(node.state_vars)
+
+    ############################
+    def calc_delta_cost(self, ess, ess_path, least_cost_path, ind, delta_pwr):
+        """
+        Incrementally calculates the change in cost resulting from a change in a controllable resource's power at a
+        single index, relative to the least_cost_soln.  Propagates the change to the resource's ancestors in the
+        current solution.
+        :param ess: current_soln node of the perturbed resource (an ESS, or any other controllable node)
+        :param ess_path: list of current_soln nodes from the system node down to the resource (see get_resource_path)
+        :param least_cost_path: corresponding list of least_cost_soln nodes
+        :param ind: index of the perturbed point
+        :param delta_pwr: change in power at ind, in kW
+        :return: delta_cost - change in total cost, in $
+                 moves - list of (obj_fcn, reference profile, old_val, new_val) - used to update objective function
+                 running statistics if the solution is accepted
+        """
+        delta_cost = 0.0
+        moves      = []
+        # stored energy of an ancestor is the sum over the ESSs below it - apply this ESS's change
+        energy_change = {k: ess.state_vars[k] - least_cost_path[-1].state_vars[k]
+                         for k in ["EnergyAvailableForecast_kWh", "DeltaEnergy_kWh"]}
+        for (node, least_cost_node) in zip(ess_path, least_cost_path):
+            old_val = least_cost_node.state_vars["DemandForecast_kW"][ind]
+            new_val = old_val + delta_pwr
+            if node is not ess:
+                node.state_vars["DemandForecast_kW"][ind]      = new_val
+                for (k, v) in energy_change.items():
+                    numpy.add(least_cost_node.state_vars[k], v, out=node.state_vars[k])
+            for obj_fcn in node.sundial_resources.obj_fcns:
+                delta_cost += obj_fcn.delta_cost(least_cost_node.state_vars, ind, old_val, new_val)
+                moves.append((obj_fcn, least_cost_node.state_vars, old_val, new_val))
+        return delta_cost, moves
+
+    ############################
+    def get_warm_start_profile(self, ess, timestamps):
+        """
+        Builds a seed ESS power profile for the horizon defined by timestamps from the ESS's previous schedule
+        (ess.schedule_vars), shifted so that it starts at timestamps[0].  Points past the end of the previous schedule
+        are filled by repeating the previous schedule's value from one schedule duration earlier (i.e., the same time
+        of day, for a 24 hour schedule).
+        :param ess: ESSResource instance
+        :param timestamps: list of schedule timestamps for the current optimization pass
+        :return: numpy array of ESS power commands, or None if there is no previous schedule that overlaps the new
+        horizon
+        """
+        if ess.schedule_vars["schedule_kW"] == {}:  # no schedule has been generated yet
+            return None
+        if len(ess.schedule_vars["DemandForecast_kW"]) != len(timestamps):
+            return None
+        try:
+            shift = ess.schedule_vars["timestamp"].index(timestamps[0])
+        except ValueError:
+            return None
+        return numpy.roll(numpy.array(ess.schedule_vars["DemandForecast_kW"], dtype=float), -shift)
+
+    ############################
+    def apply_warm_start(self, soln, timestamps):
+        """
+        Seeds the ESS profile in soln with get_warm_start_profile, after applying ESS constraints for the current
+        starting SOE.  The change in ESS profile is propagated to the ESS's ancestors and soln's cost is updated.
+        :param soln: SundialResourceProfile instance, initialized to baseline forecasts
+        :param timestamps: list of schedule timestamps for the current optimization pass
+        :return: True if soln was seeded, False if no usable previous schedule was found
+        """
+        ess_profile = self.get_resource(soln, "ESSCtrlNode")[0]
+        ess         = ess_profile.sundial_resources
+        warm_start_pwr = self.get_warm_start_profile(ess, timestamps)
+        if warm_start_pwr is None:
+            return False
+
+        profile = ess.apply_soe_constraints({"DemandForecast_kW": warm_start_pwr,
+                                             "DeltaEnergy_kWh": numpy.zeros(len(warm_start_pwr)),
+                                             "EnergyAvailableForecast_kWh": numpy.zeros(len(warm_start_pwr))})
+        self.set_ess_profile(soln, ess_profile, profile)
+        soln.calc_cost()
+        return True
 
     ############################
-    def copy_profile(self, source, target):
+    def set_ess_profile(self, soln, ess_profile, profile):
+        """
+        replaces the ESS profile in soln and propagates the change to the ESS's ancestors.  Ancestors sum their
+        children's profiles (see SundialResourceProfile.update_sundial_resource), so each one changes by the change in
+        the ESS profile.  soln's cost is not updated.
+        :param soln: SundialResourceProfile tree
+        :param ess_profile: the ESS node of soln
+        :param profile: state_vars-style dictionary of 1-d numpy arrays - new DemandForecast_kW,
+        EnergyAvailableForecast_kWh and DeltaEnergy_kWh for the ESS
+        :return: None
         """
-        does a deep copy of a SundialProfile instance from source to target by recursively traversing
-        nodes.  Source and target must have the same tree topology
+        keys   = ["DemandForecast_kW", "EnergyAvailableForecast_kWh", "DeltaEnergy_kWh"]
+        change = {k: numpy.asarray(profile[k], dtype=float) - ess_profile.state_vars[k] for k in keys}
+        for node in self.get_resource_path(soln, ess_profile):
+            for k in keys:
+                if node is ess_profile:
+                    numpy.copyto(node.state_vars[k], profile[k])
+                else:
+                    node.state_vars[k] = node.state_vars[k] + change[k]
+        ess_profile.energy_synced = False
+
+    ############################
+    def copy_profile(self, source, target, ind=None):
+        """
+        copies a SundialProfile instance from source to target.  Source and target must have the same tree topology.
+        Data is copied in place into target's existing buffers.  If source and target are the tops of their trees,
+        the whole tree is copied at once (see SundialResourceProfile.copy_tree); otherwise, nodes are copied by
+        recursively traversing the tree (see SundialResourceProfile.copy_profile)
         :param source: SunDialProfile instance
         :param target: SunDialProfile instance
+        :param ind: if set, only time series values from index ind onward are copied
         :return: target - SundialProfile instance
         """
+        if (source.block_ind == 0) and (target.block_ind == 0) and (source.block.shape == target.block.shape):
+            target.copy_tree(source, ind)
+            return target
+
         for (source_child, target_child) in zip(source.virtual_plants, target.virtual_plants):
-            target_child = self.copy_profile(source_child, target_child)
+            target_child = self.copy_profile(source_child, target_child, ind)
 
         if target.sundial_resources.update_required == 1:
-            target.copy_profile(source)
+            target.copy_profile(source, ind)
 
         return target
 
@@ -216,9 +475,10 @@ class SimulatedAnnealer():
              as the new least cost solution.  If cost is higher, adopt as the new least_cost_soln with a probability
              dictated by the system's temperature
 
-        The current implementation implicitly assumes that the only controllable resource is a single ESS.  This is a
-        a shortcut towards getting a minimum version running.  Modest changes would support multiple controllable
-        resources.
+        The controllable resources are the nodes of the tree whose resource_type has a move kernel (see MoveKernels)
+        with a non-zero weight in self.move_weights - by default, every ESS.  Each iteration picks one of them at
+        random, weighted by self.move_weights, and perturbs it with its kernel.  The change is propagated to the
+        node's ancestors through a FlatProfileTree that is compiled once per optimization pass.
 
 
         TODO - check relationship between delta and self.O2T - does delta need to be convereted to T??
@@ -230,7 +490,6 @@ class SimulatedAnnealer():
         :return: None
         """
         run_optimization = True
-        use_recursive    = False
 
         # get an initial set of commands to seed the ssa process
         # then, set least_cost_soln AND current_soln to initiate the SSA
@@ -239,23 +498,14 @@ class SimulatedAnnealer():
         least_cost_soln = SundialResourceProfile(sundial_resources, timestamps)
         final_soln      = SundialResourceProfile(sundial_resources, timestamps)
 
-        # For convenience - this extracts specific resource types from the Sundial tree structure and puts them
-        # in a flat list, grouped by resource type.  Just simplifies data handling, speeds execution, particularly
-        # for simple system topology
-        # Currently, we are only handling a single SundialResource per resource_type.
-        try:
-            self.load       = self.get_resource(current_soln, "Load")[0]
-        except:
-            self.load       = []
-        try:
-            self.load_shift = self.get_resource(current_soln, "LoadShiftCtrlNode")[0]
-        except:
-            self.load_shift = []
-        self.pv         = self.get_resource(current_soln, "PVCtrlNode")[0]
-        self.ess        = self.get_resource(current_soln, "ESSCtrlNode")[0]
-        self.system     = self.get_resource(current_soln, "System")[0]
-
-        self.ess_least_cost = self.get_resource(least_cost_soln, "ESSCtrlNode")[0]
+        # receding horizon warm start - seed from the previous schedule, then search from a lower temperature, with
+        # fewer iterations
+        warm_start = False
+        if self.warm_start == True:
+            warm_start = self.apply_warm_start(least_cost_soln, timestamps)
+            if warm_start == True:
+                current_soln = self.copy_profile(least_cost_soln, current_soln)
+                _log.info("Warm start from previous schedule: initial cost = "+str(least_cost_soln.total_cost))
 
 
         #### what I'm thinking is that you put in a for loop right here.
@@ -275,6 +525,10 @@ class SimulatedAnnealer():
         if run_optimization == True:
             # set initial tempearture
             T0   = abs(self.O2T*init_soln.cost)
+            n_iterations = self.nIterations
+            if warm_start == True:
+                T0           = T0*self.warm_start_fract_T0
+                n_iterations = self.warm_start_iterations
             T    = T0;
 
             _log.info("Jump is: "+str(self.init_jump))
@@ -296,21 +550,71 @@ class SimulatedAnnealer():
             jump = self.init_jump
             dirty_flag = True
 
-            system_net_demand_baseline = self.system.state_vars["DemandForecast_kW"]
+            # index from which current_soln and least_cost_soln may differ.  None --> copy full profiles.  Full copies
+            # are used until the first solution is accepted, because the initial SOE forecast is not necessarily
+            # consistent with the charge / discharge profile.  After that, a perturbation at ind only changes values
+            # from ind onward.
+            copy_ind = None
+            suffix_copy = False
+
+            # the tree is compiled once per pass - each perturbation is propagated to the perturbed node's ancestors
+            # only.  Nodes that are not on the path from the system node down to a controllable node are not affected.
+            ctrl_types       = [resource_type for (resource_type, weight) in self.move_weights.items()
+                                if (weight > 0) and (resource_type in MOVE_KERNELS)]
+            flat_soln        = FlatProfileTree(current_soln, ctrl_types)
+            flat_least_cost  = FlatProfileTree(least_cost_soln, ctrl_types)
+            ctrl_nodes       = flat_soln.ctrl_nodes
+            ctrl_paths       = [self.get_resource_path(current_soln, node) for node in ctrl_nodes]
+            least_cost_paths = [self.get_resource_path(least_cost_soln, node) for node in flat_least_cost.ctrl_nodes]
+            for node in flat_soln.path_nodes:
+                node.sundial_resources.update_required = 1
+
+            # weighted random selection of the node to perturb
+            move_kernels = [MOVE_KERNELS[node.sundial_resources.resource_type] for node in ctrl_nodes]
+            move_cdf     = numpy.cumsum([self.move_weights[node.sundial_resources.resource_type] for node in ctrl_nodes])
+            if len(ctrl_nodes) == 0:
+                _log.info("SSA: no controllable resources - skipping optimization")
+                n_iterations = 0
+            else:
+                move_cdf = move_cdf / move_cdf[-1]
+
+            # incremental cost evaluation - used if every objective function on these paths supports it.
+            use_delta_cost  = (self.use_delta_cost == True) and \
+                              all([getattr(obj_fcn, "has_delta_cost", False)
+                                   for node in flat_soln.path_nodes for obj_fcn in node.sundial_resources.obj_fcns])
+            if use_delta_cost == True:
+                self.init_delta_cost(flat_least_cost)
+
+            # early termination
+            monitor = ConvergenceMonitor(self.conv_rel_epsilon,
+                                         self.conv_n_temp_steps,
+                                         self.conv_min_accept_ratio,
+                                         self.deadline)
+            n_accepted = 0
 
             # From the initial solution, follow the simulated annealing logic: disturb
             # 1 point and check if there is improvement.
-            for ii in range(self.nIterations):
+            for ii in range(n_iterations):
 
                 if (ii % self.display_pd == 0): # for debug - periodically publish results
+                    if use_delta_cost == True:
+                        # resync with a full cost calculation so that round-off in incremental costs does not accumulate
+                        least_cost_soln.calc_cost()
                     _log.info("Iteration "+str(ii)+": T="+str(T)+"; Least Cost Soln = "+str(least_cost_soln.total_cost))
 
+                if (ii % self.deadline_check_pd == 0) and (monitor.check_deadline(ii) == True):
+                    break
+
                 if ((ii+1) % self.jump_decrease_pd) == 0: # check if it's time to decrease jump size.
                     # decrease jump size
                     jump = jump*self.fract_jump
                     #print("ii = "+str(ii)+"; Jump decrease - jump = " + str(jump))
 
                 if ((ii+1) % self.temp_decrease_pd) == 0: # check if it's time to decrease temperature
+                    if monitor.end_temp_step(ii, least_cost_soln.total_cost, n_accepted, self.temp_decrease_pd) == True:
+                        break
+                    n_accepted = 0
+
                     # decrease temperature, reset jump to the starting value from the last jump decrease
                     T         = self.fract_T*T
                     n         = floor(self.temp_decrease_pd/self.jump_decrease_pd)
@@ -318,60 +622,54 @@ class SimulatedAnnealer():
                     #print("ii = "+str(ii)+"; Temp decrease - "+str(T)+"; jump = "+str(jump))
                     #print("ESS Weight is: " + str(self.ess.current_soln.weight))
 
-                # FIXME - Much of the following is taking advantage of a simple system topology by directly referencing
-                # FIXME - into system nodes.  The universal version should do much of the following by recursively
-                # FIXME - traversing the SundialResource tree.
-
                 # set the current test profile to the current least-cost solution
                 if dirty_flag == True:  # copy only if the last solution was not accepted
-                    current_soln = self.copy_profile(least_cost_soln, current_soln) # set current soln to least cost soln
-
-                # Randomly perturb a single point by a random value dictated by the size of the jump parameter
-                # FIXME: currently this just deals with battery charge / discharge instructions - not other resources
-                # FIXME: e.g., PV curtailment
-                ind = int(floor(random()*self.nOptimizationPtsPerPd))
-                self.ess.state_vars["DemandForecast_kW"][ind] = self.calc_jump(self.ess.state_vars["DemandForecast_kW"][ind],
-                                                                               jump*(self.ess.sundial_resources.state_vars["MaxDischargePwr_kW"]+self.ess.sundial_resources.state_vars["MaxChargePwr_kW"])/2,
-                                                                               -1*self.ess.sundial_resources.state_vars["MaxDischargePwr_kW"],
-                                                                               self.ess.sundial_resources.state_vars["MaxChargePwr_kW"])
-
-                # Then: check for constraints.
-                # TODO - right now, just checking for battery limit violations.  Eventually put in ability to include
-                # TODO - additional constraints
-                self.ess.state_vars    = self.ess.sundial_resources.check_constraints2(self.ess.state_vars, ind)
+                    current_soln = self.copy_profile(least_cost_soln, current_soln, copy_ind) # set current soln to least cost soln
 
-                # then: update resources.
-                if use_recursive == True:
-                    # slower but generic solution
-                    self.system.update_sundial_resource()
+                # Randomly select a controllable node, then perturb it with the move kernel for its resource type.
+                # The kernel applies the resource's constraints (e.g., ESS SOE limits)
+                if len(ctrl_nodes) > 1:
+                    move_ind = min(int(numpy.searchsorted(move_cdf, random(), side='right')), len(ctrl_nodes)-1)
                 else:
-                    # faster but not generalized
-                    # This is a shortcut
-                    # update overall "system" with new ESS profile -subtract old ESS profile.  then add new profile
-                    self.system.state_vars["DemandForecast_kW"] = system_net_demand_baseline + \
-                                                                  self.ess.state_vars["DemandForecast_kW"]
-                    self.system.state_vars["EnergyAvailableForecast_kWh"] = self.ess.state_vars["EnergyAvailableForecast_kWh"][:]
-
-                if (0):
-                    # removed for speed up
-                    # Sanity check to make sure that constraint check is working.  probably unnecessary at this pont.
-                    if max(self.ess.state_vars["EnergyAvailableForecast_kWh"])>(self.ess.sundial_resources.state_vars["MaxSOE_kWh"])+0.001:
-                        _log.info("ii= "+str(ii)+": Max Constraint Error!!  "+str(max(self.ess.state_vars["EnergyAvailableForecast_kWh"])))
+                    move_ind = 0
+                ctrl_node = ctrl_nodes[move_ind]
+                ind, old_val = move_kernels[move_ind].perturb(ctrl_node, jump)
+                if suffix_copy == True:
+                    copy_ind = ind
 
-                    if min(self.ess.state_vars["EnergyAvailableForecast_kWh"])<(self.ess.sundial_resources.state_vars["MinSOE_kWh"])-0.001:
-                        _log.info("ii= "+str(ii)+": Min Constraint Error!! - "+str(min(self.ess.state_vars["EnergyAvailableForecast_kWh"])))
+                # then: update resources.
+                moves = None
+                if (use_delta_cost == True) and (old_val is not None):
+                    # fastest - updates only the perturbed point and only the objective functions it affects
+                    delta, moves = self.calc_delta_cost(ctrl_node,
+                                                        ctrl_paths[move_ind],
+                                                        least_cost_paths[move_ind],
+                                                        ind,
+                                                        ctrl_node.state_vars["DemandForecast_kW"][ind] - old_val)
+                    current_soln.total_cost = least_cost_soln.total_cost + delta
+                else:
+                    # propagate the new profile to the node's ancestors
+                    flat_soln.update()
 
-                # Now calculate cost of the current solution and get timing for cumulative time on doing cost calcs.
-                total_cost = current_soln.calc_cost()
+                if moves is None:
+                    # Now calculate cost of the current solution - only nodes on the path to an ESS need to be updated
+                    total_cost = flat_soln.calc_cost()
 
-                # Calculate delta cost between this test value and the current least cost solution
-                delta = total_cost - least_cost_soln.total_cost
+                    # Calculate delta cost between this test value and the current least cost solution
+                    delta = total_cost - least_cost_soln.total_cost
 
                 dirty_flag = True
                 if delta < 0.0:
                     # Current test value is a new least-cost solution.  Use this!
-                    least_cost_soln = self.copy_profile(current_soln, least_cost_soln)  # set least cost soln to current soln
+                    if moves is not None:
+                        for (obj_fcn, profile, old_val, new_val) in moves:
+                            obj_fcn.update_delta_cost(profile, ind, old_val, new_val)
+                    least_cost_soln = self.copy_profile(current_soln, least_cost_soln, copy_ind)  # set least cost soln to current soln
+                    if (use_delta_cost == True) and (moves is None):
+                        self.init_delta_cost(flat_least_cost)
                     dirty_flag = False
+                    suffix_copy = True
+                    n_accepted += 1
 
                 elif delta > 0.0:
                     # Current test value is worse than current least-cost solution
@@ -382,11 +680,27 @@ class SimulatedAnnealer():
                     r  = random()
                     if r < th:
                         #print("non best solution adopted.  r="+str(r)+"; Th = "+str(th)+"; T="+str(T)+"; delta = "+str(delta))
-                        least_cost_soln = self.copy_profile(current_soln, least_cost_soln)  # set least cost soln to current soln
+                        if moves is not None:
+                            for (obj_fcn, profile, old_val, new_val) in moves:
+                                obj_fcn.update_delta_cost(profile, ind, old_val, new_val)
+                        least_cost_soln = self.copy_profile(current_soln, least_cost_soln, copy_ind)  # set least cost soln to current soln
+                        if (use_delta_cost == True) and (moves is None):
+                            self.init_delta_cost(flat_least_cost)
                         dirty_flag = False
+                        suffix_copy = True
+                        n_accepted += 1
 
                 # end of main loop (nIterations)
 
+            if use_delta_cost == True:
+                least_cost_soln.calc_cost()
+
+            if monitor.stop_reason == "iterations":
+                monitor.n_iterations = n_iterations
+            self.stop_reason       = monitor.stop_reason
+            self.n_iterations_used = monitor.n_iterations
+            _log.info("SSA stopped after "+str(self.n_iterations_used)+" iterations: "+self.stop_reason)
+
             t8 = datetime.now()
             deltaT = t8 - t0
             total_time = deltaT.total_seconds()
@@ -394,7 +708,24 @@ class SimulatedAnnealer():
             _log.info("least cost soln is "+str(least_cost_soln.total_cost))
             _log.info("total time: "+str(total_time))
 
-        # dump some data to a csv file
+        if self.save_results == True:
+            self.write_results(init_soln, least_cost_soln, timestamps)
+
+        return least_cost_soln
+
+    ############################
+    def write_results(self, init_soln, least_cost_soln, timestamps):
+        """
+        dumps the original and new schedule profiles to a csv file - each row is a different profile,
+        columns represent time
+        """
+        ess_least_cost = self.get_resource(least_cost_soln, "ESSCtrlNode")[0]
+        pv             = self.get_resource(least_cost_soln, "PVCtrlNode")[0]
+        try:
+            load = self.get_resource(least_cost_soln, "Load")[0]
+        except:
+            load = []
+
         filename =  os.path.join(GS_ROOT_DIR, "ssa_results.csv")
         if not os.path.exists(filename):
             my_file = open(filename, 'w+')
@@ -406,17 +737,378 @@ class SimulatedAnnealer():
             results_writer.writerow([t.strftime("%Y-%m-%dT%H:%M:%S") for t in timestamps])
             results_writer.writerow(least_cost_soln.state_vars["DemandForecast_kW"])
             results_writer.writerow(init_soln.state_vars["DemandForecast_kW"])
-            results_writer.writerow(self.ess_least_cost.state_vars["DemandForecast_kW"])
-            results_writer.writerow(self.ess_least_cost.state_vars["EnergyAvailableForecast_kWh"])
-            results_writer.writerow(self.pv.state_vars["DemandForecast_kW"])
+            results_writer.writerow(ess_least_cost.state_vars["DemandForecast_kW"])
+            results_writer.writerow(ess_least_cost.state_vars["EnergyAvailableForecast_kWh"])
+            results_writer.writerow(pv.state_vars["DemandForecast_kW"])
 
-            if self.load != []:
-                results_writer.writerow(self.load.state_vars["DemandForecast_kW"])
+            if load != []:
+                results_writer.writerow(load.state_vars["DemandForecast_kW"])
             #results_writer.writerow(self.pv.init_solution.schedule)
             #results_writer.writerow(self.demand.least_cost_soln.schedule)
 
+    ############################
+    def get_batch_cost_function(self, least_cost_soln, ess_profile):
+        """
+        Sets up vectorized costing of candidate ESS profiles, for the batch search engines.  A single ESS is assumed
+        to be the only controllable resource - nodes above the ESS in the tree see the ESS profile added to their
+        baseline, and the cost of every other node is fixed for the optimization pass.
+        :param least_cost_soln: SundialResourceProfile tree
+        :param ess_profile: the ESS node of least_cost_soln
+        :return: calc_batch_cost - function that maps a state_vars-style dictionary of (N x SSA_PTS_PER_SCHEDULE)
+        ESS profiles to a length N array of total cost
+        """
+        # nodes whose profile changes when the ESS profile changes are the ESS and its ancestors.
+        ess_path    = self.get_resource_path(least_cost_soln, ess_profile)
+        fixed_cost  = sum([node.cost for node in self.get_resource_list(least_cost_soln)
+                           if not any(node is path_node for path_node in ess_path)])
+        ess_baseline = numpy.array(ess_profile.state_vars["DemandForecast_kW"], dtype=float)
+        baselines    = [numpy.array(node.state_vars["DemandForecast_kW"], dtype=float) - ess_baseline
+                        for node in ess_path]
+
+        def calc_batch_cost(chains):
+            cost = fixed_cost
+            for node, baseline in zip(ess_path, baselines):
+                if node is ess_profile:
+                    node_profiles = chains
+                else:
+                    node_profiles = {"DemandForecast_kW": baseline + chains["DemandForecast_kW"],
+                                     "EnergyAvailableForecast_kWh": chains["EnergyAvailableForecast_kWh"],
+                                     "DeltaEnergy_kWh": chains["DeltaEnergy_kWh"]}
+                cost = cost + node.sundial_resources.calc_cost(node_profiles)
+            return cost
+
+        return calc_batch_cost
+
+    ############################
+    def copy_batch_profile(self, profile, least_cost_soln, ess_profile):
+        """
+        copies a single ESS profile found by a batch search engine into a SundialResourceProfile tree, and
+        recalculates its cost
+        :param profile: state_vars-style dictionary of 1-d numpy arrays - ESS profile
+        :param least_cost_soln: SundialResourceProfile tree - profiles of the ESS and its ancestors are replaced
+        :param ess_profile: the ESS node of least_cost_soln
+        :return: None
+        """
+        self.set_ess_profile(least_cost_soln, ess_profile, profile)
+        least_cost_soln.calc_cost()
+
+    ############################
+    def run_population_ssa_optimization(self, sundial_resources, timestamps):
+        """
+        Population-based, vectorized version of run_ssa_optimization.
+
+        Rather than a single Markov chain, self.n_chains candidate ESS profiles are held as rows of an
+        (n_chains x SSA_PTS_PER_SCHEDULE) array.  Each step perturbs a random point in every row, checks ESS
+        constraints for all rows (ESSResource.check_constraints_batch), costs all rows (obj_fcn_cost_batch), and
+        applies the SSA acceptance test to each chain independently.  Chains follow the same cooling schedule as
+        run_ssa_optimization, compressed from self.nIterations down to self.nPopIterations steps.
+
+        The same simplifying assumption as the fast path in run_ssa_optimization applies - a single ESS is the only
+        controllable resource, and nodes above the ESS in the tree see the ESS profile added to their baseline.
+
+        :param sundial_resources: A SundialResource instance - referencing to the top of the SundialResource tree for
+        the system in question.
+        :param timestamps: list of timestamps, length of SSA_PTS_PER_SCHEDULE, that correpond to the time at which
+        schedule_var data points are valid
+        :return: least_cost_soln - SundialResourceProfile instance corresponding to the least cost solution found
+        across all chains
+        """
+        init_soln       = SundialResourceProfile(sundial_resources, timestamps)
+        least_cost_soln = SundialResourceProfile(sundial_resources, timestamps)
+
+        # receding horizon warm start - every chain is seeded from the previous schedule
+        warm_start = False
+        if self.warm_start == True:
+            warm_start = self.apply_warm_start(least_cost_soln, timestamps)
+
+        ess_profile = self.get_resource(least_cost_soln, "ESSCtrlNode")[0]
+        ess         = ess_profile.sundial_resources
+        calc_batch_cost = self.get_batch_cost_function(least_cost_soln, ess_profile)
+
+        # every chain starts from the initial solution
+        n_chains = self.n_chains
+        chains = {k: numpy.tile(numpy.array(ess_profile.state_vars[k], dtype=float), (n_chains, 1))
+                  for k in ["DemandForecast_kW", "EnergyAvailableForecast_kWh", "DeltaEnergy_kWh"]}
+        chain_cost = numpy.array([least_cost_soln.total_cost] * n_chains)
+
+        best_ind  = 0
+        best_cost = least_cost_soln.total_cost
+        best      = {k: v[0].copy() for k, v in chains.items()}
+
+        max_chg      = ess.state_vars["MaxChargePwr_kW"]
+        max_dischg   = ess.state_vars["MaxDischargePwr_kW"]
+        jump_scale   = (max_dischg + max_chg) / 2
+        rows         = numpy.arange(n_chains)
+        iter_per_step = float(self.nIterations) / float(self.nPopIterations)
+
+        T0 = abs(self.O2T*init_soln.cost)
+        n_steps = self.nPopIterations
+        if warm_start == True:
+            T0      = T0*self.warm_start_fract_T0
+            n_steps = int(ceil(self.warm_start_iterations / iter_per_step))
+        _log.info("Population SSA: "+str(n_chains)+" chains, "+str(n_steps)+" steps, T0 = "+str(T0))
+
+        # early termination
+        monitor = ConvergenceMonitor(self.conv_rel_epsilon,
+                                     self.conv_n_temp_steps,
+                                     self.conv_min_accept_ratio,
+                                     self.deadline)
+        n_accepted = 0
+        n_tested   = 0
+        T_prev     = T0
+
+        t0 = datetime.now()
+        for ii in range(n_steps):
+            T, jump = self.get_cooling_schedule(int(ii*iter_per_step), T0)
+
+            if (ii % self.display_pd == 0): # for debug - periodically publish results
+                _log.info("Step "+str(ii)+": T="+str(T)+"; Least Cost Soln = "+str(best_cost))
+
+            if (ii % self.deadline_check_pd == 0) and (monitor.check_deadline(ii) == True):
+                break
+
+            if T != T_prev:  # start of a new temperature step
+                if monitor.end_temp_step(ii, chain_cost.min(), n_accepted, n_tested) == True:
+                    break
+                n_accepted = 0
+                n_tested   = 0
+                T_prev     = T
+
+            # perturb a single random point in every chain
+            ind = numpy.random.randint(0, self.nOptimizationPtsPerPd, n_chains)
+            test = {k: v.copy() for k, v in chains.items()}
+            test["DemandForecast_kW"][rows, ind] = numpy.clip(test["DemandForecast_kW"][rows, ind] +
+                                                              (numpy.random.random(n_chains) - .5) * 2.0 * jump * jump_scale,
+                                                              -1*max_dischg,
+                                                              max_chg)
+            test = ess.check_constraints_batch(test, ind)
+            test_cost = calc_batch_cost(test)
+
+            # SSA acceptance test, applied to each chain independently
+            delta = test_cost - chain_cost
+            with numpy.errstate(over='ignore', divide='ignore', invalid='ignore'):
+                accept = (delta < 0.0) | ((delta > 0.0) & (numpy.random.random(n_chains) < numpy.exp(-delta / T)))
+            for k in chains:
+                chains[k][accept] = test[k][accept]
+            chain_cost[accept] = test_cost[accept]
+            n_accepted += numpy.count_nonzero(accept)
+            n_tested   += n_chains
+
+            ind = numpy.argmin(chain_cost)
+            if chain_cost[ind] < best_cost:
+                best_ind  = ind
+                best_cost = chain_cost[ind]
+                best      = {k: v[ind].copy() for k, v in chains.items()}
+
+        total_time = (datetime.now() - t0).total_seconds()
+
+        if monitor.stop_reason == "iterations":
+            monitor.n_iterations = n_steps
+        self.stop_reason       = monitor.stop_reason
+        self.n_iterations_used = monitor.n_iterations
+        _log.info("Population SSA stopped after "+str(self.n_iterations_used)+" steps: "+self.stop_reason)
+
+        # copy the best chain back into a SundialResourceProfile tree
+        self.copy_batch_profile(best, least_cost_soln, ess_profile)
+
+        _log.info("least cost soln is "+str(least_cost_soln.total_cost)+" (chain "+str(best_ind)+")")
+        _log.info("total time: "+str(total_time))
+
+        if self.save_results == True:
+            self.write_results(init_soln, least_cost_soln, timestamps)
+
+        return least_cost_soln
+
+    ############################
+    def run_tempering_ssa_optimization(self, sundial_resources, timestamps):
+        """
+        Parallel tempering (replica exchange) version of run_population_ssa_optimization.
+
+        Rather than following a cooling schedule, each of self.n_ladders ladders holds self.n_replicas replicas at a
+        fixed, geometrically spaced set of temperatures spanning the range of the run_ssa_optimization cooling
+        schedule.  Every step perturbs and tests all replicas at once, as in run_population_ssa_optimization.  Every
+        self.swap_pd steps, neighboring replicas in each ladder (alternating even and odd pairs) exchange states with
+        probability min(1, exp((1/T_i - 1/T_j)*(cost_i - cost_j))), which lets solutions trapped in a local minimum
+        by the demand charge escape through the hotter replicas.
+
+        :param sundial_resources: A SundialResource instance - referencing to the top of the SundialResource tree for
+        the system in question.
+        :param timestamps: list of timestamps, length of SSA_PTS_PER_SCHEDULE, that correpond to the time at which
+        schedule_var data points are valid
+        :return: least_cost_soln - SundialResourceProfile instance corresponding to the least cost solution found
+        across all replicas
+        """
+        init_soln       = SundialResourceProfile(sundial_resources, timestamps)
+        least_cost_soln = SundialResourceProfile(sundial_resources, timestamps)
+
+        # receding horizon warm start - every replica is seeded from the previous schedule
+        warm_start = False
+        if self.warm_start == True:
+            warm_start = self.apply_warm_start(least_cost_soln, timestamps)
+
+        ess_profile = self.get_resource(least_cost_soln, "ESSCtrlNode")[0]
+        ess         = ess_profile.sundial_resources
+        calc_batch_cost = self.get_batch_cost_function(least_cost_soln, ess_profile)
+
+        # row (ladder * n_replicas + rung) of each array holds one replica; rung 0 is the hottest
+        n_replicas = self.n_replicas
+        n_rows     = n_replicas * self.n_ladders
+        chains = {k: numpy.tile(numpy.array(ess_profile.state_vars[k], dtype=float), (n_rows, 1))
+                  for k in ["DemandForecast_kW", "EnergyAvailableForecast_kWh", "DeltaEnergy_kWh"]}
+        chain_cost = numpy.array([least_cost_soln.total_cost] * n_rows)
+
+        best_cost = least_cost_soln.total_cost
+        best      = {k: v[0].copy() for k, v in chains.items()}
+
+        max_chg      = ess.state_vars["MaxChargePwr_kW"]
+        max_dischg   = ess.state_vars["MaxDischargePwr_kW"]
+        jump_scale   = (max_dischg + max_chg) / 2
+        rows         = numpy.arange(n_rows)
+        iter_per_step = float(self.nIterations) / float(self.nPopIterations)
+
+        T0 = abs(self.O2T*init_soln.cost)
+        n_steps = self.nPopIterations
+        if warm_start == True:
+            T0      = T0*self.warm_start_fract_T0
+            n_steps = int(ceil(self.warm_start_iterations / iter_per_step))
+
+        # temperature ladder - from T0 down to the final temperature of the cooling schedule
+        T_min  = self.get_cooling_schedule(self.nIterations-1, T0)[0]
+        ladder = T0 * (T_min / T0) ** (numpy.arange(n_replicas) / float(max(n_replicas-1, 1)))
+        T      = numpy.tile(ladder, self.n_ladders)
+        _log.info("Parallel tempering SSA: "+str(self.n_ladders)+" x "+str(n_replicas)+" replicas, "+str(n_steps)+
+                  " steps, T = "+str(T0)+" to "+str(T_min))
+
+        # neighboring pairs of replicas that attempt an exchange, alternating between even and odd rungs
+        swap_pairs = []
+        for first_rung in [0, 1]:
+            lo = (numpy.arange(self.n_ladders)[:, None]*n_replicas +
+                  numpy.arange(first_rung, n_replicas-1, 2)[None, :]).ravel()
+            swap_pairs.append((lo, lo+1))
+
+        # early termination - improvements arrive as states diffuse down the ladder, which takes ~n_replicas^2
+        # exchange attempts, so the convergence window is made at least that long
+        monitor = ConvergenceMonitor(self.conv_rel_epsilon,
+                                     self.conv_n_temp_steps,
+                                     self.conv_min_accept_ratio,
+                                     self.deadline)
+        monitor_pd = max(1,
+                         int(self.temp_decrease_pd / iter_per_step),
+                         n_replicas**2 * self.swap_pd // max(self.conv_n_temp_steps, 1))
+        n_accepted = 0
+        n_tested   = 0
+        n_swaps    = 0
+
+        t0 = datetime.now()
+        for ii in range(n_steps):
+            jump = self.get_cooling_schedule(int(ii*iter_per_step), T0)[1]
+
+            if (ii % self.display_pd == 0): # for debug - periodically publish results
+                _log.info("Step "+str(ii)+": Least Cost Soln = "+str(best_cost))
+
+            if (ii % self.deadline_check_pd == 0) and (monitor.check_deadline(ii) == True):
+                break
+
+            if (ii > 0) and (ii % monitor_pd == 0):
+                if monitor.end_temp_step(ii, best_cost, n_accepted, n_tested) == True:
+                    break
+                n_accepted = 0
+                n_tested   = 0
+
+            # perturb a single random point in every replica
+            ind = numpy.random.randint(0, self.nOptimizationPtsPerPd, n_rows)
+            test = {k: v.copy() for k, v in chains.items()}
+            test["DemandForecast_kW"][rows, ind] = numpy.clip(test["DemandForecast_kW"][rows, ind] +
+                                                              (numpy.random.random(n_rows) - .5) * 2.0 * jump * jump_scale,
+                                                              -1*max_dischg,
+                                                              max_chg)
+            test = ess.check_constraints_batch(test, ind)
+            test_cost = calc_batch_cost(test)
+
+            # SSA acceptance test, applied to each replica at its own temperature
+            delta = test_cost - chain_cost
+            with numpy.errstate(over='ignore', divide='ignore', invalid='ignore'):
+                accept = (delta < 0.0) | ((delta > 0.0) & (numpy.random.random(n_rows) < numpy.exp(-delta / T)))
+            for k in chains:
+                chains[k][accept] = test[k][accept]
+            chain_cost[accept] = test_cost[accept]
+            n_accepted += numpy.count_nonzero(accept)
+            n_tested   += n_rows
+
+            ind = numpy.argmin(chain_cost)
+            if chain_cost[ind] < best_cost:
+                best_cost = chain_cost[ind]
+                best      = {k: v[ind].copy() for k, v in chains.items()}
+
+            # replica exchange
+            if (ii % self.swap_pd == 0) and (n_replicas > 1):
+                (lo, hi) = swap_pairs[(ii // self.swap_pd) % 2]
+                with numpy.errstate(over='ignore', invalid='ignore'):
+                    swap = numpy.random.random(len(lo)) < numpy.exp((1.0/T[lo] - 1.0/T[hi]) * (chain_cost[lo] - chain_cost[hi]))
+                (lo, hi) = (lo[swap], hi[swap])
+                for k in chains:
+                    chains[k][lo], chains[k][hi] = chains[k][hi], chains[k][lo].copy()
+                chain_cost[lo], chain_cost[hi] = chain_cost[hi], chain_cost[lo].copy()
+                n_swaps += len(lo)
+
+        total_time = (datetime.now() - t0).total_seconds()
+
+        if monitor.stop_reason == "iterations":
+            monitor.n_iterations = n_steps
+        self.stop_reason       = monitor.stop_reason
+        self.n_iterations_used = monitor.n_iterations
+        _log.info("Parallel tempering SSA stopped after "+str(self.n_iterations_used)+" steps ("+str(n_swaps)+
+                  " exchanges): "+self.stop_reason)
+
+        # copy the best replica back into a SundialResourceProfile tree
+        self.copy_batch_profile(best, least_cost_soln, ess_profile)
+
+        _log.info("least cost soln is "+str(least_cost_soln.total_cost))
+        _log.info("total time: "+str(total_time))
+
+        if self.save_results == True:
+            self.write_results(init_soln, least_cost_soln, timestamps)
+
         return least_cost_soln
 
+    ############################
+    def run_optimization(self, sundial_resources, timestamps):
+        """
+        runs the optimization engine selected by self.engine.  The population and tempering engines optimize a
+        single ESS - if the tree does not have exactly one ESS, the serial engine is used instead.
+        :return: least_cost_soln - SundialResourceProfile instance
+        """
+        if self.engine in ("population", "tempering"):
+            n_ess = len(sundial_resources.find_resource_type("ESSCtrlNode"))
+            if n_ess != 1:
+                _log.warning("SSA: "+self.engine+" engine requires exactly one ESS ("+str(n_ess)+" found) - "
+                             "using serial engine")
+                return self.run_ssa_optimization(sundial_resources, timestamps)
+
+        if self.engine == "population":
+            return self.run_population_ssa_optimization(sundial_resources, timestamps)
+        elif self.engine == "tempering":
+            return self.run_tempering_ssa_optimization(sundial_resources, timestamps)
+        else:
+            return self.run_ssa_optimization(sundial_resources, timestamps)
+
+    ############################
+    def export_selected_options(self, least_cost_soln):
+        """
+        When load shift nodes are optimized by the annealer (i.e., move_weights["LoadShiftCtrlNode"] > 0), records
+        the ID of the load shift option selected for each one in its schedule_vars["SelectedProfile"]
+        :param least_cost_soln: SundialResourceProfile - top of the least cost solution tree
+        :return: None
+        """
+        if self.move_weights.get("LoadShiftCtrlNode", 0) <= 0:
+            return
+        kernel = MOVE_KERNELS["LoadShiftCtrlNode"]
+        for node in self.get_resource_list(least_cost_soln):
+            if node.sundial_resources.resource_type == "LoadShiftCtrlNode":
+                ii = kernel.get_selected_option(node)
+                if ii is not None:
+                    node.sundial_resources.schedule_vars["SelectedProfile"] = node.sundial_resources.state_vars["IDList"][ii]
+
     ############################
     def search_single_option(self, sundial_resources, timestamps):
         """
@@ -426,20 +1118,92 @@ class SimulatedAnnealer():
         :param timestamps: schedule time stamps
         :return: None
         """
-        least_cost_soln = self.run_ssa_optimization(sundial_resources, timestamps)
+        least_cost_soln = self.run_optimization(sundial_resources, timestamps)
         # exports least_cost_soln to sundial_resources.schedule_vars
         if (self.persist_lowest_cost == 0):
             _log.info("SSA: New set of timestamps - generating new solution")
             export_schedule(least_cost_soln, timestamps)
+            self.export_selected_options(least_cost_soln)
         elif least_cost_soln.total_cost<sundial_resources.schedule_vars["total_cost"]:
             _log.info("SSA: Lower Cost Solution found - using new solution")
             _log.info("new soln is"+str(least_cost_soln.total_cost)+"; old soln = "+str(sundial_resources.schedule_vars["total_cost"]))
             export_schedule(least_cost_soln, timestamps)
+            self.export_selected_options(least_cost_soln)
         else:
             _log.info("SSA: Lower cost solution not found - using previous solution (cost ="+str(sundial_resources.schedule_vars["total_cost"])+")")
             export_schedule(least_cost_soln, timestamps, update=False)
 
 
+    ############################
+    def get_option_deadline(self, deadline, n_passes_left):
+        """
+        splits the time remaining before deadline evenly between the optimization passes still to be run, so that
+        load shift options searched late in a pass are not starved of time (and left unoptimized) by earlier ones
+        :param deadline: naive UTC datetime by which all remaining passes must finish.  None = no deadline
+        :param n_passes_left: number of passes still to be run, including the next one
+        :return: deadline for the next pass, or None
+        """
+        if deadline is None:
+            return None
+        now = datetime.utcnow()
+        return now + max(deadline - now, timedelta(0)) / n_passes_left
+
+    ############################
+    def search_load_shift_options_parallel(self, sundial_resources, loadshift_resources, timestamps):
+        """
+        Runs an optimization pass for each load shift option in a pool of self.n_workers processes.
+        The SundialResource tree (including objective function data) and the optimizer configuration are pickled
+        once per pass and unpickled once by each worker when the pool starts.  Option ii is searched with random seed
+        self.worker_seed+ii, so results do not depend on how options are assigned to workers.
+        If self.deadline is set, the remaining time is split evenly between the rounds of options that each worker
+        runs (see get_option_deadline).
+        Results are returned in option order, and each option's schedule is exported as in the serial search.
+        :param sundial_resources: sundial resource tree, with system as a top node, of type SundialSystemResource
+        :param loadshift_resources: reference to the load shift resource node of type LoadShiftResource Class
+        :param timestamps: schedule time stamps
+        :return: least_cost_soln_list - list of SundialResourceProfile instances, one per load shift option
+        """
+        n_options = len(loadshift_resources.state_vars["LoadShiftOptions_kW"])
+        optimizer = copy.copy(self)  # workers run with this optimizer's full configuration (move_weights, etc)
+        optimizer.save_results = False
+        payload = cPickle.dumps((optimizer, sundial_resources, timestamps), cPickle.HIGHEST_PROTOCOL)
+
+        n_processes = min(self.n_workers, n_options)
+        n_rounds    = int(ceil(float(n_options) / n_processes))
+        option_deadline = self.get_option_deadline(self.deadline, n_rounds)
+        time_budget = None if option_deadline is None else option_deadline - datetime.utcnow()
+
+        _log.info("*************** Searching "+str(n_options)+" Load Shift Options on "+
+                  str(n_processes)+" workers ***************************")
+        pool = multiprocessing.Pool(processes=n_processes,
+                                    initializer=init_load_shift_worker,
+                                    initargs=(payload,))
+        try:
+            results = pool.map(search_load_shift_option_worker,
+                               [(ii, self.worker_seed+ii, time_budget) for ii in range(n_options)],
+                               chunksize=1)
+        finally:
+            pool.terminate()
+            pool.join()
+
+        # rebuild a SundialResourceProfile tree for each option from the returned tree data
+        least_cost_soln_list = []
+        for (ii, soln_state) in sorted(results):
+            loadshift_resources.state_vars["DemandForecast_kW"] = loadshift_resources.state_vars["LoadShiftOptions_kW"][ii]
+            sundial_resources.state_vars["DemandForecast_kW"]   = sundial_resources.state_vars["LoadShiftOptions_kW"][ii]
+            init_soln       = SundialResourceProfile(sundial_resources, timestamps)
+            least_cost_soln = SundialResourceProfile(sundial_resources, timestamps)
+            least_cost_soln.set_state(soln_state)
+            least_cost_soln_list.append(least_cost_soln)
+
+            _log.info("*************** Finished Searching Load Shift Option " + str(ii+1) + " of " +
+                      str(n_options) + ", cost is " + str(least_cost_soln.total_cost) + " ***************************")
+            if self.save_results == True:
+                self.write_results(init_soln, least_cost_soln, timestamps)
+            export_schedule(least_cost_soln, timestamps)
+
+        return least_cost_soln_list
+
     ############################
     def search_load_shift_options(self, sundial_resources, loadshift_resources, timestamps):
         """
@@ -453,15 +1217,23 @@ class SimulatedAnnealer():
 
         least_cost_soln_list      = []
         least_cost_soln_cost_list = []
+        n_options = len(loadshift_resources.state_vars["LoadShiftOptions_kW"])
+        deadline  = self.deadline  # shared between all options - see get_option_deadline
 
+        if (self.n_workers > 1) and (len(loadshift_resources.state_vars["LoadShiftOptions_kW"]) > 1):
+            least_cost_soln_list      = self.search_load_shift_options_parallel(sundial_resources,
+                                                                                loadshift_resources,
+                                                                                timestamps)
+            least_cost_soln_cost_list = [soln.total_cost for soln in least_cost_soln_list]
 
-        for ii in range(0, len(loadshift_resources.state_vars["LoadShiftOptions_kW"])):
+        for ii in range(len(least_cost_soln_list), len(loadshift_resources.state_vars["LoadShiftOptions_kW"])):
             _log.info("*************** Searching Load Shift Option "+str(ii+1)+" of "+
                       str(len(loadshift_resources.state_vars["LoadShiftOptions_kW"]))+"***************************")
             loadshift_resources.state_vars["DemandForecast_kW"] = loadshift_resources.state_vars["LoadShiftOptions_kW"][ii]
             sundial_resources.state_vars["DemandForecast_kW"]   = sundial_resources.state_vars["LoadShiftOptions_kW"][ii]
         #    sundial_resources.interpolate_forecast(schedule_timestamps)
-            least_cost_soln = self.run_ssa_optimization(sundial_resources,timestamps)
+            self.deadline   = self.get_option_deadline(deadline, n_options - ii)
+            least_cost_soln = self.run_optimization(sundial_resources,timestamps)
             least_cost_soln_list.append(least_cost_soln)
             least_cost_soln_cost_list.append(least_cost_soln.total_cost)
 
@@ -474,6 +1246,7 @@ class SimulatedAnnealer():
             #least_cost_soln_list.append(self.copy_profile(least_cost_soln, final_soln))
             #
             # end of main loop (n load shift options)
+        self.deadline = deadline
 
         # now find global least cost solution
         lcs_ind         = least_cost_soln_cost_list.index(min(least_cost_soln_cost_list))
@@ -499,6 +1272,51 @@ class SimulatedAnnealer():
 
 
 
+############################
+_load_shift_worker_state = {}
+
+def init_load_shift_worker(payload):
+    """
+    process pool initializer for SimulatedAnnealer.search_load_shift_options_parallel.  Unpickles the optimizer
+    and SundialResource tree once per worker process.
+    :param payload: pickled (optimizer, SundialResource tree, schedule timestamps)
+    :return: None
+    """
+    optimizer, sundial_resources, timestamps = cPickle.loads(payload)
+
+    _load_shift_worker_state["optimizer"]           = optimizer
+    _load_shift_worker_state["sundial_resources"]   = sundial_resources
+    _load_shift_worker_state["loadshift_resources"] = sundial_resources.find_resource_type("LoadShiftCtrlNode")[0]
+    _load_shift_worker_state["timestamps"]          = timestamps
+    _load_shift_worker_state["deadline"]            = optimizer.deadline
+
+############################
+def search_load_shift_option_worker(args):
+    """
+    runs a single optimization pass for one load shift option in a worker process
+    :param args: (ii, worker_seed, time_budget) - index of the load shift option, random seed to use, maximum time
+    for the pass (a timedelta, or None = limited only by the optimizer's deadline)
+    :return: (ii, data for the least cost solution tree - see SundialResourceProfile.get_state)
+    """
+    (ii, worker_seed, time_budget) = args
+    optimizer           = _load_shift_worker_state["optimizer"]
+    sundial_resources   = _load_shift_worker_state["sundial_resources"]
+    loadshift_resources = _load_shift_worker_state["loadshift_resources"]
+
+    seed(worker_seed)
+    numpy.random.seed(worker_seed)
+
+    optimizer.deadline = _load_shift_worker_state["deadline"]
+    if time_budget is not None:
+        optimizer.deadline = min(optimizer.deadline, datetime.utcnow() + time_budget)
+
+    loadshift_resources.state_vars["DemandForecast_kW"] = loadshift_resources.state_vars["LoadShiftOptions_kW"][ii]
+    sundial_resources.state_vars["DemandForecast_kW"]   = sundial_resources.state_vars["LoadShiftOptions_kW"][ii]
+    least_cost_soln = optimizer.run_optimization(sundial_resources, _load_shift_worker_state["timestamps"])
+
+    return ii, least_cost_soln.get_state()
+
+
 if __name__ == '__main__':
     # Entry point for script
 
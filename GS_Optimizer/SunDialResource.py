@@ -53,6 +53,7 @@ import pytz
 import logging
 import os
 from ObjectiveFunctions import *
+from SOEProjection import project_soe
 from gs_identities import * #(SSA_SCHEDULE_RESOLUTION, SSA_PTS_PER_SCHEDULE, USE_SIM, SIM_START_TIME)
 from gs_utilities import get_gs_time
 _log = logging.getLogger("SDR")
@@ -71,9 +72,56 @@ forecast_keys = ["DemandForecast_kW",
                  "LoadShiftOptions_t"]
 
 REPLACE_T0_FORECAST = False
+EPOCH = datetime(1970, 1, 1, tzinfo=pytz.UTC)
+
+
+##############################################################################
+def parse_timestamps(t_str):
+    """
+    parses a list of datetime strings (in TIME_FORMAT, UTC) into an array of seconds since the epoch
+    :param t_str: list of datetime strings
+    :return: numpy int64 array
+    """
+    return numpy.array(t_str, dtype="datetime64[s]").astype(numpy.int64)
+
+
+##############################################################################
+def count_resources(sundial_resources):
+    """
+    :param sundial_resources: SundialResource instance
+    :return: number of nodes in the tree under (and including) sundial_resources
+    """
+    return 1 + sum([count_resources(virtual_plant) for virtual_plant in sundial_resources.virtual_plants])
+
+
+# time-series fields and per-node scalars stored by SundialResourceProfile, in storage order
+PROFILE_FIELDS  = ["DemandForecast_kW", "EnergyAvailableForecast_kWh", "DeltaEnergy_kWh"]
+PROFILE_SCALARS = ["cost", "total_cost", "energy_synced"]
+
+
+##############################################################################
+class ProfileStateVars(dict):
+    """
+    state_vars dictionary of a SundialResourceProfile node.  Its values are views into the node's rows of the profile
+    tree's storage block, so assigning to an existing key copies the new value into the block, in place, rather than
+    rebinding the key.  New keys are stored as ordinary dictionary entries.
+    """
+
+    ##############################################################################
+    def __setitem__(self, k, v):
+        if k in self:
+            dict.__getitem__(self, k)[...] = v
+        else:
+            dict.__setitem__(self, k, v)
+
+    ##############################################################################
+    def update(self, *args, **kwargs):
+        for k, v in dict(*args, **kwargs).items():
+            self[k] = v
+
 
 ############################
-class SundialResourceProfile():
+class SundialResourceProfile(object):
     """
     Defines an object model for storing information about a proposed DER profile (load shape).
     It is used to generate and evaluate the cost of potential load shapes to search for a least-cost solution
@@ -105,10 +153,20 @@ class SundialResourceProfile():
         - The cost and total_cost of the ESS node will be 0.01 x 100 = $1
         - The cost of the system (i.e., the parent node) = 0.10 x 1000 = $100
         - The total_cost of the system = $100 + $1 = $101 = the sum of the parent and all its children
+
+    Storage: the data for an entire tree is held in two contiguous arrays, shared by all of its nodes -
+    self.block, an (n_nodes x len(PROFILE_FIELDS) x n_time_steps) array of time series, and self.scalars, an
+    (n_nodes x len(PROFILE_SCALARS)) array of costs and flags.  Nodes are stored in pre-order, so the top of the tree is
+    row 0 and each subtree occupies a contiguous range of rows; self.block_ind is the row of this node.
+    state_vars values are views into self.block (see ProfileStateVars), and cost, total_cost and energy_synced are
+    views into self.scalars.  A whole tree can therefore be copied with a single array copy (see copy_tree).
+    state_vars must be modified in place or by assigning to its keys - it must not be rebound to a new dictionary.
     """
 
+    __slots__ = ["virtual_plants", "sundial_resources", "state_vars", "profile_index", "block", "scalars", "block_ind"]
+
     ##############################################################################
-    def __init__(self, sundial_resources, schedule_timestamps):
+    def __init__(self, sundial_resources, schedule_timestamps, block=None, scalars=None, block_ind=0):
         """
         Recursively constructs a SundialResourceProfile tree.
         The SundialResourceProfile tree replicates the tree structure of the passed sundial_resource.  Nodes in the
@@ -122,37 +180,132 @@ class SundialResourceProfile():
           associated sundial_resource (if it exists), otherwise, to 0.
         - all other variables initialized to 0
         :param sundial_resources: An instance of SundialResource class
+        :param block, scalars, block_ind: storage for the tree, and this node's row in it.  Set by the parent node
+        when constructing children; if block is None, this node is the top of a new tree and allocates the storage.
         """
-        self.virtual_plants = []
+        if block is None:
+            n_nodes = count_resources(sundial_resources)
+            block   = numpy.zeros((n_nodes,
+                                   len(PROFILE_FIELDS),
+                                   len(sundial_resources.state_vars["DemandForecast_kW"])))
+            scalars = numpy.zeros((n_nodes, len(PROFILE_SCALARS)))
+        self.block     = block
+        self.scalars   = scalars
+        self.block_ind = block_ind
 
         # call SundialResourceProfile constructor for children of the associated sundial_resource instance
+        # each child's subtree occupies the rows following those of its preceding siblings
+        self.virtual_plants = []
+        child_ind = block_ind + 1
         for virtual_plant in sundial_resources.virtual_plants:
-            self.virtual_plants.append(SundialResourceProfile(virtual_plant, schedule_timestamps))
+            self.virtual_plants.append(SundialResourceProfile(virtual_plant, schedule_timestamps,
+                                                              block, scalars, child_ind))
+            child_ind += len(self.virtual_plants[-1].profile_index)
+
+        # maps each SundialResource instance in this subtree to its SundialResourceProfile node
+        self.profile_index = {sundial_resources: self}
+        for virtual_plant in self.virtual_plants:
+            self.profile_index.update(virtual_plant.profile_index)
 
         # initialize self.state_vars
         # DemandForecast_kW is set to the baseline forecast for the resource in question.
         # other state_vars are set to zero.
-        self.state_vars = {"DemandForecast_kW": numpy.array(copy.deepcopy(sundial_resources.state_vars["DemandForecast_kW"])),
-                           "EnergyAvailableForecast_kWh": numpy.array([0.0]*len(sundial_resources.state_vars["DemandForecast_kW"])),
-                           "DeltaEnergy_kWh": numpy.array([0.0]*len(sundial_resources.state_vars["DemandForecast_kW"]))}
+        self.state_vars = ProfileStateVars([(k, block[block_ind, ii]) for (ii, k) in enumerate(PROFILE_FIELDS)])
+        self.state_vars["DemandForecast_kW"] = numpy.array(sundial_resources.state_vars["DemandForecast_kW"], dtype=float)
         try:
             # if exists - initialize to same value as the associated sundial_resource instance
             # fixme - energyavailableforecast not getting initialized correctly in sdr
-            self.state_vars["EnergyAvailableForecast_kWh"] = copy.deepcopy(sundial_resources.state_vars["EnergyAvailableForecast_kWh"])
+            self.state_vars["EnergyAvailableForecast_kWh"] = numpy.array(sundial_resources.state_vars["EnergyAvailableForecast_kWh"], dtype=float)
         except: # otherwise - resource does not have storage capability, so ignore
             pass
 
         self.sundial_resources = sundial_resources
+        self.energy_synced = False # True if EnergyAvailableForecast_kWh is known to be the running sum of
+                                   # DeltaEnergy_kWh (see ESSResource.check_constraints2)
 
         self.cost = 0.0
         self.total_cost = self.calc_cost()
 
     ##############################################################################
-    def copy_profile(self, source):
-        self.state_vars = copy.deepcopy(source.state_vars)
+    @property
+    def cost(self):
+        return self.scalars[self.block_ind, 0]
+
+    @cost.setter
+    def cost(self, value):
+        self.scalars[self.block_ind, 0] = value
+
+    @property
+    def total_cost(self):
+        return self.scalars[self.block_ind, 1]
+
+    @total_cost.setter
+    def total_cost(self, value):
+        self.scalars[self.block_ind, 1] = value
+
+    @property
+    def energy_synced(self):
+        return bool(self.scalars[self.block_ind, 2])
+
+    @energy_synced.setter
+    def energy_synced(self, value):
+        self.scalars[self.block_ind, 2] = bool(value)
+
+    ##############################################################################
+    def copy_profile(self, source, ind=None):
+        """
+        Copies state_vars from source into this profile's existing numpy buffers, in place (no allocation).
+        Falls back to a deep copy for entries that are not arrays of matching shape.
+        :param source: SundialResourceProfile instance
+        :param ind: if set, source and this profile are known to differ only at index ind and later - only that
+        suffix of each time series is copied.
+        :return: None
+        """
+        for k, v in source.state_vars.items():
+            try:
+                if ind is None:
+                    numpy.copyto(self.state_vars[k], v)
+                else:
+                    self.state_vars[k][ind:] = v[ind:]
+            except (KeyError, TypeError, ValueError):
+                self.state_vars[k] = copy.deepcopy(v)
+        self.energy_synced = source.energy_synced
         self.cost = source.cost
         self.total_cost = source.total_cost
 
+    ##############################################################################
+    def copy_tree(self, source, ind=None):
+        """
+        Copies the profiles and costs of every node in source's tree into this profile's tree, in place.  Source and
+        this profile must be the tops of trees with the same topology.
+        :param source: SundialResourceProfile instance
+        :param ind: if set, only time series values from index ind onward are copied (see copy_profile)
+        :return: None
+        """
+        if ind is None:
+            numpy.copyto(self.block, source.block)
+        else:
+            numpy.copyto(self.block[:, :, ind:], source.block[:, :, ind:])
+        numpy.copyto(self.scalars, source.scalars)
+
+    ##############################################################################
+    def get_state(self):
+        """
+        :return: (block, scalars) - a copy of the data for the entire tree, e.g., to hold one member of a
+        population of solutions, or to return a solution from a worker process.  Restore with set_state
+        """
+        return self.block.copy(), self.scalars.copy()
+
+    ##############################################################################
+    def set_state(self, state):
+        """
+        copies data previously returned by get_state on a tree with the same topology into this tree, in place
+        :param state: (block, scalars)
+        :return: None
+        """
+        numpy.copyto(self.block, state[0])
+        numpy.copyto(self.scalars, state[1])
+
     ##############################################################################
     def calc_cost(self):
         """
@@ -198,6 +351,116 @@ class SundialResourceProfile():
                     self.state_vars[k] += virtual_plant.state_vars[k]
 
 
+##############################################################################
+class FlatProfileTree():
+    """
+    Flat view of a SundialResourceProfile tree, compiled once per optimization pass so that the profiles of
+    non-terminal nodes can be updated from the profiles of controllable nodes without traversing the tree.
+
+    Nodes are indexed in the same (pre-order) order as SimulatedAnnealer.get_resource_list.  Controllable nodes are
+    those whose resource_type is in ctrl_resource_types.  self.incidence is an (n_nodes x n_ctrl) matrix, with incidence[i, j] = 1 if node i is
+    controllable node j or one of its ancestors.  Given the change in each controllable node's profile relative to
+    its baseline (the profile at compile time), every node's profile is:
+        DemandForecast_kW = baseline + incidence x (change in controllable node demand)
+        EnergyAvailableForecast_kWh, DeltaEnergy_kWh = incidence x (controllable node values)
+    i.e., the stored energy of a non-terminal node is the sum over the storage devices below it.
+
+    Only nodes with a non-zero row in self.incidence ("path" nodes) are affected by a change to a controllable node,
+    so only their profiles and costs are updated.  Any number of controllable nodes, at any depth, is supported.
+    """
+
+    ##############################################################################
+    def __init__(self, profile, ctrl_resource_types=("ESSCtrlNode",)):
+        """
+        :param profile: SundialResourceProfile instance - top of the tree
+        :param ctrl_resource_types: resource_types of the controllable nodes
+        """
+        self.nodes  = []
+        self.parent = []
+        self.add_node(profile, None)
+
+        self.ctrl_ind   = [ii for ii, node in enumerate(self.nodes)
+                           if node.sundial_resources.resource_type in ctrl_resource_types]
+        self.ctrl_nodes = [self.nodes[ii] for ii in self.ctrl_ind]
+
+        self.incidence = numpy.zeros((len(self.nodes), len(self.ctrl_ind)))
+        for jj, ii in enumerate(self.ctrl_ind):
+            while ii is not None:
+                self.incidence[ii, jj] = 1.0
+                ii = self.parent[ii]
+
+        # path nodes, excluding the controllable nodes themselves - these are the nodes that update() writes to
+        path_ind = numpy.flatnonzero(self.incidence.any(axis=1))
+        self.path_nodes     = [self.nodes[ii] for ii in path_ind]
+        self.derived_ind    = [ii for ii in path_ind if ii not in self.ctrl_ind]
+        self.derived_nodes  = [self.nodes[ii] for ii in self.derived_ind]
+        self.derived_incidence = self.incidence[self.derived_ind]
+
+        # demand of each derived node that does not come from a controllable node
+        ctrl_baseline = numpy.array([node.state_vars["DemandForecast_kW"] for node in self.ctrl_nodes], dtype=float)
+        self.derived_offset = numpy.array([node.state_vars["DemandForecast_kW"] for node in self.derived_nodes], dtype=float)
+        if len(self.derived_nodes) > 0:
+            self.derived_offset -= numpy.dot(self.derived_incidence, ctrl_baseline)
+
+        # rows of the controllable and derived nodes in the tree's storage block
+        self.block        = profile.block
+        self.ctrl_rows    = numpy.array([node.block_ind for node in self.ctrl_nodes], dtype=int)
+        self.derived_rows = numpy.array([node.block_ind for node in self.derived_nodes], dtype=int)
+        self.demand_field = PROFILE_FIELDS.index("DemandForecast_kW")
+
+        # (node, row, rows of its children) for each path node, children before parents - used by calc_cost to
+        # update cost and total_cost directly in the tree's scalars array
+        self.scalars        = profile.scalars
+        self.path_cost_rows = [(node, node.block_ind, [virtual_plant.block_ind for virtual_plant in node.virtual_plants])
+                               for node in reversed(self.path_nodes)]
+
+    ##############################################################################
+    def add_node(self, profile, parent_ind):
+        """
+        appends profile and its descendants to self.nodes, in pre-order
+        """
+        ind = len(self.nodes)
+        self.nodes.append(profile)
+        self.parent.append(parent_ind)
+        for virtual_plant in profile.virtual_plants:
+            self.add_node(virtual_plant, ind)
+
+    ##############################################################################
+    def update(self):
+        """
+        updates the profiles of all non-controllable path nodes, in place, from the current profiles of the
+        controllable nodes.  Operates directly on the tree's storage block (see SundialResourceProfile)
+        :return: None
+        """
+        if len(self.ctrl_rows) == 1:
+            # every derived node is an ancestor of the only controllable node - no need to form the matrix product
+            ctrl = self.block[self.ctrl_rows[0]]
+            for (row, offset) in zip(self.derived_rows, self.derived_offset):
+                self.block[row] = ctrl
+                self.block[row, self.demand_field] += offset
+        elif len(self.derived_rows) > 0:
+            self.block[self.derived_rows] = numpy.tensordot(self.derived_incidence,
+                                                            self.block[self.ctrl_rows],
+                                                            axes=1)
+            self.block[self.derived_rows, self.demand_field] += self.derived_offset
+
+    ##############################################################################
+    def calc_cost(self):
+        """
+        Recalculates cost and total_cost of the path nodes only - the cost of every other node, and of its subtree,
+        does not depend on the controllable nodes.  Equivalent to calling calc_cost on the top node.
+        :return: total cost of the tree
+        """
+        scalars = self.scalars
+        for (node, row, child_rows) in self.path_cost_rows: # children before parents
+            cost       = node.sundial_resources.calc_cost(node.state_vars)
+            total_cost = 0.0
+            for child_row in child_rows:
+                total_cost += scalars[child_row, 1]
+            scalars[row, 0] = cost
+            scalars[row, 1] = total_cost + cost
+        return scalars[self.nodes[0].block_ind, 1]
+
 
 ##############################################################################
 class SundialResource():
@@ -280,6 +543,7 @@ class SundialResource():
                                       # Set to one for any resource types whose schedule is affected by changes to control signal
 
         self.obj_fcns     = []  # constructor for any applicable objectibve functions
+        self.cost_kernel  = None  # objective functions compiled by compile_cost
 
         # initialize dictionaries for mapping from DERDevice keys to SundialResource keys.
         self.end_pt_update_list    = ["Pwr_kW",
@@ -294,6 +558,7 @@ class SundialResource():
             self.sim_offset = timedelta(0)
 
         self.pts_per_schedule = SSA_PTS_PER_SCHEDULE
+        self.forecast_epochs  = {} # cache of parsed forecast timestamps - see get_forecast_epochs
         self.state_vars    = self.init_state_vars()
         self.schedule_vars = self.init_schedule_vars(gs_start_time)
         self.state_vars.update(self.init_forecast_vars(gs_start_time))
@@ -304,60 +569,80 @@ class SundialResource():
 
         # instantiate children based on resource_cfg instructions
         self.virtual_plants   = []
+        self.parent           = None
+        self.resource_index   = {}  # resource_id -> node, for every node in this subtree (see find_resource)
+        self.resource_type_index = {}  # resource_type -> list of nodes in this subtree (see find_resource_type)
+        self.update_resource_index()
         # todo: consider replacing with an eval command?
         for virtual_plant in resource_cfg["VirtualPlantList"]:
             if virtual_plant["Use"] == "Y":
                 print(virtual_plant["ResourceType"] + " " + virtual_plant["ID"])
                 if virtual_plant["ResourceType"] == 'ESSCtrlNode':
-                    self.virtual_plants.append(
+                    self.add_virtual_plant(
                         ESSResource(virtual_plant, gs_start_time))
                 elif virtual_plant["ResourceType"] == 'PVCtrlNode':
-                    self.virtual_plants.append(
+                    self.add_virtual_plant(
                         PVResource(virtual_plant, gs_start_time))
                 elif (virtual_plant["ResourceType"] == "LoadShiftCtrlNode"):
-                    self.virtual_plants.append(
+                    self.add_virtual_plant(
                         LoadShiftResource(virtual_plant, gs_start_time))
                 elif virtual_plant["ResourceType"] == "Load":
-                    self.virtual_plants.append(
+                    self.add_virtual_plant(
                         BaselineLoadResource(virtual_plant, gs_start_time))
                 elif virtual_plant["ResourceType"] == "SolarPlusStorageCtrlNode":
-                    self.virtual_plants.append(
+                    self.add_virtual_plant(
                         SolarPlusStorageResource(virtual_plant, gs_start_time))
                 else:
-                    self.virtual_plants.append(
+                    self.add_virtual_plant(
                         SundialResource(virtual_plant, gs_start_time))
             else:
                 _log.info("Skipping - "+virtual_plant["ID"])
 
+    ##############################################################################
+    def add_virtual_plant(self, virtual_plant):
+        """
+        Adds a child to this node, and updates the lookup indices of this node and its ancestors
+        :param virtual_plant: SundialResource instance
+        :return: None
+        """
+        self.virtual_plants.append(virtual_plant)
+        virtual_plant.parent = self
+        node = self
+        while node is not None:
+            node.update_resource_index()
+            node = node.parent
+
+    ##############################################################################
+    def update_resource_index(self):
+        """
+        Rebuilds the id and type lookup indices for this node's subtree from its children's indices.  Matches the
+        search order of a recursive traversal - the id index returns the first match in pre-order, and the type index
+        lists matches in post-order (children before parents).
+        :return: None
+        """
+        self.resource_index      = {self.resource_id: self}
+        self.resource_type_index = {}
+        for virtual_plant in self.virtual_plants:
+            for (resource_id, resource) in virtual_plant.resource_index.items():
+                self.resource_index.setdefault(resource_id, resource)
+            for (resource_type, resources) in virtual_plant.resource_type_index.items():
+                self.resource_type_index.setdefault(resource_type, []).extend(resources)
+        self.resource_type_index.setdefault(self.resource_type, []).append(self)
+
     ##############################################################################
     def find_resource(self, resource_id):
         """
-         This function traverses the SundialResource tree to find the object matching resource_id and returns the
-         matching SundialResource instance (or None if not found).
+         Returns the SundialResource instance in this subtree matching resource_id (or None if not found).
          """
-
-        if self.resource_id == resource_id:
-            return self
-        else:
-            for virtual_plant in self.virtual_plants:
-                child = virtual_plant.find_resource(resource_id)
-                if child != None:
-                    return child
-            return None
+        return self.resource_index.get(resource_id)
 
 
     ##############################################################################
     def find_resource_type(self, resource_type):
         """
-         This function traverses the SundialResource tree to find all the objects matching resource_type and
-         returns in a flat list
+         Returns all the SundialResource instances in this subtree matching resource_type, in a flat list
         """
-        resources = []
-        for virtual_plant in self.virtual_plants:
-            resources.extend(virtual_plant.find_resource_type(resource_type))
-        if resource_type == self.resource_type:
-            resources.append(self)
-        return resources
+        return list(self.resource_type_index.get(resource_type, []))
 
     ##############################################################################
     def init_state_vars(self):
@@ -430,6 +715,35 @@ class SundialResource():
                                                                           "%Y-%m-%dT%H:%M:%S").replace(tzinfo=pytz.UTC)
                                                         for ts in t]
         self.state_vars["Nameplate"] = pk_capacity
+        self.update_forecast_epochs()
+
+    ##############################################################################
+    def get_forecast_epochs(self, key="OrigDemandForecast_t_str"):
+        """
+        returns the forecast timestamps in state_vars[key] as seconds since the epoch.  Timestamps are parsed once,
+        and re-parsed only when state_vars[key] is replaced (e.g., when a new forecast arrives)
+        :param key: state_vars key of a list of datetime strings
+        :return: numpy int64 array, or None if state_vars[key] is None
+        """
+        t_str = self.state_vars.get(key)
+        if t_str is None:
+            return None
+        cached = self.forecast_epochs.get(key)
+        if (cached is None) or (cached[0] is not t_str):
+            cached = (t_str, parse_timestamps(t_str))
+            self.forecast_epochs[key] = cached
+        return cached[1]
+
+    ##############################################################################
+    def update_forecast_epochs(self):
+        """
+        parses forecast timestamps after a new forecast has been loaded (see get_forecast_epochs)
+        :return: None
+        """
+        try:
+            self.get_forecast_epochs("OrigDemandForecast_t_str")
+        except (ValueError, TypeError):
+            _log.info("Warning: invalid forecast timestamps for resource - "+self.resource_id)
 
     ##############################################################################
     def update_sundial_resource(self):
@@ -471,6 +785,34 @@ class SundialResource():
                                     tariffs=None,
                                     sim_offset=self.sim_offset,
                                     forecast = self.state_vars)
+        self.compile_cost(len(schedule_timestamps))
+
+    ##############################################################################
+    def compile_cost(self, n_pts):
+        """
+        folds this node's objective functions into a single cost kernel, self.cost_kernel, used by calc_cost.
+        The components of the objective functions that are linear in demand are summed into a single price vector;
+        the remaining components are evaluated by each objective function's compiled_cost, from values precomputed
+        by ObjectiveFunction.compile_cost.  Called by cfg_cost - the kernel stays valid until cfg_cost is called
+        again.  If any objective function can't be compiled, self.cost_kernel is None and calc_cost falls back
+        to obj_fcn_cost.
+        :param n_pts: number of points in the profiles to be costed
+        :return: None
+        """
+        self.cost_kernel = None
+        price = None
+        terms = []
+        for obj_fcn in self.obj_fcns:
+            compiled = obj_fcn.compile_cost(n_pts)
+            if compiled is None:
+                _log.debug(self.resource_id+": "+obj_fcn.desc+" can't be compiled - using obj_fcn_cost")
+                return
+            (obj_fcn_price, nonlinear) = compiled
+            if obj_fcn_price is not None:
+                price = obj_fcn_price if price is None else price + obj_fcn_price
+            if nonlinear == True:
+                terms.append(obj_fcn)
+        self.cost_kernel = (price, terms, (n_pts,))
 
     ##############################################################################
     def interpolate_soe(self, schedule_timestamps, cur_time):
@@ -505,31 +847,19 @@ class SundialResource():
 
         if self.virtual_plants == []: # terminal node
             ## do interpolation
-            _log.debug(str(self.state_vars["OrigDemandForecast_kW"]))
+            _log.debug("%s", self.state_vars["OrigDemandForecast_kW"])
             self.state_vars["DemandForecast_kW"]           = self.interpolate_values(schedule_timestamps,
                                                                                      self.state_vars["OrigDemandForecast_kW"])
             self.state_vars["EnergyAvailableForecast_kWh"] = self.state_vars["OrigEnergyAvailableForecast_kWh"]
 
-            try:
-                self.state_vars["LoadShiftOptions_kW"] = self.interpolate_values(schedule_timestamps,
-                                                                                 self.state_vars["OrigLoadShiftOptions_kW"],
-                                                                                 interpolate_load_shift=True)
-                self.state_vars["LoadShiftOptions_t"] = schedule_timestamps
-            except KeyError: # not a load shift resource
-                pass
-
         else:
             self.state_vars["DemandForecast_kW"] = numpy.array([0.0] * self.pts_per_schedule)
             self.state_vars["EnergyAvailableForecast_kWh"] = numpy.array([0.0] * self.pts_per_schedule)
-            self.state_vars["LoadShiftOptions_kW"] =  numpy.array([[0.0] * self.pts_per_schedule]*20)
-
-            #FIXME - hard coded max = 20 ls options.
 
-            len_load_options = 0
             for virtual_plant in self.virtual_plants:
                 # retrieve data from child nodes and sum
-                _log.debug("**********************"+self.resource_id)
-                _log.debug("***********************"+virtual_plant.resource_id)
+                _log.debug("**********************%s", self.resource_id)
+                _log.debug("***********************%s", virtual_plant.resource_id)
                 virtual_plant.interpolate_forecast(schedule_timestamps)
 
 
@@ -540,27 +870,46 @@ class SundialResource():
                     self.state_vars["DemandForecast_kW"]           += virtual_plant.state_vars["DemandForecast_kW"]
                     self.state_vars["EnergyAvailableForecast_kWh"] += virtual_plant.state_vars["EnergyAvailableForecast_kWh"]
 
-                try:
-                    self.state_vars["LoadShiftOptions_kW"][0:len(virtual_plant.state_vars["LoadShiftOptions_kW"])] \
-                        += virtual_plant.state_vars["LoadShiftOptions_kW"]
-                    len_load_options = len(virtual_plant.state_vars["LoadShiftOptions_kW"])
-                except KeyError:
-                    pass
-                except TypeError:
-                    pass
+            self.state_vars["LoadShiftOptions_kW"] = self.aggregate_load_shift_options()
+            _log.debug("%s", self.state_vars["DemandForecast_kW"])
+            _log.debug("%s", self.state_vars["EnergyAvailableForecast_kWh"])
+            _log.debug("%s", self.state_vars["LoadShiftOptions_kW"])
 
-                try:
-                    self.state_vars["LoadShiftOptions_kW"] += [virtual_plant.state_vars["DemandForecast_kW"] for ii in range(0,20)]
-                except:
-                    self.state_vars["LoadShiftOptions_kW"] = None
+    ##############################################################################
+    def get_load_shift_options(self):
+        """
+        :return: this resource's load shift option matrix (n_options x SSA_PTS_PER_SCHEDULE numpy array), or None if
+        it has no valid load shift options (e.g., not a load shift resource, or stale option data)
+        """
+        options = self.state_vars.get("LoadShiftOptions_kW")
+        if (isinstance(options, numpy.ndarray) == False) or (options.ndim != 2) or (len(options) == 0) or \
+                (options.dtype == object):
+            return None
+        return options
 
-            try:
-                self.state_vars["LoadShiftOptions_kW"] = self.state_vars["LoadShiftOptions_kW"][0:len_load_options]
-            except:
-                pass
-            _log.debug(str(self.state_vars["DemandForecast_kW"]))
-            _log.debug(str(self.state_vars["EnergyAvailableForecast_kWh"]))
-            _log.debug(str(self.state_vars["LoadShiftOptions_kW"]))
+    ##############################################################################
+    def aggregate_load_shift_options(self):
+        """
+        Builds the load shift option matrix for a non-terminal node from its children (see interpolate_forecast).
+        Row k is this node's demand when load shift option k is selected - i.e., the sum of row k of each child that
+        has load shift options, plus the demand forecast of each child that does not.  The matrix is sized from the
+        largest option set among the children; a child with fewer options contributes its demand forecast to the
+        remaining rows.
+        :return: (n_options x SSA_PTS_PER_SCHEDULE) numpy array, with 0 rows if no descendant has load shift options,
+        or None if this node's demand forecast is not available.
+        """
+        if self.state_vars["DemandForecast_kW"][0] is None:
+            return None
+
+        option_sets = [(virtual_plant, virtual_plant.get_load_shift_options()) for virtual_plant in self.virtual_plants]
+        n_options   = max([len(options) for (virtual_plant, options) in option_sets if options is not None] + [0])
+
+        # start from this node's demand forecast in every row, then swap each child's demand forecast for its options
+        options_kW = numpy.tile(numpy.asarray(self.state_vars["DemandForecast_kW"], dtype=float), (n_options, 1))
+        for (virtual_plant, options) in option_sets:
+            if options is not None:
+                options_kW[:len(options)] += options - virtual_plant.state_vars["DemandForecast_kW"]
+        return options_kW
 
     ##############################################################################
     def find_starting_ts(self, schedule_timestamps, orig_ts):
@@ -568,100 +917,68 @@ class SundialResource():
         find the index of the forecast that most closely precedes the timestamp of the current schedule, and
         calculate the scale factor to use to align to the baseline time.
         :param schedule_timestamps: timestamps of the current schedule
-        :param orig_ts: timestamps of the underlying forecast that we need to interpolate
+        :param orig_ts: timestamps of the underlying forecast that we need to interpolate, in seconds since the epoch
+        (see get_forecast_epochs)
         :return: ts_ind - starting index for the underlying forecast that most closely precedes schedule_timestamps,
                  scale_factor - factor used to interpolate between timestamps
         """
         # FIXME - for a load shift - need to figure out how to define the "start" index - t+1?
-
-        ts_ind = 0
-        cont = True
-        while (cont == True) and (ts_ind < len(orig_ts)):
-            cur_time_elapsed = float((schedule_timestamps[0] -
-                                      datetime.strptime(orig_ts[ts_ind],
-                                                        TIME_FORMAT).replace(
-                                          tzinfo=pytz.UTC)).total_seconds())  # seconds since the first forecast ts
-            if cur_time_elapsed < 0:
-                # implies that we are one index past the start of the schedule - subtract one from the current index
-                # to get the starting point, and calculate a scale factor based on linear interpolation to convert
-                # original forecast time to align with the schedule timestamps
-                cont = False
-                ts_ind -= 1
-                ts_ind = max(ts_ind, 0)
-
-                time_elapsed = float((schedule_timestamps[0] -
-                                      datetime.strptime(orig_ts[ts_ind],
-                                                        TIME_FORMAT).replace(
-                                          tzinfo=pytz.UTC)).total_seconds())  # seconds since the first forecast ts
-                _log.debug("time elapsed = " + str(time_elapsed))
-                scale_factor = time_elapsed / float(SSA_SCHEDULE_RESOLUTION * SEC_PER_MIN)
-                _log.debug("scale factor= " + str(scale_factor))
-            else:
-                ts_ind += 1
-
-        if cont == True:
-            ts_ind = None # stale data!
-        else:
-            _log.debug('ts ind is ' + str(ts_ind))
+        schedule_start = (schedule_timestamps[0] - EPOCH).total_seconds()
+
+        # the first forecast timestamp after the start of the schedule is one index past the starting point
+        after_start = orig_ts > schedule_start
+        if not after_start.any():
+            return None, None # stale data!
+        ts_ind = max(int(numpy.argmax(after_start)) - 1, 0)
+
+        # scale factor based on linear interpolation to convert original forecast time to align with the schedule
+        # timestamps
+        time_elapsed = schedule_start - float(orig_ts[ts_ind])  # seconds since the first forecast ts
+        scale_factor = time_elapsed / float(SSA_SCHEDULE_RESOLUTION * SEC_PER_MIN)
+        _log.debug("ts ind is %s; time elapsed = %s; scale factor = %s", ts_ind, time_elapsed, scale_factor)
         return ts_ind, scale_factor
 
     ##############################################################################
     def calculate_interpolated_1d(self, orig_forecast, ts_ind, max_ind, scale_factor, interpolated_demand):
         """
-        Interpolates an individual value to align a forecast timestamps with a schedule timestamp
+        Interpolates a forecast to align forecast timestamps with schedule timestamps
         This approach treats the forecast as a circular buffer, which makes sense for daily forecasts
         i.e., it the original forecast buffer wraps around if it gets to the end prior to filling the schedule forecast
         buffer.  Tthe underlying assumption is that we can fill in any missing forecast data with data from the previous
         day.
         :param orig_forecast: Underlying forecast
-        :param ii: index to interpolate
+        :param ts_ind: index of the first point to interpolate
         :param max_ind: indicates the end of the orig_forecast buffer - need to wrap around
         :param scale_factor: factor used to calculate interpolation
-        :return: interpolated_value - calculated value of the new, schedule-aligned forecast
-                 ii - index into the orginal forecast buffer for the next interpolation
+        :param interpolated_demand: buffer of length SSA_PTS_PER_SCHEDULE for the schedule-aligned forecast
+        :return: interpolated_demand - calculated values of the new, schedule-aligned forecast
         """
-        cnt = 0
-        ii = ts_ind
-        while cnt < SSA_PTS_PER_SCHEDULE:
-            if ii == max_ind:
-                interpolated_demand[cnt] = orig_forecast[ii] + \
-                                           (orig_forecast[0] -
-                                            orig_forecast[ii]) * scale_factor
-                ii = 0
-            else:
-                _log.debug("ii= " + str(ii) + "; init_demand[ii] = " + str(orig_forecast[ii]))
-                interpolated_demand[cnt] = orig_forecast[ii] + \
-                                           (orig_forecast[ii + 1] -
-                                            orig_forecast[ii]) * scale_factor
-                ii += 1
-            cnt += 1
-        return interpolated_demand
+        orig_forecast = numpy.asarray(orig_forecast, dtype=float)
+        ii     = (ts_ind + numpy.arange(len(interpolated_demand))) % (max_ind + 1)
+        ii_nxt = (ii + 1) % (max_ind + 1)
+        return orig_forecast[ii] + (orig_forecast[ii_nxt] - orig_forecast[ii]) * scale_factor
 
     ##############################################################################
     def calculate_interpolated_2d(self, orig_forecast, ts_ind, max_ind, scale_factor, interpolated_demand):
-        cnt = 0
-        ii  = ts_ind
-        _log.debug("****** interpolate 2d*****")
-        _log.debug(orig_forecast)
-
-        while (cnt<SSA_PTS_PER_SCHEDULE) and (ii<len(orig_forecast[0])):
-
-        #for ii in range(ts_ind, SSA_PTS_PER_SCHEDULE):
-            for jj in range (0,len(orig_forecast)):
-
-                if ii == len(orig_forecast[jj])-1:
-                    interpolated_demand[jj][cnt] = orig_forecast[jj][ii] + \
-                                         (0 - orig_forecast[jj][ii]) * scale_factor
-                else:
-                    interpolated_demand[jj][cnt] = orig_forecast[jj][ii] + \
-                                         (orig_forecast[jj][ii + 1] -
-                                          orig_forecast[jj][ii]) * scale_factor
-            cnt+= 1
-            ii += 1
+        """
+        Interpolates each row of a 2-d forecast (e.g., load shift options) to align forecast timestamps with schedule
+        timestamps.  Unlike calculate_interpolated_1d, the forecast does not wrap around - the value after the end
+        of each row is taken to be 0, and schedule points after the end of the forecast are left at 0.
+        :param orig_forecast: Underlying forecast - list of rows
+        :param ts_ind: index of the first point to interpolate
+        :param max_ind: unused
+        :param scale_factor: factor used to calculate interpolation
+        :param interpolated_demand: (number of rows x SSA_PTS_PER_SCHEDULE) buffer for the schedule-aligned forecast
+        :return: interpolated_demand - calculated values of the new, schedule-aligned forecast
+        """
+        orig_forecast = numpy.asarray(orig_forecast, dtype=float)
+        interpolated_demand = numpy.array(interpolated_demand, dtype=float)
+        n_pts  = max(min(interpolated_demand.shape[1], orig_forecast.shape[1] - ts_ind), 0)
+        ii     = ts_ind + numpy.arange(n_pts)
+        padded = numpy.concatenate((orig_forecast, numpy.zeros((orig_forecast.shape[0], 1))), axis=1)
+        interpolated_demand[:, :n_pts] = orig_forecast[:, ii] + (padded[:, ii + 1] - orig_forecast[:, ii]) * scale_factor
         return interpolated_demand
 
-
-
     ##############################################################################
     def interpolate_values(self, schedule_timestamps, init_demand, interpolate_load_shift=False):
         """
@@ -675,14 +992,13 @@ class SundialResource():
         SEC_PER_MIN = 60.0
 
         if interpolate_load_shift == False:
-            orig_ts = self.state_vars["OrigDemandForecast_t_str"]
+            orig_ts = self.get_forecast_epochs("OrigDemandForecast_t_str")
         else:
-            orig_ts = self.state_vars["OrigLoadShiftOptions_t_str"]
+            orig_ts = self.get_forecast_epochs("OrigLoadShiftOptions_t_str")
 
-        _log.debug(self.resource_id + "; original time stamps are: ")
-        _log.debug(str(orig_ts))
-        _log.debug("Timestamps are: "+str(schedule_timestamps))
-        _log.debug(init_demand)
+        _log.debug("%s; original time stamps are: %s", self.resource_id, orig_ts)
+        _log.debug("Timestamps are: %s", schedule_timestamps)
+        _log.debug("%s", init_demand)
 
         if interpolate_load_shift == False:
             interpolated_demand = [0.0] * SSA_PTS_PER_SCHEDULE  # Initialize to 0
@@ -695,8 +1011,6 @@ class SundialResource():
 
             ts_ind, scale_factor = self.find_starting_ts(schedule_timestamps, orig_ts)
 
-            _log.debug("ts_ind="+str(ts_ind)+"; scale factor = "+str(scale_factor))
-
             #### check contingencies
             if ts_ind is None: # implies that forecast data is totally stale (>1 day old).
                 interpolated_demand[0] = None
@@ -729,7 +1043,7 @@ class SundialResource():
             ### but need to make sure that the ESS data is set to zeros - not to None
 
 
-        _log.debug(self.resource_id+": demand forecast is "+str(interpolated_demand))
+        _log.debug("%s: demand forecast is %s", self.resource_id, interpolated_demand)
 
         return numpy.array(interpolated_demand)
 
@@ -737,10 +1051,25 @@ class SundialResource():
     ############################
     def calc_cost(self, profile_state_vars, linear_approx = False):
         """
-        Loops through each of the SundialResource's objective functions, calculates cost for the given profile
+        Loops through each of the SundialResource's objective functions, calculates cost for the given profile.
+        If the time-series in profile_state_vars are 2-d (N x SSA_PTS_PER_SCHEDULE), they are treated as a batch of
+        N candidate profiles (see calc_cost_batch)
         :param profile: profile is a time-series list of values
-        :return:
+        :return: cost, or numpy array of N costs for a batch
         """
+        if (self.cost_kernel is not None) and (linear_approx == False):
+            (price, terms, shape) = self.cost_kernel
+            demand = profile_state_vars["DemandForecast_kW"]
+            if getattr(demand, "shape", None) == shape:
+                # compiled cost kernel (see compile_cost)
+                energy = profile_state_vars.get("EnergyAvailableForecast_kWh")
+                cost   = 0.0 if price is None else numpy.dot(price, demand)
+                for obj_fcn in terms:
+                    cost += obj_fcn.compiled_cost(demand, energy)
+                return cost
+
+        if numpy.ndim(profile_state_vars["DemandForecast_kW"]) == 2:
+            return self.calc_cost_batch(profile_state_vars, linear_approx)
 
         cost = 0 #[]
         for obj_fcn in self.obj_fcns:
@@ -756,6 +1085,22 @@ class SundialResource():
         #    cost += fcn()
         return cost
 
+    ############################
+    def calc_cost_batch(self, profiles, linear_approx = False):
+        """
+        Calculates cost for a batch of candidate profiles, using each objective function's vectorized cost
+        (obj_fcn_cost_batch / get_linear_approximation_batch)
+        :param profiles: state_vars-style dictionary of (N x SSA_PTS_PER_SCHEDULE) numpy arrays
+        :return: numpy array of N costs
+        """
+        cost = numpy.zeros(len(profiles["DemandForecast_kW"]))
+        for obj_fcn in self.obj_fcns:
+            if linear_approx == False:
+                cost += obj_fcn.obj_fcn_cost_batch(profiles)
+            else:
+                cost += obj_fcn.get_linear_approximation_batch(profiles)
+        return cost
+
 ##############################################################################
 class ESSResource(SundialResource):
     """
@@ -881,6 +1226,41 @@ class ESSResource(SundialResource):
         new_soe = current_soe + delta_energy
         return new_soe, pwr_cmd, delta_energy
 
+    ##############################################################################
+    def apply_soe_constraints(self, profile):
+        """
+        Applies power and SOE constraints to every point of a proposed ESS profile, in time order, starting from
+        StartingSOE_kWh (see update_soe).  Used for profiles that were not generated by perturbing a single point of
+        a feasible profile (e.g., a previous schedule shifted to a new time horizon).
+        :param profile: SundialResourceProfile.state_vars - a profile for which constraints need to be applied.
+        :return: profile - modified SundialResourceProfile.state_vars that does not violate any constraints
+        """
+        profile["DemandForecast_kW"][:], \
+        profile["EnergyAvailableForecast_kWh"][:], \
+        profile["DeltaEnergy_kWh"][:] = self.project_profile(profile["DemandForecast_kW"])
+        return profile
+
+    ##############################################################################
+    def project_profile(self, pwr_request, start_soe=None):
+        """
+        Vectorized equivalent of calling update_soe at every point of a power profile, in time order (see
+        SOEProjection.project_soe)
+        :param pwr_request: requested power, in kW.  Array of length T, or an N x T array of profiles
+        :param start_soe: SOE at the start of the profile(s), in kWh.  Defaults to StartingSOE_kWh
+        :return: pwr_cmd, energy, delta_energy - arrays of the same shape as pwr_request
+        """
+        if start_soe is None:
+            start_soe = self.state_vars["StartingSOE_kWh"]
+        return project_soe(pwr_request,
+                           start_soe,
+                           self.state_vars["MaxSOE_kWh"]*ESS_RESERVE_HIGH,
+                           self.state_vars["MinSOE_kWh"]*ESS_RESERVE_LOW,
+                           self.state_vars["MaxChargePwr_kW"],
+                           self.state_vars["MaxDischargePwr_kW"],
+                           self.state_vars["ChgEff"],
+                           self.state_vars["DischgEff"],
+                           float(SSA_SCHEDULE_RESOLUTION)/60.0)
+
     ##############################################################################
     def get_eff_factor(self, cur_pwr):
         """
@@ -896,9 +1276,8 @@ class ESSResource(SundialResource):
 
 
     ##############################################################################
-    def check_constraints2(self, profile, ind):
+    def check_constraints2(self, profile, ind, incremental=False):
         """
-        This is currently unused.
         It ensures that the proposed ESS charge/discharge schedule does not violate the ESS's high or low SOE
         constraints.
 
@@ -916,8 +1295,13 @@ class ESSResource(SundialResource):
                     call check_constraint(schedule(start_ind:end, soe(start_ind))
 
 
+        If incremental is True, profile["EnergyAvailableForecast_kWh"] must be the running sum of
+        profile["DeltaEnergy_kWh"] on entry (see sync_energy).  A change at ind then shifts the energy at ind and every
+        later index by the same amount, so the energy profile is updated in place rather than re-accumulated.
+
         :param profile: SundialResourceProfile.state_vars - a profile for which a constraint needs to be checked.
         :param ind: starting index that was perturbed
+        :param incremental: if True, update profile["EnergyAvailableForecast_kWh"] in place
         :return: profile - modified SundialResourceProfile.state_vars that does not violate any constraints
         """
         ind = int(ind)
@@ -925,38 +1309,34 @@ class ESSResource(SundialResource):
         min_soe = self.state_vars["MinSOE_kWh"]*ESS_RESERVE_LOW
 
         eff_factor = self.get_eff_factor(profile["DemandForecast_kW"][ind])
-        profile["DeltaEnergy_kWh"][ind] = profile["DemandForecast_kW"][ind] * eff_factor
-
-        energy = numpy.cumsum(profile["DeltaEnergy_kWh"]) + [self.state_vars["StartingSOE_kWh"]] * len(
-            profile["DeltaEnergy_kWh"])
+        energy     = self.set_delta_energy(profile, ind, profile["DemandForecast_kW"][ind] * eff_factor, incremental)
 
         cnt = 0
-        if max(energy) > float(max_soe)+EPSILON: # new command has violated an upper constraint
+        if energy.max() > float(max_soe)+EPSILON: # new command has violated an upper constraint
             # adjust power command downward by an amount equivalent to the SOE violation, after correcting for losses
-            test_val = profile["DemandForecast_kW"][ind]-(max(energy) - max_soe)/eff_factor
+            test_val = profile["DemandForecast_kW"][ind]-(energy.max() - max_soe)/eff_factor
             if (profile["DemandForecast_kW"][ind] > 0.0) & (test_val < 0.0):
                 # implies modified command will go from chg to discharge, so we need to update the impact on
                 # efficiency
                 test_val   = test_val*(eff_factor**2.0)
                 eff_factor = 1.0 / self.state_vars["DischgEff"]
             profile["DemandForecast_kW"][ind] = test_val
-            profile["DeltaEnergy_kWh"][ind] = profile["DemandForecast_kW"][ind] * eff_factor
-            energy = numpy.cumsum(profile["DeltaEnergy_kWh"]) + [self.state_vars["StartingSOE_kWh"]] * len(profile["DeltaEnergy_kWh"])
+            energy = self.set_delta_energy(profile, ind, profile["DemandForecast_kW"][ind] * eff_factor, incremental)
             cnt += 1
-        if min(energy) < float(min_soe)-EPSILON: # new command has violated a lower constraint
+        if energy.min() < float(min_soe)-EPSILON: # new command has violated a lower constraint
             # adjust power command upward by amount equivalent to SOE violation, after correcting for losses
-            test_val = profile["DemandForecast_kW"][ind] + (min_soe-min(energy))/eff_factor
+            test_val = profile["DemandForecast_kW"][ind] + (min_soe-energy.min())/eff_factor
             if (profile["DemandForecast_kW"][ind] < 0.0) & (test_val > 0.0):
                 # implies modified command will go from dicharge to charge
                 test_val   = test_val*(eff_factor**2.0)
                 eff_factor = self.state_vars["ChgEff"]
             profile["DemandForecast_kW"][ind] = test_val
-            profile["DeltaEnergy_kWh"][ind] = profile["DemandForecast_kW"][ind] * eff_factor
-            energy = numpy.cumsum(profile["DeltaEnergy_kWh"]) + [self.state_vars["StartingSOE_kWh"]] * len(profile["DeltaEnergy_kWh"])
+            energy = self.set_delta_energy(profile, ind, profile["DemandForecast_kW"][ind] * eff_factor, incremental)
             cnt += 1
 
-        if cnt == 2:
-            _log.info("What the hey??")  # should never happen!
+        if cnt == 2:  # should never happen - the first correction should satisfy both SOE limits
+            _log.debug("check_constraints2: "+self.resource_id+" power command at index "+str(ind)+
+                       " was corrected for both SOE limits")
 
         #if (self.state_vars["Nameplate"]) != 0.0:
         #    profile["Weight"][ind] = profile["DemandForecast_kW"][ind]/float(self.state_vars["Nameplate"])
@@ -965,6 +1345,86 @@ class ESSResource(SundialResource):
         profile["EnergyAvailableForecast_kWh"] = energy
         return profile
 
+    ##############################################################################
+    def set_delta_energy(self, profile, ind, delta_energy, incremental=False):
+        """
+        Sets profile["DeltaEnergy_kWh"][ind] and returns the resulting energy profile (see check_constraints2)
+        :param profile: SundialResourceProfile.state_vars
+        :param ind: index to set
+        :param delta_energy: new value of DeltaEnergy_kWh at ind, in kWh
+        :param incremental: if True, shift profile["EnergyAvailableForecast_kWh"] in place; otherwise re-accumulate
+        the energy profile from DeltaEnergy_kWh
+        :return: energy - numpy array of energy, in kWh
+        """
+        if incremental == True:
+            profile["EnergyAvailableForecast_kWh"][ind:] += delta_energy - profile["DeltaEnergy_kWh"][ind]
+            profile["DeltaEnergy_kWh"][ind] = delta_energy
+            return profile["EnergyAvailableForecast_kWh"]
+        profile["DeltaEnergy_kWh"][ind] = delta_energy
+        return numpy.cumsum(profile["DeltaEnergy_kWh"]) + self.state_vars["StartingSOE_kWh"]
+
+    ##############################################################################
+    def sync_energy(self, profile):
+        """
+        Re-accumulates profile["EnergyAvailableForecast_kWh"] from profile["DeltaEnergy_kWh"], in place, so that
+        check_constraints2 can be called with incremental=True
+        :param profile: SundialResourceProfile.state_vars
+        :return: None
+        """
+        numpy.add(numpy.cumsum(profile["DeltaEnergy_kWh"]), self.state_vars["StartingSOE_kWh"],
+                  out=profile["EnergyAvailableForecast_kWh"])
+
+    ##############################################################################
+    def check_constraints_batch(self, profiles, ind):
+        """
+        Vectorized version of check_constraints2 for a batch of candidate ESS profiles, each of which has been
+        perturbed at a single point.  Row n of each time-series array in profiles was perturbed at index ind[n].
+        The same closed-form correction as check_constraints2 is applied to every row that violates the high or low
+        SOE constraint.
+        :param profiles: state_vars-style dictionary whose time-series entries are (N x SSA_PTS_PER_SCHEDULE) numpy
+        arrays
+        :param ind: numpy array of length N - index that was perturbed in each row
+        :return: profiles - modified in place so that no row violates a constraint
+        """
+        rows = numpy.arange(len(ind))
+        max_soe = self.state_vars["MaxSOE_kWh"]*ESS_RESERVE_HIGH
+        min_soe = self.state_vars["MinSOE_kWh"]*ESS_RESERVE_LOW
+        chg_eff = self.state_vars["ChgEff"]
+        dischg_factor = 1.0 / self.state_vars["DischgEff"]
+
+        pwr = profiles["DemandForecast_kW"][rows, ind]
+        eff_factor = numpy.where(pwr >= 0.0, chg_eff, dischg_factor)
+        profiles["DeltaEnergy_kWh"][rows, ind] = pwr * eff_factor
+        energy = numpy.cumsum(profiles["DeltaEnergy_kWh"], axis=1) + self.state_vars["StartingSOE_kWh"]
+
+        # rows that violate the upper constraint - adjust power command downward
+        excess = energy.max(axis=1) - max_soe
+        violation = excess > EPSILON
+        if violation.any():
+            test_val = pwr - excess / eff_factor
+            chg_to_dischg = violation & (pwr > 0.0) & (test_val < 0.0)
+            test_val = numpy.where(chg_to_dischg, test_val * eff_factor**2.0, test_val)
+            eff_factor = numpy.where(chg_to_dischg, dischg_factor, eff_factor)
+            pwr = numpy.where(violation, test_val, pwr)
+            profiles["DeltaEnergy_kWh"][rows, ind] = pwr * eff_factor
+            energy = numpy.cumsum(profiles["DeltaEnergy_kWh"], axis=1) + self.state_vars["StartingSOE_kWh"]
+
+        # rows that violate the lower constraint - adjust power command upward
+        deficit = min_soe - energy.min(axis=1)
+        violation = deficit > EPSILON
+        if violation.any():
+            test_val = pwr + deficit / eff_factor
+            dischg_to_chg = violation & (pwr < 0.0) & (test_val > 0.0)
+            test_val = numpy.where(dischg_to_chg, test_val * eff_factor**2.0, test_val)
+            eff_factor = numpy.where(dischg_to_chg, chg_eff, eff_factor)
+            pwr = numpy.where(violation, test_val, pwr)
+            profiles["DeltaEnergy_kWh"][rows, ind] = pwr * eff_factor
+            energy = numpy.cumsum(profiles["DeltaEnergy_kWh"], axis=1) + self.state_vars["StartingSOE_kWh"]
+
+        profiles["DemandForecast_kW"][rows, ind] = pwr
+        profiles["EnergyAvailableForecast_kWh"] = energy
+        return profiles
+
     ##############################################################################
     def check_constraints(self, profile, ind):
         """
@@ -991,14 +1451,7 @@ class ESSResource(SundialResource):
         #energy = numpy.cumsum(profile["DemandForecast_kW"])+[self.state_vars["SOE_kWh"]]*len(profile["DemandForecast_kW"])
 
         if (max(energy) > max_soe) | (min(energy)<min_soe):
-            for ii in range(len(profile["DemandForecast_kW"])):
-                if ii == 0:
-                    prev_soe = self.state_vars["StartingSOE_kWh"]
-                else:
-                    prev_soe = profile["EnergyAvailableForecast_kWh"][ii - 1]
-                profile["EnergyAvailableForecast_kWh"][ii],\
-                profile["DemandForecast_kW"][ii], \
-                profile["DeltaEnergy_kWh"][ii]    = self.update_soe(profile["DemandForecast_kW"][ii],prev_soe, max_soe, min_soe)
+            profile = self.apply_soe_constraints(profile)
         else:
             profile["EnergyAvailableForecast_kWh"] = energy
 
@@ -1042,6 +1495,7 @@ class LoadShiftResource(SundialResource):
                                           "OrigLoadShiftOptions_t_str",
                                           "IDList",
                                           "OptionsPending"])
+        self.options_cache = None # (OrigLoadShiftOptions_kW, schedule start, interpolated options) - see interpolate_forecast
 
 
     ##############################################################################
@@ -1104,6 +1558,34 @@ class LoadShiftResource(SundialResource):
                                                   for ts in t]
         SundialResource.load_scenario(self, t=t)
 
+    ##############################################################################
+    def update_forecast_epochs(self):
+        SundialResource.update_forecast_epochs(self)
+        try:
+            self.get_forecast_epochs("OrigLoadShiftOptions_t_str")
+        except (ValueError, TypeError):
+            _log.info("Warning: invalid load shift timestamps for resource - "+self.resource_id)
+
+    ##############################################################################
+    def interpolate_forecast(self, schedule_timestamps):
+        """
+        interpolates the demand forecast (see SundialResource.interpolate_forecast) and the load shift options.
+        Interpolated options are cached until a new option set arrives (i.e., OrigLoadShiftOptions_kW is replaced)
+        or the schedule start time changes.
+        :param schedule_timestamps: list of timestamps (length = SSA_PTS_PER_SCHEDULE)
+        :return: None
+        """
+        SundialResource.interpolate_forecast(self, schedule_timestamps)
+
+        orig_options = self.state_vars["OrigLoadShiftOptions_kW"]
+        if (self.options_cache is None) or (self.options_cache[0] is not orig_options) or \
+                (self.options_cache[1] != schedule_timestamps[0]):
+            self.options_cache = (orig_options,
+                                  schedule_timestamps[0],
+                                  self.interpolate_values(schedule_timestamps, orig_options, interpolate_load_shift=True))
+        self.state_vars["LoadShiftOptions_kW"] = self.options_cache[2].copy()
+        self.state_vars["LoadShiftOptions_t"]  = schedule_timestamps
+
 
 
 
@@ -1270,9 +1752,9 @@ def export_schedule(profile, timestamps, update=True):
         export_schedule(virtual_plant, timestamps, update=update)
 
     if update == True:
-        profile.sundial_resources.schedule_vars["DemandForecast_kW"] = profile.state_vars["DemandForecast_kW"]
-        profile.sundial_resources.schedule_vars["EnergyAvailableForecast_kWh"] = profile.state_vars["EnergyAvailableForecast_kWh"]
-        profile.sundial_resources.schedule_vars["DeltaEnergy_kWh"] = profile.state_vars["DeltaEnergy_kWh"]
+        profile.sundial_resources.schedule_vars["DemandForecast_kW"] = numpy.array(profile.state_vars["DemandForecast_kW"])
+        profile.sundial_resources.schedule_vars["EnergyAvailableForecast_kWh"] = numpy.array(profile.state_vars["EnergyAvailableForecast_kWh"])
+        profile.sundial_resources.schedule_vars["DeltaEnergy_kWh"] = numpy.array(profile.state_vars["DeltaEnergy_kWh"])
         profile.sundial_resources.schedule_vars["timestamp"] = copy.deepcopy(timestamps)
         profile.sundial_resources.schedule_vars["total_cost"] = profile.total_cost
 
@@ -0,0 +1,37 @@
+"""
+pytest configuration for the GS_Optimizer tests.
+
+Tests are run from the repository root or from GS_Optimizer/, e.g.:
+    GS_ROOT_DIR=<repo root> python -m pytest GS_Optimizer
+
+GS_ROOT_DIR defaults to the repository root.  Tests that build the example system (see
+ssa_benchmark.build_example_system) run with GS_Optimizer/ as the working directory, since the example configuration
+is loaded by relative path.
+"""
+import os
+import sys
+
+GS_OPTIMIZER_DIR = os.path.dirname(os.path.abspath(__file__))
+os.environ.setdefault("GS_ROOT_DIR", os.path.dirname(GS_OPTIMIZER_DIR) + os.sep)
+for path in [GS_OPTIMIZER_DIR, os.path.join(os.path.dirname(GS_OPTIMIZER_DIR), "lib")]:
+    if path not in sys.path:
+        sys.path.insert(0, path)
+
+import logging
+from datetime import datetime
+import pytest
+
+
+##############################################################################
+@pytest.fixture
+def example_system(monkeypatch):
+    """
+    :return: (sundial_resources, schedule_timestamps) for the example system, starting at 2018-07-01T00:00:00
+    """
+    from ssa_benchmark import build_example_system
+    monkeypatch.chdir(GS_OPTIMIZER_DIR)
+    logging.disable(logging.CRITICAL)
+    try:
+        return build_example_system(datetime(2018, 7, 1, 0, 0, 0))
+    finally:
+        logging.disable(logging.NOTSET)
@@ -0,0 +1,134 @@
+"""
+Micro-benchmark for SimulatedAnnealer.run_ssa_optimization.
+
+Builds the example system used in the __main__ section of SSA_Optimization.py and reports SSA iterations / second
+for:
+- "deepcopy"  - original profile handling: every copy between current_soln and least_cost_soln does a
+                copy.deepcopy of each node's state_vars, and cost is recalculated from scratch each iteration
+- "buffered"  - profiles are copied in place into preallocated numpy buffers, restoring only the perturbed suffix
+- "buffered+delta" - as above, plus incremental (delta) cost evaluation
+
+usage (from GS_Optimizer/):
+    python ssa_benchmark.py [n_iterations] [start_time, e.g. 2018-07-01T00:00:00]
+
+start_time needs to fall within the range of the tariff data files.
+"""
+import sys
+import copy
+import json
+import time
+import logging
+from random import seed
+from datetime import datetime, timedelta
+import pytz
+import numpy
+from SunDialResource import SundialSystemResource
+from SSA_Optimization import SimulatedAnnealer, _log
+from gs_identities import *
+
+MINUTES_PER_HR = 60
+
+# example forecasts from SSA_Optimization.py, indexed to 00:00
+PV_FORECAST = [0, 0, 0, 0, 0, 0, 0, 0, -5.25, -19.585, -95.39, -169.4, -224, -255, -276, -278, -211, -124, -94, -61,
+               -15, -0.45, 0, 0]
+LOAD_FORECAST = [142.4973, 142.4973, 142.4973, 145.9894, 160.094, 289.5996, 339.7752, 572.17, 658.6025, 647.2883,
+                 650.1958, 639.7053, 658.044, 661.158, 660.3772, 673.1098, 640.9227, 523.3306, 542.7008, 499.3727,
+                 357.9398, 160.0936, 145.9894, 142.4973]
+
+
+##############################################################################
+class DeepCopySimulatedAnnealer(SimulatedAnnealer):
+    """
+    reproduces the original behavior of SimulatedAnnealer.copy_profile, for comparison
+    """
+    def copy_profile(self, source, target, ind=None):
+        for (source_child, target_child) in zip(source.virtual_plants, target.virtual_plants):
+            self.copy_profile(source_child, target_child)
+
+        if target.sundial_resources.update_required == 1:
+            target.state_vars.update(copy.deepcopy(dict(source.state_vars)))
+            target.cost = source.cost
+            target.total_cost = source.total_cost
+        return target
+
+
+##############################################################################
+def build_example_system(gs_start_time):
+    """
+    constructs the example system from SSA_Optimization.py, starting at gs_start_time (naive datetime, UTC)
+    :return: sundial_resources, schedule_timestamps
+    """
+    sundial_resource_cfg_list = json.load(open("../cfg/SystemCfg/SundialSystemConfiguration2.json", 'r'))
+    sundial_resources = SundialSystemResource(sundial_resource_cfg_list, gs_start_time.strftime(TIME_FORMAT))
+
+    forecast_timestamps = [(gs_start_time + timedelta(minutes=t)).strftime(TIME_FORMAT)
+                           for t in range(0, SSA_SCHEDULE_DURATION * MINUTES_PER_HR, SSA_SCHEDULE_RESOLUTION)]
+    start_hour = gs_start_time.hour
+
+    sundial_resources.find_resource_type("ESSCtrlNode")[0].load_scenario(init_SOE=500.0,
+                                                                         max_soe=1000.0*ESS_MAX,
+                                                                         min_soe=1000.0*ESS_MIN,
+                                                                         max_chg=500.0,
+                                                                         max_discharge=500.0,
+                                                                         chg_eff=0.9,
+                                                                         dischg_eff=0.9,
+                                                                         demand_forecast=[0.0]*SSA_PTS_PER_SCHEDULE,
+                                                                         t=forecast_timestamps)
+    sundial_resources.find_resource_type("PVCtrlNode")[0].load_scenario(
+        demand_forecast=PV_FORECAST[start_hour:]+PV_FORECAST[:start_hour],
+        pk_capacity=1000.0,
+        t=forecast_timestamps)
+    sundial_resources.find_resource_type("Load")[0].load_scenario(
+        demand_forecast=LOAD_FORECAST[start_hour:]+LOAD_FORECAST[:start_hour],
+        pk_capacity=1000.0,
+        t=forecast_timestamps)
+    sundial_resources.find_resource_type("System")[0].load_scenario()
+
+    schedule_start_time = gs_start_time.replace(tzinfo=pytz.UTC)
+    schedule_timestamps = [schedule_start_time + timedelta(minutes=t)
+                           for t in range(0, SSA_SCHEDULE_DURATION * MINUTES_PER_HR, SSA_SCHEDULE_RESOLUTION)]
+    sundial_resources.interpolate_forecast(schedule_timestamps)
+    sundial_resources.interpolate_soe(schedule_timestamps, schedule_start_time)
+    sundial_resources.cfg_cost(schedule_timestamps,
+                               system_tariff={"threshold": 500},
+                               solarPlusStorage_tariff={"threshold": 150})
+    return sundial_resources, schedule_timestamps
+
+
+##############################################################################
+def run_benchmark(optimizer, sundial_resources, schedule_timestamps, n_iterations):
+    """
+    :return: iterations / second, total cost of the least cost solution
+    """
+    seed(1)
+    optimizer.engine      = "serial"
+    optimizer.nIterations = n_iterations
+    t0 = time.time()
+    least_cost_soln = optimizer.run_optimization(sundial_resources, schedule_timestamps)
+    return n_iterations / (time.time() - t0), least_cost_soln.total_cost
+
+
+if __name__ == '__main__':
+    n_iterations = 100000
+    gs_start_time = datetime(2018, 7, 1, 0, 0, 0)
+    if len(sys.argv) > 1:
+        n_iterations = int(sys.argv[1])
+    if len(sys.argv) > 2:
+        gs_start_time = datetime.strptime(sys.argv[2], TIME_FORMAT)
+
+    _log.setLevel(logging.WARNING)
+    sundial_resources, schedule_timestamps = build_example_system(gs_start_time)
+
+    results = []
+    for (label, optimizer_class, use_delta_cost) in [("deepcopy", DeepCopySimulatedAnnealer, False),
+                                                     ("buffered", SimulatedAnnealer, False),
+                                                     ("buffered+delta", SimulatedAnnealer, True)]:
+        optimizer = optimizer_class()
+        optimizer.use_delta_cost = use_delta_cost
+        optimizer.save_results   = False
+        results.append((label,) + run_benchmark(optimizer, sundial_resources, schedule_timestamps, n_iterations))
+
+    print("")
+    print("{:<16}{:>12}{:>10}{:>14}".format("mode", "iter/sec", "speedup", "total cost"))
+    for (label, iter_per_sec, total_cost) in results:
+        print("{:<16}{:>12.0f}{:>9.2f}x{:>14.2f}".format(label, iter_per_sec, iter_per_sec / results[0][1], total_cost))
@@ -0,0 +1,78 @@
+"Tests the functionality of GeneratePriceMap.py components"
+import numpy
+import pandas
+import pytest
+
+from GeneratePriceMap import generate_cost_map
+
+
+##############################################################################
+def loop_cost_map(sundial_resources, pv_resources, n_time_steps=24, search_resolution=25):
+    """
+    reference - the original generate_cost_map, which costs one test profile at a time and walks the demand steps
+    """
+    epsilon = 0.1
+
+    lb = min(sundial_resources.state_vars["DemandForecast_kW"])
+    ub = max(sundial_resources.state_vars["DemandForecast_kW"])
+    lb = lb*1.2 if lb < 0 else lb*0.8
+    ub = ub*0.8 if ub < 0 else ub*1.2
+    if (lb + 4*search_resolution > ub):
+        lb = -2000
+        ub = 4000
+    else:
+        lb = int(lb - (lb % search_resolution))
+        ub = int(ub - (ub % search_resolution) + search_resolution)
+
+    n_demand_steps = int((ub - lb) / search_resolution + 1)
+    cost_map = pandas.DataFrame([[0.0] * n_demand_steps] * n_time_steps)
+    test_profile = numpy.array([[0.0] * n_time_steps] * n_time_steps)
+    for ii in range(0, n_time_steps):
+        for jj in range(0, n_demand_steps):
+            test_profile[ii][ii] = lb + jj * search_resolution
+            cost_map.iloc[ii, jj] = sundial_resources.calc_cost({"DemandForecast_kW": test_profile[ii]},
+                                                                linear_approx=True)
+
+    v = cost_map.diff(axis=1)
+    v.columns = range(lb, ub + search_resolution, search_resolution)
+    tiers = []
+    for ii in range(0, n_time_steps):
+        jj = max(0.0, lb+2*search_resolution)
+        cnt = 0
+        cur_generation = -1*pv_resources.state_vars["DemandForecast_kW"][ii]
+        tiers.append([{"LB": 0.0}])
+        tiers[ii][cnt].update({"price": round(v.iloc[ii][jj - search_resolution] / search_resolution, 3)})
+        while jj <= ub:
+            same_tier = True
+            while same_tier == True:
+                if jj == ub:
+                    same_tier = False
+                    tiers[ii][cnt].update({"UB": jj+cur_generation})
+                elif ((v.iloc[ii][jj] > v.iloc[ii][jj - search_resolution] + epsilon) or
+                      (v.iloc[ii][jj] < v.iloc[ii][jj - search_resolution] - epsilon)):
+                    if (jj - search_resolution+cur_generation) != tiers[ii][cnt]["LB"]:
+                        tiers[ii][cnt].update({"UB": jj - search_resolution+cur_generation})
+                        cnt += 1
+                        tiers[ii].append({"LB": jj - search_resolution+cur_generation})
+                    tiers[ii][cnt].update({"price": round(v.iloc[ii][jj] / search_resolution, 3)})
+                    same_tier = False
+                jj += search_resolution
+    return tiers
+
+
+##############################################################################
+@pytest.mark.parametrize("threshold", [None, -100, 300])
+@pytest.mark.parametrize("search_resolution", [25, 50])
+def test_generate_cost_map(example_system, threshold, search_resolution):
+    sundial_resources, timestamps = example_system
+    if threshold is not None:
+        sundial_resources.cfg_cost(timestamps, system_tariff={"threshold": threshold})
+    pv = sundial_resources.find_resource_type("PVCtrlNode")[0]
+
+    tiers = generate_cost_map(sundial_resources, pv, search_resolution=search_resolution)
+    assert tiers == loop_cost_map(sundial_resources, pv, search_resolution=search_resolution)
+
+    # a subset of rows gives the same tiers as the full map
+    rows = [0, 5, 13, 23]
+    assert generate_cost_map(sundial_resources, pv, search_resolution=search_resolution, rows=rows) == \
+           [tiers[ii] for ii in rows]
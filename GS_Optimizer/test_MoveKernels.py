@@ -0,0 +1,42 @@
+"Tests the functionality of MoveKernels.py components"
+from random import seed
+import numpy
+
+from MoveKernels import MOVE_KERNELS
+from SSA_Optimization import SimulatedAnnealer
+from SunDialResource import SundialResourceProfile
+
+
+##############################################################################
+def test_pv_curtailment_bounds(example_system):
+    sundial_resources, timestamps = example_system
+    soln = SundialResourceProfile(sundial_resources, timestamps)
+    pv = SimulatedAnnealer().get_resource(soln, "PVCtrlNode")[0]
+    forecast = pv.sundial_resources.state_vars["DemandForecast_kW"]
+    kernel = MOVE_KERNELS["PVCtrlNode"]
+    jump = 0.1
+
+    seed(1)
+    for ii in range(500):
+        ind, old_val = kernel.perturb(pv, jump)
+        new_val = pv.state_vars["DemandForecast_kW"][ind]
+        assert min(forecast[ind], 0.0) <= new_val <= 0.0
+        assert abs(new_val - old_val) <= jump*abs(min(forecast[ind], 0.0)) + 1e-9
+    assert numpy.all(pv.state_vars["DemandForecast_kW"][forecast >= 0.0] == 0.0)
+
+
+##############################################################################
+def test_ess_perturb_in_place(example_system):
+    sundial_resources, timestamps = example_system
+    soln = SundialResourceProfile(sundial_resources, timestamps)
+    ess = SimulatedAnnealer().get_resource(soln, "ESSCtrlNode")[0]
+    state_vars = ess.state_vars
+    kernel = MOVE_KERNELS["ESSCtrlNode"]
+
+    seed(1)
+    assert kernel.perturb(ess, 0.5)[1] is None  # first move syncs the energy profile
+    for ii in range(100):
+        ind, old_val = kernel.perturb(ess, 0.5)
+        assert old_val is not None
+    assert ess.state_vars is state_vars
+    numpy.testing.assert_array_equal(soln.block[ess.block_ind, 0], ess.state_vars["DemandForecast_kW"])
@@ -0,0 +1,185 @@
+"Tests the functionality of ObjectiveFunctions.py components"
+from datetime import datetime, timedelta
+import numpy
+import pandas
+import pytest
+import pytz
+
+from gs_identities import SSA_PTS_PER_SCHEDULE
+from ObjectiveFunctions import ObjectiveFunction, DemandChargeObjectiveFunction, TieredEnergyObjectiveFunction, \
+    BatteryLossModelObjectiveFunction, load_data_cache, save_data_cache
+
+
+##############################################################################
+@pytest.mark.parametrize("n_pts", [1, 2, 24])
+def test_demand_charge_running_max(n_pts):
+    obj_fcn = DemandChargeObjectiveFunction(desc="DemandCharge")
+    numpy.random.seed(1)
+    # coarse values, so that ties for the peak and the second highest point are common
+    profile = {"DemandForecast_kW": numpy.random.randint(0, 10, n_pts)*50.0}
+    obj_fcn.init_delta_cost(profile)
+
+    for ii in range(2000):
+        ind     = numpy.random.randint(n_pts)
+        old_val = profile["DemandForecast_kW"][ind]
+        new_val = numpy.random.randint(0, 10)*50.0
+        new_profile = {"DemandForecast_kW": profile["DemandForecast_kW"].copy()}
+        new_profile["DemandForecast_kW"][ind] = new_val
+
+        assert obj_fcn.delta_cost(profile, ind, old_val, new_val) == \
+               pytest.approx(obj_fcn.obj_fcn_cost(new_profile) - obj_fcn.obj_fcn_cost(profile))
+
+        if numpy.random.random() < 0.5:  # accept - update running statistics before the profile is overwritten
+            obj_fcn.update_delta_cost(profile, ind, old_val, new_val)
+            profile = new_profile
+            demand = numpy.sort(profile["DemandForecast_kW"])
+            max_demand, max_ind, second_max = obj_fcn.running_max
+            assert max_demand == demand[-1]
+            assert profile["DemandForecast_kW"][max_ind] == max_demand
+            assert second_max == (demand[-2] if n_pts > 1 else -numpy.inf)
+
+
+##############################################################################
+def test_obj_fcn_cost_batch(example_system):
+    sundial_resources, timestamps = example_system
+    numpy.random.seed(1)
+    profiles = {k: numpy.random.uniform(-1000.0, 1000.0, (20, len(timestamps)))
+                for k in ["DemandForecast_kW", "EnergyAvailableForecast_kWh", "DeltaEnergy_kWh"]}
+
+    resources = [sundial_resources]
+    while len(resources) > 0:
+        resource = resources.pop()
+        resources.extend(resource.virtual_plants)
+        for obj_fcn in resource.obj_fcns:
+            ref = [obj_fcn.obj_fcn_cost({k: v[ii] for k, v in profiles.items()}) for ii in range(20)]
+            numpy.testing.assert_allclose(obj_fcn.obj_fcn_cost_batch(profiles), ref, rtol=1e-12, atol=1e-9,
+                                          err_msg=resource.resource_id+": "+obj_fcn.desc)
+
+
+##############################################################################
+def window_lookup(obj_fcn, schedule_timestamps, sim_offset=timedelta(0)):
+    """
+    reference - the original lookup_data, which scans the whole index for the closest point
+    """
+    start_ind = numpy.argmin(numpy.abs(obj_fcn.obj_fcn_data.index - (schedule_timestamps[0] + sim_offset)))
+    if obj_fcn.obj_fcn_data.index[start_ind] > schedule_timestamps[0]:
+        start_ind -= 1
+    cur_data = obj_fcn.obj_fcn_data.iloc[start_ind:start_ind + SSA_PTS_PER_SCHEDULE]
+    return numpy.array(cur_data.transpose())
+
+
+##############################################################################
+def test_lookup_data():
+    obj_fcn = ObjectiveFunction(desc="lookup", init_params={})
+    numpy.random.seed(1)
+    index = pandas.date_range(datetime(2018, 1, 1), periods=24*60, freq="H", tz=pytz.UTC)
+    obj_fcn.obj_fcn_data = pandas.DataFrame({"price": numpy.random.random(len(index)),
+                                             "tier": numpy.random.random(len(index))}, index=index)
+
+    for ii in range(300):
+        # start times before, inside and after the data, on and between data points (ties at half past)
+        t0 = index[0].to_pydatetime() + timedelta(minutes=30*numpy.random.randint(-48, 2*len(index)+48))
+        if ii % 3 == 0:
+            t0 += timedelta(minutes=numpy.random.randint(60))
+        sim_offset = timedelta(minutes=int(numpy.random.choice([0, 30, -30, 90, -1440, 60*24*30])))
+        schedule_timestamps = [t0 + timedelta(hours=h) for h in range(SSA_PTS_PER_SCHEDULE)]
+
+        ref = window_lookup(obj_fcn, schedule_timestamps, sim_offset)
+        for jj in range(2):  # uncached, then cached
+            cur_data = obj_fcn.lookup_data(schedule_timestamps, sim_offset)
+            assert (cur_data.shape, cur_data.dtype) == (ref.shape, ref.dtype)
+            numpy.testing.assert_array_equal(cur_data, ref)
+
+    # replacing the data invalidates cached windows
+    obj_fcn.obj_fcn_data = obj_fcn.obj_fcn_data * 2.0
+    numpy.testing.assert_array_equal(obj_fcn.lookup_data(schedule_timestamps, sim_offset),
+                                     window_lookup(obj_fcn, schedule_timestamps, sim_offset))
+
+
+##############################################################################
+def battery_loss(obj_fcn, demand):
+    """
+    reference - charges p * loss_rates[k] at each step with charge power p > 0, where k is the highest tier with
+    thresholds[k] <= p
+    """
+    cost = 0.0
+    for p in demand:
+        rates = [rate for (threshold, rate) in sorted(zip(obj_fcn.init_params["thresholds"],
+                                                          obj_fcn.init_params["loss_rates"]))
+                 if threshold <= p]
+        if (p > 0.0) and (len(rates) > 0):
+            cost += p * rates[-1]
+    return cost
+
+
+##############################################################################
+def tiered_energy(obj_fcn, demand):
+    """
+    reference - each tier k adds rates[k] * max(demand - thresholds[k], 0) at each step
+    """
+    return sum([rate * max(d - threshold, 0.0)
+                for d in demand
+                for (threshold, rate) in zip(obj_fcn.init_params["thresholds"], obj_fcn.init_params["rates"])])
+
+
+##############################################################################
+@pytest.mark.parametrize("obj_fcn_class, reference", [(BatteryLossModelObjectiveFunction, battery_loss),
+                                                      (TieredEnergyObjectiveFunction, tiered_energy)])
+def test_tiered_cost(obj_fcn_class, reference):
+    obj_fcn = obj_fcn_class(desc="Tiered")
+    numpy.random.seed(1)
+    # random profiles, plus steps exactly at each threshold, at zero, and beyond the last tier
+    profiles = [numpy.random.uniform(-400.0, 400.0, 24) for ii in range(5)]
+    profiles.append(numpy.array(list(obj_fcn.init_params["thresholds"]) + [0.0, -50.0, 1000.0]))
+
+    for demand in profiles:
+        cost = reference(obj_fcn, demand)
+        assert obj_fcn.obj_fcn_cost({"DemandForecast_kW": demand}) == pytest.approx(cost)
+        assert obj_fcn.compiled_cost(demand, None) == pytest.approx(cost)
+        for ind in range(len(demand)):
+            new_demand = demand.copy()
+            new_demand[ind] = numpy.random.uniform(-400.0, 400.0)
+            assert obj_fcn.delta_cost({"DemandForecast_kW": demand}, ind, demand[ind], new_demand[ind]) == \
+                   pytest.approx(reference(obj_fcn, new_demand) - cost)
+
+
+##############################################################################
+def test_tiered_tariff_cfg():
+    obj_fcn = TieredEnergyObjectiveFunction(desc="Tiered", init_params={"thresholds": [0.0, 100.0],
+                                                                       "rates": [1.0, 2.0],
+                                                                       "tariff_key": "system_tariff"})
+    assert obj_fcn.get_obj_fcn_data() == {"thresholds": [0.0, 100.0], "rates": [1.0, 2.0]}
+
+    # tariff identified by tariff_key, passed directly or as resolved by SundialResource.cfg_cost
+    obj_fcn.obj_fcn_cfg(system_tariff={"rates": [2.0, 4.0]}, tariffs=None)
+    assert obj_fcn.get_obj_fcn_data() == {"thresholds": [0.0, 100.0], "rates": [2.0, 4.0]}
+    obj_fcn.obj_fcn_cfg(tariffs={"thresholds": [0.0, 50.0]})
+    assert obj_fcn.get_obj_fcn_data() == {"thresholds": [0.0, 50.0], "rates": [2.0, 4.0]}
+    obj_fcn.obj_fcn_cfg(tariffs=None)
+    assert obj_fcn.obj_fcn_cost({"DemandForecast_kW": numpy.array([100.0])}) == pytest.approx(400.0)
+
+    # mismatched tiers are rejected, and the current tariff is kept
+    obj_fcn.obj_fcn_cfg(tariffs={"rates": [1.0, 2.0, 3.0]})
+    assert obj_fcn.get_obj_fcn_data() == {"thresholds": [0.0, 50.0], "rates": [2.0, 4.0]}
+    with pytest.raises(ValueError):
+        BatteryLossModelObjectiveFunction(desc="LossModel", thresholds=[0.0, 20.0], loss_rates=[0.1])
+
+
+##############################################################################
+def test_data_cache(tmpdir):
+    index = pandas.date_range(datetime(2018, 1, 1), periods=48, freq="H", tz=pytz.UTC)
+    df = pandas.DataFrame({u"price": numpy.arange(48.0), u"tier": numpy.ones(48)}, index=index,
+                          columns=[u"price", u"tier"])
+    cache_fname = str(tmpdir.join("data.xlsx.cache.npz"))
+
+    save_data_cache(cache_fname, "key", df)
+    pandas.testing.assert_frame_equal(load_data_cache(cache_fname, "key"), df)
+
+    # rejected - generated with a different key, missing, truncated or not a cache file
+    assert load_data_cache(cache_fname, "other key") is None
+    assert load_data_cache(str(tmpdir.join("missing.cache.npz")), "key") is None
+    data = open(cache_fname, "rb").read()
+    for contents in [data[:len(data)//2], b"not a cache"]:
+        with open(cache_fname, "wb") as f:
+            f.write(contents)
+        assert load_data_cache(cache_fname, "key") is None
@@ -0,0 +1,95 @@
+"Tests the functionality of OptimizerWorker.py components"
+import os
+import json
+import time
+from datetime import datetime
+import numpy
+
+from DP_Optimization import DPOptimizer
+from SSA_Optimization import SimulatedAnnealer
+from SunDialResource import SundialSystemResource
+from OptimizerWorker import OptimizerWorker, get_tree_state, set_tree_state, run_optimizer_pass
+from gs_identities import *
+
+CFG_FILE      = os.path.join(os.path.dirname(os.path.abspath(__file__)),
+                             "../cfg/SystemCfg/SundialSystemConfiguration2.json")
+GS_START_TIME = datetime(2018, 7, 1, 0, 0, 0).strftime(TIME_FORMAT)  # see conftest.example_system
+TARIFFS       = {"threshold": 300.0}
+
+
+##############################################################################
+def wait_for(worker, timeout=60.0):
+    t0 = time.time()
+    while worker.poll() == False:
+        assert time.time() - t0 < timeout, "optimizer worker did not finish"
+        time.sleep(0.05)
+
+
+##############################################################################
+def assert_schedules_equal(schedules, sundial_resources):
+    assert sorted(schedules.keys()) == sorted(sundial_resources.resource_index.keys())
+    for resource_id, schedule_vars in schedules.items():
+        ref = sundial_resources.find_resource(resource_id).schedule_vars
+        assert sorted(schedule_vars.keys()) == sorted(ref.keys())
+        for k, v in ref.items():
+            if isinstance(v, dict):
+                assert schedule_vars[k] == v, resource_id+": "+k
+            else:
+                numpy.testing.assert_array_equal(schedule_vars[k], v, err_msg=resource_id+": "+k)
+
+
+##############################################################################
+def dp_optimizer():
+    optimizer = DPOptimizer()
+    optimizer.save_results = False
+    return optimizer
+
+
+##############################################################################
+def test_set_tree_state(example_system):
+    sundial_resources, timestamps = example_system
+    rebuilt = SundialSystemResource(json.load(open(CFG_FILE, "r")), GS_START_TIME)
+    set_tree_state(rebuilt, get_tree_state(sundial_resources))
+
+    for tree in [sundial_resources, rebuilt]:
+        run_optimizer_pass(dp_optimizer(), tree, TARIFFS, timestamps, False)
+    assert_schedules_equal({resource_id: resource.schedule_vars
+                            for resource_id, resource in rebuilt.resource_index.items()}, sundial_resources)
+
+
+##############################################################################
+def test_worker_matches_in_process(example_system):
+    sundial_resources, timestamps = example_system
+    worker = OptimizerWorker(json.load(open(CFG_FILE, "r")), GS_START_TIME, sundial_resources, dp_optimizer(),
+                             TARIFFS, timestamps, False)
+
+    # the snapshot is taken when the worker starts, so the in process pass can run alongside it
+    run_optimizer_pass(dp_optimizer(), sundial_resources, TARIFFS, timestamps, False)
+    wait_for(worker)
+    (schedules, stop_reason, n_iterations_used) = worker.get_result()
+
+    assert_schedules_equal(schedules, sundial_resources)
+    assert stop_reason == "dp"
+    assert not os.path.exists(worker.work_dir)
+
+
+##############################################################################
+def test_worker_failure(example_system):
+    sundial_resources, timestamps = example_system
+    worker = OptimizerWorker([], GS_START_TIME, sundial_resources, dp_optimizer(), TARIFFS, timestamps, False)
+    wait_for(worker)
+    assert worker.get_result() is None
+    assert not os.path.exists(worker.work_dir)
+
+
+##############################################################################
+def test_worker_terminate(example_system):
+    sundial_resources, timestamps = example_system
+    optimizer = SimulatedAnnealer()
+    optimizer.save_results = False
+    optimizer.nIterations  = 10**8
+    worker = OptimizerWorker(json.load(open(CFG_FILE, "r")), GS_START_TIME, sundial_resources, optimizer,
+                             TARIFFS, timestamps, False)
+    worker.terminate()
+    assert worker.poll() == True
+    assert not os.path.exists(worker.work_dir)
@@ -0,0 +1,80 @@
+"Tests the functionality of SOEProjection.py components"
+import numpy
+import pytest
+
+from gs_identities import ESS_RESERVE_HIGH, ESS_RESERVE_LOW
+
+N_PROFILES = 50
+
+
+##############################################################################
+def update_soe_loop(ess, pwr_request, start_soes, max_soe, min_soe):
+    """
+    reference - steps through each profile in time order with ESSResource.update_soe
+    :return: 3 x N x T array of (pwr_cmd, energy, delta_energy)
+    """
+    ref = numpy.zeros((3,)+pwr_request.shape)
+    for nn in range(pwr_request.shape[0]):
+        soe = start_soes[nn]
+        for ii in range(pwr_request.shape[1]):
+            soe, ref[0, nn, ii], ref[2, nn, ii] = ess.update_soe(pwr_request[nn, ii], soe, max_soe, min_soe)
+            ref[1, nn, ii] = soe
+    return ref
+
+
+##############################################################################
+@pytest.mark.parametrize("chg_eff, dischg_eff", [(1.0, 1.0), (0.9, 0.85)])
+@pytest.mark.parametrize("start", ["inside band", "at upper limit", "above band", "below band"])
+def test_project_soe_matches_update_soe(example_system, chg_eff, dischg_eff, start):
+    sundial_resources, timestamps = example_system
+    ess = sundial_resources.find_resource_type("ESSCtrlNode")[0]
+    ess.state_vars["ChgEff"]    = chg_eff
+    ess.state_vars["DischgEff"] = dischg_eff
+    max_soe = ess.state_vars["MaxSOE_kWh"]*ESS_RESERVE_HIGH
+    min_soe = ess.state_vars["MinSOE_kWh"]*ESS_RESERVE_LOW
+    start_soe = {"inside band": 0.5*(min_soe+max_soe),
+                 "at upper limit": max_soe,
+                 "above band": max_soe + 0.1*(max_soe-min_soe),
+                 "below band": min_soe - 0.1*(max_soe-min_soe)}[start]
+
+    # requests span past the power limits, with some points exactly 0
+    numpy.random.seed(1)
+    pwr_request = numpy.random.uniform(-1.5*ess.state_vars["MaxDischargePwr_kW"],
+                                       1.5*ess.state_vars["MaxChargePwr_kW"],
+                                       (N_PROFILES, len(timestamps)))
+    pwr_request[numpy.random.random(pwr_request.shape) < 0.1] = 0.0
+    start_soes = start_soe + numpy.zeros(N_PROFILES)
+
+    ref    = update_soe_loop(ess, pwr_request, start_soes, max_soe, min_soe)
+    batch  = numpy.array(ess.project_profile(pwr_request, start_soe=start_soes))
+    single = numpy.array([ess.project_profile(pwr_request[nn], start_soe=start_soes[nn])
+                          for nn in range(N_PROFILES)]).transpose(1, 0, 2)
+
+    numpy.testing.assert_allclose(batch, ref, rtol=0.0, atol=1e-9)
+    numpy.testing.assert_allclose(single, ref, rtol=0.0, atol=1e-9)
+
+
+##############################################################################
+@pytest.mark.parametrize("chg_eff, dischg_eff", [(1.0, 1.0), (0.9, 0.85)])
+def test_project_soe_clamps_at_both_limits(example_system, chg_eff, dischg_eff):
+    sundial_resources, timestamps = example_system
+    ess = sundial_resources.find_resource_type("ESSCtrlNode")[0]
+    ess.state_vars["ChgEff"]    = chg_eff
+    ess.state_vars["DischgEff"] = dischg_eff
+    max_soe = ess.state_vars["MaxSOE_kWh"]*ESS_RESERVE_HIGH
+    min_soe = ess.state_vars["MinSOE_kWh"]*ESS_RESERVE_LOW
+
+    # charge at full power for the first half of the horizon, then discharge at full power
+    n_pts = len(timestamps)
+    pwr_request = numpy.concatenate((numpy.ones(n_pts//2)*ess.state_vars["MaxChargePwr_kW"],
+                                     -1*numpy.ones(n_pts-n_pts//2)*ess.state_vars["MaxDischargePwr_kW"]))
+    start_soe = 0.5*(min_soe+max_soe)
+    pwr_cmd, energy, delta_energy = ess.project_profile(pwr_request, start_soe=start_soe)
+    ref = update_soe_loop(ess, pwr_request[numpy.newaxis], [start_soe], max_soe, min_soe)[:, 0]
+
+    assert energy.max() == pytest.approx(max_soe)
+    assert energy.min() == pytest.approx(min_soe)
+    assert numpy.all(energy <= max_soe + 1e-9) and numpy.all(energy >= min_soe - 1e-9)
+    assert numpy.any(pwr_cmd[:n_pts//2] < pwr_request[:n_pts//2])   # charge limited at max_soe
+    assert numpy.any(pwr_cmd[n_pts//2:] > pwr_request[n_pts//2:])   # discharge limited at min_soe
+    numpy.testing.assert_allclose(numpy.array([pwr_cmd, energy, delta_energy]), ref, rtol=0.0, atol=1e-9)
@@ -0,0 +1,105 @@
+"Tests the functionality of SSA_Optimization.py components"
+from random import random, seed
+import numpy
+import pytest
+
+from MoveKernels import MOVE_KERNELS
+from SSA_Optimization import SimulatedAnnealer
+from SunDialResource import SundialResourceProfile, FlatProfileTree
+
+PROFILE_KEYS = ["DemandForecast_kW", "EnergyAvailableForecast_kWh", "DeltaEnergy_kWh"]
+
+
+##############################################################################
+def assert_tree_consistent(optimizer, soln, sundial_resources, timestamps):
+    """
+    checks that every non-terminal node of soln is the sum of its children, and that soln's costs match a tree
+    rebuilt from soln's terminal nodes
+    """
+    ref = SundialResourceProfile(sundial_resources, timestamps)
+    ref.block[:] = soln.block
+    ref.update_sundial_resource()
+    ref.calc_cost()
+    for (node, ref_node) in zip(optimizer.get_resource_list(soln), optimizer.get_resource_list(ref)):
+        for k in PROFILE_KEYS:
+            numpy.testing.assert_allclose(node.state_vars[k], ref_node.state_vars[k], atol=1e-9,
+                                          err_msg=node.sundial_resources.resource_id+": "+k)
+    assert soln.total_cost == pytest.approx(ref.total_cost)
+
+
+##############################################################################
+def test_copy_batch_profile(example_system):
+    sundial_resources, timestamps = example_system
+    optimizer = SimulatedAnnealer()
+    soln = SundialResourceProfile(sundial_resources, timestamps)
+    ess_profile = optimizer.get_resource(soln, "ESSCtrlNode")[0]
+    ess = ess_profile.sundial_resources
+
+    numpy.random.seed(1)
+    pwr, energy, delta_energy = ess.project_profile(numpy.random.uniform(-400.0, 400.0, len(timestamps)))
+    optimizer.copy_batch_profile({"DemandForecast_kW": pwr,
+                                  "EnergyAvailableForecast_kWh": energy,
+                                  "DeltaEnergy_kWh": delta_energy}, soln, ess_profile)
+
+    numpy.testing.assert_array_equal(ess_profile.state_vars["DemandForecast_kW"], pwr)
+    assert_tree_consistent(optimizer, soln, sundial_resources, timestamps)
+
+
+##############################################################################
+@pytest.mark.parametrize("engine", ["population", "tempering"])
+def test_batch_engine_requires_single_ess(example_system, monkeypatch, engine):
+    sundial_resources, timestamps = example_system
+    optimizer = SimulatedAnnealer()
+    optimizer.engine = engine
+    optimizer.save_results = False
+    calls = []
+    monkeypatch.setattr(optimizer, "run_ssa_optimization", lambda *args: calls.append("serial"))
+    monkeypatch.setattr(optimizer, "run_"+engine+"_ssa_optimization", lambda *args: calls.append(engine))
+
+    optimizer.run_optimization(sundial_resources, timestamps)
+    ess = sundial_resources.find_resource_type("ESSCtrlNode")[0]
+    monkeypatch.setattr(sundial_resources, "find_resource_type",
+                        lambda resource_type: [ess, ess] if resource_type == "ESSCtrlNode" else [])
+    optimizer.run_optimization(sundial_resources, timestamps)
+
+    assert calls == [engine, "serial"]
+
+
+##############################################################################
+@pytest.mark.parametrize("resource_type", ["ESSCtrlNode", "PVCtrlNode"])
+def test_delta_cost_matches_full_cost(example_system, resource_type):
+    sundial_resources, timestamps = example_system
+    optimizer = SimulatedAnnealer()
+    current_soln    = SundialResourceProfile(sundial_resources, timestamps)
+    least_cost_soln = SundialResourceProfile(sundial_resources, timestamps)
+    least_cost_soln.calc_cost()
+    flat_soln       = FlatProfileTree(current_soln, [resource_type])
+    flat_least_cost = FlatProfileTree(least_cost_soln, [resource_type])
+    ctrl_node       = flat_soln.ctrl_nodes[0]
+    path            = optimizer.get_resource_path(current_soln, ctrl_node)
+    least_cost_path = optimizer.get_resource_path(least_cost_soln, flat_least_cost.ctrl_nodes[0])
+    kernel          = MOVE_KERNELS[resource_type]
+    optimizer.init_delta_cost(flat_least_cost)
+
+    seed(1)
+    for ii in range(200):
+        optimizer.copy_profile(least_cost_soln, current_soln)
+        ind, old_val = kernel.perturb(ctrl_node, 0.5)
+        if old_val is None:  # not a single point move - full update, as in run_ssa_optimization
+            moves = None
+            flat_soln.update()
+            flat_soln.calc_cost()
+        else:
+            delta, moves = optimizer.calc_delta_cost(ctrl_node, path, least_cost_path, ind,
+                                                     ctrl_node.state_vars["DemandForecast_kW"][ind] - old_val)
+            current_soln.total_cost = least_cost_soln.total_cost + delta
+        assert_tree_consistent(optimizer, current_soln, sundial_resources, timestamps)
+
+        if random() < 0.5:  # accept - running statistics must stay consistent with the new least cost profile
+            if moves is None:
+                optimizer.copy_profile(current_soln, least_cost_soln)
+                optimizer.init_delta_cost(flat_least_cost)
+            else:
+                for (obj_fcn, profile, old_val, new_val) in moves:
+                    obj_fcn.update_delta_cost(profile, ind, old_val, new_val)
+                optimizer.copy_profile(current_soln, least_cost_soln)
@@ -0,0 +1,93 @@
+"Tests the functionality of SunDialResource.py components"
+import numpy
+import pytest
+
+from SSA_Optimization import SimulatedAnnealer
+from SunDialResource import SundialResourceProfile
+
+PROFILE_KEYS = ["DemandForecast_kW", "EnergyAvailableForecast_kWh", "DeltaEnergy_kWh"]
+
+
+##############################################################################
+@pytest.mark.parametrize("incremental", [False, True])
+def test_check_constraints_batch(example_system, incremental):
+    sundial_resources, timestamps = example_system
+    ess = sundial_resources.find_resource_type("ESSCtrlNode")[0]
+    n_profiles = 200
+    n_pts = len(timestamps)
+
+    # feasible starting profiles, each perturbed at a single point - large enough to violate either SOE limit
+    numpy.random.seed(1)
+    pwr, energy, delta_energy = ess.project_profile(numpy.random.uniform(-500.0, 500.0, (n_profiles, n_pts)))
+    ind = numpy.random.randint(0, n_pts, n_profiles)
+    pwr[numpy.arange(n_profiles), ind] = numpy.random.uniform(-1.0, 1.0, n_profiles) * \
+                                         ess.state_vars["MaxChargePwr_kW"]
+    batch = {"DemandForecast_kW": pwr.copy(),
+             "EnergyAvailableForecast_kWh": energy.copy(),
+             "DeltaEnergy_kWh": delta_energy.copy()}
+    ess.check_constraints_batch(batch, ind)
+
+    for nn in range(n_profiles):
+        profile = {"DemandForecast_kW": pwr[nn].copy(),
+                   "EnergyAvailableForecast_kWh": energy[nn].copy(),
+                   "DeltaEnergy_kWh": delta_energy[nn].copy()}
+        profile = ess.check_constraints2(profile, ind[nn], incremental=incremental)
+        for k in PROFILE_KEYS:
+            numpy.testing.assert_allclose(batch[k][nn], profile[k], rtol=0.0, atol=1e-9, err_msg=k)
+
+
+##############################################################################
+def randomize_tree(soln):
+    """
+    writes random values into every node's profile and costs, through the node's own views
+    """
+    for node in SimulatedAnnealer().get_resource_list(soln):
+        for k in PROFILE_KEYS:
+            node.state_vars[k] = numpy.random.uniform(-100.0, 100.0, len(node.state_vars[k]))
+        node.cost = numpy.random.random()
+        node.total_cost = numpy.random.random()
+        node.energy_synced = numpy.random.random() < 0.5
+
+
+##############################################################################
+def assert_nodes_equal(source, target, ind=0):
+    for (source_node, target_node) in zip(SimulatedAnnealer().get_resource_list(source),
+                                          SimulatedAnnealer().get_resource_list(target)):
+        for (ii, k) in enumerate(PROFILE_KEYS):
+            numpy.testing.assert_array_equal(target_node.state_vars[k][ind:], source_node.state_vars[k][ind:])
+            # state_vars must remain views into the target tree's block
+            assert numpy.shares_memory(target_node.state_vars[k], target.block[target_node.block_ind, ii])
+        assert (target_node.cost, target_node.total_cost, target_node.energy_synced) == \
+               (source_node.cost, source_node.total_cost, source_node.energy_synced)
+
+
+##############################################################################
+def test_copy_profile_round_trip(example_system):
+    sundial_resources, timestamps = example_system
+    source = SundialResourceProfile(sundial_resources, timestamps)
+    target = SundialResourceProfile(sundial_resources, timestamps)
+    numpy.random.seed(1)
+
+    # whole tree, in one block copy
+    randomize_tree(source)
+    target.copy_tree(source)
+    assert_nodes_equal(source, target)
+
+    # suffix copy - values before ind are left alone
+    ind = len(timestamps)//2
+    old_block = target.block.copy()
+    randomize_tree(source)
+    target.copy_tree(source, ind)
+    assert_nodes_equal(source, target, ind)
+    numpy.testing.assert_array_equal(target.block[:, :, :ind], old_block[:, :, :ind])
+
+    # node by node, and back again through get_state / set_state
+    randomize_tree(source)
+    for (source_node, target_node) in zip(SimulatedAnnealer().get_resource_list(source),
+                                          SimulatedAnnealer().get_resource_list(target)):
+        target_node.copy_profile(source_node)
+    assert_nodes_equal(source, target)
+    state = target.get_state()
+    randomize_tree(target)
+    target.set_state(state)
+    assert_nodes_equal(source, target)
@@ -613,6 +613,28 @@ class SiteManagerAgent(Agent):
         # return the attribute data dict
         return device.state_vars  # self.site.datagroup_dict_list[attribute].data_dict
 
+    ##############################################################################
+    @RPC.export
+    def get_all_device_state_vars(self, device_ids, keys=None):
+        """
+        returns state vars for several devices in a single call
+        :param device_ids: list of device ids
+        :param keys: list of state_vars keys to return for each device.  None = return all state vars
+        :return: dictionary of state_vars dictionaries, keyed by device id.  Keys that are not found in a device's
+        state_vars are omitted.  Devices that are not found at this site are omitted.
+        """
+        all_state_vars = {}
+        for device_id in device_ids:
+            device = self.site.find_device(device_id)
+            if device is None:
+                _log.info("FindDevice: device "+str(device_id)+" not found")
+                continue
+            if keys is None:
+                all_state_vars[device_id] = device.state_vars
+            else:
+                all_state_vars[device_id] = {k: device.state_vars[k] for k in keys if k in device.state_vars}
+        return all_state_vars
+
     ##############################################################################
     @RPC.export
     def set_SiteManager_mode(self, new_mode):
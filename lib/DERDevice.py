@@ -255,6 +255,8 @@ class DERDevice():
             self.device_id = self.parent_device.device_id + "-" + device_info["ID"]
             self.device_type = device_info["ResourceType"]
         self.devices = []
+        self.device_index      = {self.device_id: self}  # device_id -> device, for every device in this subtree
+        self.device_type_index = {self.device_type: [self]}  # device_type -> list of devices in this subtree
         self.metered = device_info["Metered"]
 
         _log.info("Initializing "+ self.device_id)
@@ -277,9 +279,9 @@ class DERDevice():
             _log.info(device["ResourceType"] + " " + device["ID"])
 
             try:
-                self.devices.append(eval(device_keys[device["ResourceType"]]))
+                self.add_device(eval(device_keys[device["ResourceType"]]))
             except KeyError:
-                self.devices.append(DERDevice(device, parent_device=self))
+                self.add_device(DERDevice(device, parent_device=self))
 
         self.init_attributes()
 
@@ -389,23 +391,49 @@ class DERDevice():
         self.datagroup_dict_list.update({"DroopCtrlCmd": self.DroopCtrl_cmd})
         self.datagroup_dict_list.update({"FreqSupportCmd": self.FreqSupport_cmd})
 
+    ##############################################################################
+    def add_device(self, device):
+        """
+        Adds a child device, and updates the lookup indices of this device and its ancestors
+        :param device: DERDevice instance
+        :return: None
+        """
+        self.devices.append(device)
+        cur_device = self
+        while cur_device is not None:
+            cur_device.update_device_index()
+            cur_device = cur_device.parent_device
+
+    ##############################################################################
+    def update_device_index(self):
+        """
+        Rebuilds the id and type lookup indices for this device's subtree from its children's indices.  Matches the
+        order of a pre-order traversal of the device tree.
+        :return: None
+        """
+        self.device_index      = {self.device_id: self}
+        self.device_type_index = {self.device_type: [self]}
+        for cur_device in self.devices:
+            for (device_id, device) in cur_device.device_index.items():
+                self.device_index.setdefault(device_id, device)
+            for (device_type, devices) in cur_device.device_type_index.items():
+                self.device_type_index.setdefault(device_type, []).extend(devices)
+
     ##############################################################################
     def find_device(self, device_id):
         """
-        This function traverses the device tree to find the device object matching device_id and returns the object.
+        Returns the device object in this subtree matching device_id (or None if not found).
         """
         #FIXME - this functionality is duplicated elsewhere.  (E.g., in init_device fcns...)  Should reference
         #FIXME - against this method
-        _log.debug("FindDevice: "+self.device_id)
-        if self.device_id == device_id:
-            return self
-        else:
-            for cur_device in self.devices:
-                _log.debug("FindDevice: "+cur_device.device_id)
-                child_device = cur_device.find_device(device_id)
-                if child_device is not None:
-                    return child_device
-            return None
+        return self.device_index.get(device_id)
+
+    ##############################################################################
+    def find_device_type(self, device_type):
+        """
+        Returns all the device objects in this subtree matching device_type, in a flat list
+        """
+        return list(self.device_type_index.get(device_type, []))
 
     ##############################################################################
     class DeviceAttributes():
@@ -432,33 +460,29 @@ class DERDevice():
     ##############################################################################
     def init_data_maps(self, device_id, group_id, int_endpt, ext_endpt, units, topic_index, log_to_db, endpt_units):
         """
-        This function traverses the device tree to find the object matching device_id,
+        This function looks up the object matching device_id in the device tree (see find_device),
         then initializes a data_mapping dictionary entry to be associated with that device
         """
-        if self.device_id == device_id:
-            #FIXME - what happens if a name is duplicated (esp between different devices/topics?)
-            self.datagroup_dict_list[group_id].data_mapping_dict.update({ext_endpt: int_endpt})
-            self.datagroup_dict_list[group_id].map_int_to_ext_endpt.update({int_endpt: ext_endpt})
-            self.datagroup_dict_list[group_id].data_dict.update({int_endpt: None})
-            self.datagroup_dict_list[group_id].units.update({int_endpt: units})
+        device = self.find_device(device_id)
+        if device is None:
+            return None
+        #FIXME - what happens if a name is duplicated (esp between different devices/topics?)
+        device.datagroup_dict_list[group_id].data_mapping_dict.update({ext_endpt: int_endpt})
+        device.datagroup_dict_list[group_id].map_int_to_ext_endpt.update({int_endpt: ext_endpt})
+        device.datagroup_dict_list[group_id].data_dict.update({int_endpt: None})
+        device.datagroup_dict_list[group_id].units.update({int_endpt: units})
 
-            try:
-                self.datagroup_dict_list[group_id].endpt_units.update({ext_endpt: endpt_units[ext_endpt]})
-                _log.info(ext_endpt+": "+ endpt_units[ext_endpt])
-            except KeyError:
-                _log.info("end pt units not found for "+ext_endpt)
-                pass
+        try:
+            device.datagroup_dict_list[group_id].endpt_units.update({ext_endpt: endpt_units[ext_endpt]})
+            _log.info(ext_endpt+": "+ endpt_units[ext_endpt])
+        except KeyError:
+            _log.info("end pt units not found for "+ext_endpt)
+            pass
 
-            self.datagroup_dict_list[group_id].topic_map.update({int_endpt: topic_index})
-            self.datagroup_dict_list[group_id].log_to_db.update({int_endpt: log_to_db})
-            self.datagroup_dict.update({ext_endpt: self.datagroup_dict_list[group_id]})
-            return self
-        else:
-            for cur_device in self.devices:
-                child_device = cur_device.init_data_maps(device_id, group_id, int_endpt, ext_endpt,
-                                                         units, topic_index, log_to_db, endpt_units)
-                if child_device is not None:
-                    return child_device
+        device.datagroup_dict_list[group_id].topic_map.update({int_endpt: topic_index})
+        device.datagroup_dict_list[group_id].log_to_db.update({int_endpt: log_to_db})
+        device.datagroup_dict.update({ext_endpt: device.datagroup_dict_list[group_id]})
+        return device
 
     ##############################################################################
     def display_device_tree(self):
@@ -116,6 +116,15 @@ SSA_SCHEDULE_DURATION = 24 # Duration, in hours, over which SSA generates schedu
 SSA_SCHEDULE_RESOLUTION   = 60 # Time resolution, in minutes, of SSA schedule
 SSA_PTS_PER_SCHEDULE = SSA_SCHEDULE_DURATION * 60/SSA_SCHEDULE_RESOLUTION
 DURATION_1MIN_FORECAST = 5 # hrs
+OPTIMIZER = "SSA" # "SSA" = SimulatedAnnealer; "DP" = DPOptimizer - dynamic programming over a discretized ESS SOE grid (single ESS only)
+SSA_ENGINE = "serial" # "serial" = single SSA Markov chain; "population" = N SSA chains evaluated at once as numpy arrays; "tempering" = parallel tempering (replica exchange) across a ladder of fixed temperatures
+SSA_N_WORKERS = 1 # number of worker processes used to search load shift options in parallel.  1 = search serially in process
+SSA_MOVE_WEIGHTS = {"ESSCtrlNode": 1.0,       # relative probability of perturbing each type of controllable resource in an SSA
+                    "PVCtrlNode": 0.0,        # iteration.  PVCtrlNode = PV curtailment; LoadShiftCtrlNode = switch between
+                    "LoadShiftCtrlNode": 0.0} # load shift options.  0 = resource type is not optimized
+SSA_WARM_START = False # True = seed each optimization pass from the previous schedule, shifted to the new horizon
+SSA_TIME_BUDGET = 0.75*GS_SCHEDULE*EXECUTIVE_CLKTIME # seconds.  Optimization passes launched by the Executive stop early if they run longer than this
+OPTIMIZER_WORKER = True # True = the Executive runs optimization passes in a worker process (see OptimizerWorker), so ESS regulation, status polling, etc continue while the optimizer runs; False = run in process
 
 ALIGN_SCHEDULES = True
 REGULATE_ESS_OUTPUT = True # True = Match system's output in real time to scheduled output using ESS; False = use scheduled ESS value regardless of divergence from forecast